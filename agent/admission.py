@@ -0,0 +1,345 @@
+# agent/admission.py
+# Built-ins
+import asyncio
+import copy
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Third-party / Django
+from django.conf import settings
+
+from companies import telemetry
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+LLM_CALLS = telemetry.Counter(
+    "chat_llm_calls_total",
+    "LLM calls by outcome: called, coalesced (shared another in-flight call), queue_full, queue_timeout.",
+    ("outcome",),
+)
+LLM_QUEUE_SECONDS = telemetry.Histogram(
+    "chat_llm_queue_wait_seconds", "Time LLM calls waited for a concurrency slot."
+)
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+class LLMOverloaded(Exception):
+    """An LLM call was refused: the wait queue is full (``queue_full``) or
+    no slot freed up before the queue deadline (``queue_timeout``)."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"LLM capacity exhausted ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        return type(self), (self.reason, self.retry_after)
+
+def _fresh(error: BaseException) -> BaseException:
+    """A copy of a leader's *error* for one follower to raise.
+
+    Followers must not all raise the same instance: every raise rewrites its
+    traceback, concurrently when they run on different threads.
+    """
+    try:
+        clone = copy.copy(error)
+    except Exception:  # not rebuildable from its args
+        clone = RuntimeError(f"{type(error).__name__}: {error}")
+    clone.__traceback__ = None
+    return clone
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+class _Signal:
+    """One-shot event that threads and coroutines (on any event loop) can wait for.
+
+    Django runs async views on a fresh event loop per request under WSGI, so
+    asyncio primitives bound to one loop can't be shared between requests.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            if loop.is_closed():
+                continue  # that waiter's event loop is gone
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # closed since the check
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._event.wait(timeout)
+
+    async def await_(self, timeout: float = None) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._event.is_set():
+                return True
+            self._futures.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._event.is_set()
+
+class _Flight:
+    """One in-flight LLM call that concurrent identical calls wait for."""
+
+    def __init__(self):
+        self.done = _Signal()
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.done.set()
+
+# ---------------------------------------------------------------------------
+# Gate
+# ---------------------------------------------------------------------------
+
+class LLMGate:
+    """Single-flight coalescing plus admission control for outbound LLM calls.
+
+    Calls with the same key made while one is in flight wait for its result
+    instead of calling the provider again. At most *max_concurrency* calls
+    run at once; the others queue (FIFO) for at most *queue_timeout*
+    seconds, and once *max_waiting* calls are queued new ones are refused
+    straight away. A caller waiting on another's identical call gives up
+    after *queue_timeout* plus *call_timeout* seconds. Refusals raise
+    :class:`LLMOverloaded` with a Retry-After estimate from the recent call
+    duration.
+    """
+
+    def __init__(self, max_concurrency: int, max_waiting: int, queue_timeout: float, coalesce: bool = True,
+                 call_timeout: float = 60):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.coalesce = coalesce
+        self.call_timeout = call_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = deque()  # _Signal per queued call
+        self._flights = {}  # key -> _Flight
+        self._call_seconds = 1.0  # moving average, for Retry-After
+
+    # --- admission -------------------------------------------------------
+    def _retry_after(self) -> int:
+        slots = max(self.max_concurrency, 1)
+        return max(1, math.ceil(self._call_seconds * (len(self._waiting) + 1) / slots))
+
+    def _enter(self):
+        """Take a slot (returns ``None``) or join the queue (returns the signal to wait for)."""
+        with self._lock:
+            if not self.max_concurrency or (self._active < self.max_concurrency and not self._waiting):
+                self._active += 1
+                return None
+            if len(self._waiting) >= self.max_waiting:
+                LLM_CALLS.inc(outcome="queue_full")
+                raise LLMOverloaded("queue_full", self._retry_after())
+            signal = _Signal()
+            self._waiting.append(signal)
+            return signal
+
+    def _give_up(self, signal: _Signal):
+        """Leave the queue after the deadline, unless a slot was handed over meanwhile."""
+        with self._lock:
+            if signal not in self._waiting:
+                return  # granted just in time
+            self._waiting.remove(signal)
+            retry_after = self._retry_after()
+        LLM_CALLS.inc(outcome="queue_timeout")
+        raise LLMOverloaded("queue_timeout", retry_after)
+
+    def _leave(self, seconds: float):
+        with self._lock:
+            self._call_seconds = 0.8 * self._call_seconds + 0.2 * seconds
+            if self._waiting:
+                signal = self._waiting.popleft()  # the slot passes straight to the next caller
+            else:
+                self._active -= 1
+                signal = None
+        if signal is not None:
+            signal.set()
+
+    def _acquire(self):
+        start = time.perf_counter()
+        signal = self._enter()
+        if signal is not None and not signal.wait(self.queue_timeout):
+            self._give_up(signal)
+        LLM_QUEUE_SECONDS.observe(time.perf_counter() - start)
+
+    async def _aacquire(self):
+        start = time.perf_counter()
+        signal = self._enter()
+        if signal is not None:
+            try:
+                granted = await signal.await_(self.queue_timeout)
+            except asyncio.CancelledError:
+                self._cancel_wait(signal)
+                raise
+            if not granted:
+                self._give_up(signal)
+        LLM_QUEUE_SECONDS.observe(time.perf_counter() - start)
+
+    def _cancel_wait(self, signal: _Signal):
+        """A queued caller went away: leave the queue, or pass on a slot already handed to it."""
+        with self._lock:
+            if signal in self._waiting:
+                self._waiting.remove(signal)
+                return
+        self._leave(self._call_seconds)
+
+    # --- single flight ---------------------------------------------------
+    def _join(self, key):
+        """Return ``(flight, leader)``: the in-flight call for *key*, and whether we must make it."""
+        if not self.coalesce or key is None:
+            return _Flight(), True
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _follow(self, flight: _Flight, arrived: bool):
+        """Result of a finished *flight* for a follower (raising its error), or 503 if it never landed."""
+        if not arrived:
+            with self._lock:
+                retry_after = self._retry_after()
+            LLM_CALLS.inc(outcome="queue_timeout")
+            raise LLMOverloaded("queue_timeout", retry_after)
+        LLM_CALLS.inc(outcome="coalesced")
+        if flight.error is not None:
+            raise _fresh(flight.error) from flight.error
+        return flight.result, True
+
+    def _land(self, key, flight: _Flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(result, error)
+
+    def call(self, key, func):
+        """Return ``(result, shared)`` for ``func()``; *shared* is true when
+        the result came from another caller's identical in-flight call."""
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            arrived = flight.done.wait(self.queue_timeout + self.call_timeout)
+            if not isinstance(flight.error, asyncio.CancelledError):
+                return self._follow(flight, arrived)
+            # The leader was cancelled: try again (possibly as the leader)
+        try:
+            self._acquire()
+        except BaseException as exc:
+            self._land(key, flight, error=exc)
+            raise
+        start = time.perf_counter()
+        try:
+            result = func()
+        except BaseException as exc:
+            self._land(key, flight, error=exc)
+            raise
+        finally:
+            self._leave(time.perf_counter() - start)
+        LLM_CALLS.inc(outcome="called")
+        self._land(key, flight, result=result)
+        return result, False
+
+    async def acall(self, key, afunc):
+        """Async version of :meth:`call`; *afunc* returns an awaitable."""
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            arrived = await flight.done.await_(self.queue_timeout + self.call_timeout)
+            if not isinstance(flight.error, asyncio.CancelledError):
+                return self._follow(flight, arrived)
+        try:
+            await self._aacquire()
+        except BaseException as exc:
+            self._land(key, flight, error=exc)
+            raise
+        start = time.perf_counter()
+        try:
+            result = await afunc()
+        except BaseException as exc:
+            self._land(key, flight, error=exc)
+            raise
+        finally:
+            self._leave(time.perf_counter() - start)
+        LLM_CALLS.inc(outcome="called")
+        self._land(key, flight, result=result)
+        return result, False
+
+    @contextmanager
+    def slot(self):
+        """Hold a concurrency slot for the block (streamed calls, which are not coalesced)."""
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._leave(time.perf_counter() - start)
+        LLM_CALLS.inc(outcome="called")
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Async version of :meth:`slot`."""
+        await self._aacquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._leave(time.perf_counter() - start)
+        LLM_CALLS.inc(outcome="called")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "in_flight_keys": len(self._flights),
+                "avg_call_seconds": round(self._call_seconds, 3),
+            }
+
+def _gate_metrics() -> list:
+    stats = llm_gate.stats()
+    return [
+        "# HELP chat_llm_calls_active LLM calls currently holding a concurrency slot.",
+        "# TYPE chat_llm_calls_active gauge",
+        f"chat_llm_calls_active {stats['active']}",
+        "# HELP chat_llm_calls_waiting LLM calls queued for a concurrency slot.",
+        "# TYPE chat_llm_calls_waiting gauge",
+        f"chat_llm_calls_waiting {stats['waiting']}",
+    ]
+
+# Singleton shared by every model from agent.llm_factory.make_llm
+llm_gate = LLMGate(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_waiting=settings.LLM_QUEUE_MAX,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    coalesce=settings.LLM_COALESCE,
+    call_timeout=settings.LLM_HTTP_TIMEOUT,
+)
+telemetry.register_collector(_gate_metrics)
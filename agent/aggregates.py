@@ -0,0 +1,269 @@
+# agent/aggregates.py
+# Built-ins
+import re
+
+# Third-party / Django
+from django.core.cache import cache
+
+from companies.metrics import (
+    available_metrics, filter_by_metric, metric_units, parse_metric_value, top_companies,
+)
+from companies.models import Company
+from companies.search import sector_facets
+from companies.signals import company_data_version
+
+# ---------------------------------------------------------------------------
+# Vocabulary
+# ---------------------------------------------------------------------------
+
+MAX_LISTED = 50  # names listed before "... and N more"
+
+_FILLER = {
+    "a", "all", "any", "are", "available", "currently", "database", "do", "exist",
+    "have", "in", "is", "of", "our", "please", "records", "stored", "the", "there",
+    "total", "we", "you", "sector", "industry", "list", "me", "covered", "cover",
+}
+_METRIC_ALIASES = {
+    "employer": "employees", "employers": "employees", "staff": "employees",
+    "headcount": "employees", "workforce": "employees", "employee": "employees",
+    "sales": "revenue", "turnover": "revenue", "revenues": "revenue",
+}
+_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥"}
+
+_LIST = re.compile(
+    r"^(?:please\s+)?(?:(?:list|show|name|give)(?:\s+me)?(?:\s+(?:all|the))*\s+companies"
+    r"|(?:what|which)\s+companies\s+(?:are\s+there|are|do\s+(?:we|you)\s+have|exist))\b(?P<rest>.*)$"
+)
+_COUNT = re.compile(
+    r"^(?:how\s+many|(?:what\s+is\s+)?the\s+number\s+of|count(?:\s+the)?)\s+companies\b(?P<rest>.*)$"
+)
+_SECTORS = re.compile(
+    r"^(?:(?:which|what|list|show)(?:\s+(?:all|the))*\s+(?:sectors|industries)"
+    r"|(?:companies|company\s+count)\s+(?:per|by)\s+sector|sector\s+breakdown)\b(?P<rest>.*)$"
+)
+# Optional lead-in of a metric question: "list the", "which", "how many", ...
+_ASK = (
+    r"(?:please\s+)?(?:(?:list|show|name|give|find)(?:\s+me)?(?:\s+(?:all|the))*\s+"
+    r"|(?:what|which)(?:\s+(?:are|is))?(?:\s+the)?\s+|how\s+many\s+)?"
+)
+_EXTREME = (
+    r"(?:(?P<desc>top|largest|biggest|highest|most)|(?P<asc>smallest|lowest|fewest|least))"
+    r"(?:\s+(?P<n>\d+))?"
+)
+_OP = r"(?P<op>over|above|more\s+than|greater\s+than|at\s+least|under|below|less\s+than|at\s+most)"
+_AMOUNT = r"(?P<value>[$€£¥]?\s*[\d.,]+\s*(?:thousand|million|billion|trillion|bn|mn|[kmbt])?\b\s*[$€£¥]?)"
+_HAVING = r"(?:with|have|has|having|that\s+(?:have|has)|reporting)"
+# Each shape is the whole question; <mid> and <rest> may only hold a sector and filler words
+_METRIC_SHAPES = [
+    # "top 5 companies by revenue", "lowest 3 tech companies by employees"
+    ("top", re.compile(
+        rf"{_ASK}(?:the\s+)?{_EXTREME}\s+(?P<mid>(?:[a-z]+\s+)*?)compan(?:y|ies)\s+"
+        rf"(?:by|for|on|in\s+terms\s+of)\s+(?P<metric>[a-z_]+)(?P<rest>.*)"
+    )),
+    # "largest employers in manufacturing"
+    ("top", re.compile(rf"{_ASK}(?:the\s+)?{_EXTREME}\s+(?P<mid>)(?P<metric>employers)(?P<rest>.*)")),
+    # "which company has the most employees"
+    ("top", re.compile(
+        rf"{_ASK}(?P<mid>(?:[a-z]+\s+)*?)compan(?:y|ies)\s+{_HAVING}\s+the\s+{_EXTREME}\s+"
+        rf"(?P<metric>[a-z_]+)(?P<rest>.*)"
+    )),
+    # "companies with revenue over $1B"
+    ("threshold", re.compile(
+        rf"{_ASK}(?P<mid>(?:[a-z]+\s+)*?)compan(?:y|ies)\s+{_HAVING}\s+(?:a\s+|an\s+)?"
+        rf"(?P<metric>[a-z_]+)\s+(?:of\s+)?{_OP}\s+{_AMOUNT}(?P<rest>.*)"
+    )),
+    # "companies with more than 100 employees"
+    ("threshold", re.compile(
+        rf"{_ASK}(?P<mid>(?:[a-z]+\s+)*?)compan(?:y|ies)\s+{_HAVING}\s+{_OP}\s+{_AMOUNT}\s*"
+        rf"(?:in\s+)?(?P<metric>[a-z_]+)(?P<rest>.*)"
+    )),
+]
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _normalize(question: str) -> str:
+    # Keep "1,000" and "1.5B" intact; drop sentence punctuation
+    return " ".join(re.sub(r"[?!]|[.,](?!\d)", " ", (question or "").lower()).split())
+
+def _known_metrics() -> set:
+    """Metric names in the database, cached until the Company data changes."""
+    key = f"agent:metrics:v{company_data_version()}"
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = {row["metric"] for row in available_metrics()}
+        cache.set(key, metrics, 60 * 60)
+    return metrics
+
+def _find_sector(text: str):
+    """The known sector mentioned in *text* (longest match), else ``None``."""
+    best = None
+    for facet in sector_facets():
+        sector = facet["sector"]
+        if sector and re.search(rf"\b{re.escape(sector.lower())}\b", text):
+            if best is None or len(sector) > len(best):
+                best = sector
+    return best
+
+def _resolve_metric(word: str):
+    """The stored metric *word* names (directly, as an alias or a plural), else ``None``."""
+    metrics = _known_metrics()
+    for candidate in (word, _METRIC_ALIASES.get(word), word.rstrip("s")):
+        if candidate and candidate in metrics:
+            return candidate
+    return None
+
+def _only_filler(rest: str, sector) -> bool:
+    """True if *rest* adds nothing beyond an optional sector and filler words."""
+    if sector:
+        rest = re.sub(rf"\b{re.escape(sector.lower())}\b", " ", rest)
+    return all(word in _FILLER for word in rest.split())
+
+def _format_value(value: float, unit: str) -> str:
+    if unit == "%":
+        return f"{value:g}%"
+    symbol = _SYMBOLS.get(unit, "")
+    for size, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M")):
+        if abs(value) >= size and symbol:
+            return f"{symbol}{value / size:.3g}{suffix}"
+    text = f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+    return f"{symbol}{text}" if symbol else text
+
+def _compan(count: int) -> str:
+    return f"{count} compan{'y' if count == 1 else 'ies'}"
+
+def _other_units(label: str, units: dict, compared: str) -> str:
+    """Note on the companies left out for reporting *label* in other units than *compared*."""
+    others = [u for u in units if u and u != compared]
+    if not others:
+        return ""
+    count = sum(units[u] for u in others)
+    return (
+        f"\n(Only {label} in {compared} or without a unit is compared; "
+        f"{_compan(count)} report it in {', '.join(others)}.)"
+    )
+
+def _names(queryset) -> str:
+    names = list(queryset.order_by("name").values_list("name", flat=True)[:MAX_LISTED + 1])
+    shown = "\n".join(f"- {name}" for name in names[:MAX_LISTED])
+    if len(names) > MAX_LISTED:
+        shown += f"\n… and {queryset.count() - MAX_LISTED} more"
+    return shown
+
+# ---------------------------------------------------------------------------
+# Answers
+# ---------------------------------------------------------------------------
+
+def _metric_question(text: str, sector):
+    """``(kind, match, metric)`` when *text* is a whole top-N or threshold question, else ``None``."""
+    for kind, pattern in _METRIC_SHAPES:
+        match = pattern.fullmatch(text)
+        if not match or not _only_filler(f"{match.group('mid')} {match.group('rest')}", sector):
+            continue
+        metric = _resolve_metric(match.group("metric"))
+        if metric:
+            return kind, match, metric
+    return None
+
+def _answer_metric(text: str, sector):
+    question = _metric_question(text, sector)
+    if not question:
+        return None
+    kind, match, metric = question
+    label = metric.replace("_", " ")
+    where = f" in {sector}" if sector else ""
+    # Currencies are never converted: compare within one, and say so
+    units = metric_units(metric, sector)
+    named = [u for u in units if u]
+
+    if kind == "threshold":
+        parsed = parse_metric_value(match.group("value").replace(" ", ""))
+        if parsed is None:
+            return None
+        value, unit = parsed
+        op, shown = match.group("op"), _format_value(value, unit)
+        lower = op in ("over", "above", "more than", "greater than", "at least")
+        if unit:
+            compare, note = [unit, ""], _other_units(label, units, unit)
+        else:
+            compare, note = None, ""
+            if len(named) > 1:
+                note = (
+                    f"\n(Note: {label} is reported in several currencies ({', '.join(named)}) "
+                    f"and compared as reported, without conversion.)"
+                )
+        queryset = Company.objects.all()
+        if sector:
+            queryset = queryset.filter(sector=sector)
+        queryset = filter_by_metric(
+            queryset, metric, min_value=value if lower else None, max_value=None if lower else value,
+            units=compare,
+        )
+        total = queryset.count()
+        if not total:
+            return f"No companies{where} have {label} {op} {shown}.{note}"
+        return (
+            f"{_compan(total)}{where} {'has' if total == 1 else 'have'} "
+            f"{label} {op} {shown}:\n{_names(queryset)}{note}"
+        )
+
+    n = int(match.group("n")) if match.group("n") else 5
+    ascending = bool(match.group("asc"))
+    compare, note = None, ""
+    if len(named) > 1:
+        # Rank within the currency most companies use
+        compare, note = [named[0], ""], _other_units(label, units, named[0])
+    rows = top_companies(metric, n=min(n, MAX_LISTED), sector=sector, ascending=ascending, units=compare)
+    if not rows:
+        return f"No companies{where} report {label}."
+    order = "Lowest" if ascending else "Top"
+    lines = "\n".join(
+        f"{i}. {company.name} — {_format_value(value, unit)}"
+        for i, (company, value, unit) in enumerate(rows, start=1)
+    )
+    return f"{order} {len(rows)} companies{where} by {label}:\n{lines}{note}"
+
+def answer_aggregate(question: str):
+    """Answer list/count/group-by/top-N questions straight from the database.
+
+    Returns the templated answer, or ``None`` when the question is not one
+    of these shapes (the caller then falls back to the LLM).
+    """
+    text = _normalize(question)
+    if not text:
+        return None
+    sector = _find_sector(text)
+
+    answer = _answer_metric(text, sector)
+    if answer:
+        return answer
+
+    match = _SECTORS.match(text)
+    if match and _only_filler(match.group("rest"), None):
+        facets = sector_facets()
+        if not facets:
+            return "No companies are currently in the database."
+        lines = "\n".join(f"- {f['sector'] or 'Unknown'}: {f['count']}" for f in facets)
+        return f"We cover {len(facets)} sectors:\n{lines}"
+
+    match = _COUNT.match(text)
+    if match and _only_filler(match.group("rest"), sector):
+        if sector:
+            count = Company.objects.filter(sector=sector).count()
+            return f"There {'is' if count == 1 else 'are'} {count} compan{'y' if count == 1 else 'ies'} in {sector}."
+        count = Company.objects.count()
+        return f"There {'is' if count == 1 else 'are'} {count} compan{'y' if count == 1 else 'ies'} in the database."
+
+    match = _LIST.match(text)
+    if match and _only_filler(match.group("rest"), sector):
+        queryset = Company.objects.all()
+        if sector:
+            queryset = queryset.filter(sector=sector)
+        if not queryset.exists():
+            where = f" in {sector}" if sector else " currently in the database"
+            return f"No companies{where}."
+        where = f" in {sector}" if sector else ""
+        return f"Companies{where}:\n{_names(queryset)}"
+
+    return None
@@ -0,0 +1,173 @@
+# agent/cache.py
+# Built-ins
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Third-party / Django
+from django.conf import settings
+from django.core.cache import cache
+
+from companies import telemetry
+from companies.signals import acompany_data_version, company_data_version
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def normalize_message(message: str) -> str:
+    """Case- and whitespace-insensitive form, minus trailing punctuation."""
+    return " ".join((message or "").lower().split()).rstrip("?!. ")
+
+class LRUCache:
+    """Small thread-safe LRU with optional per-entry expiry."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# ---------------------------------------------------------------------------
+# Response cache
+# ---------------------------------------------------------------------------
+
+class ResponseCache:
+    """Two-tier answer cache for :pyfunc:`agent.langgraph_agent.run_chat`.
+
+    An in-process LRU sits in front of the Django cache. Keys include the
+    Company data version, so any Company write makes every cached answer
+    unreachable without having to find and delete them. Callers read the
+    version before answering and store the answer under that version, so an
+    answer computed while a write commits is never filed under the new one.
+    """
+
+    def __init__(self, local_size: int = 1024, ttls: dict = None):
+        self.local = LRUCache(local_size)
+        self.ttls = ttls or {}
+        self._lock = threading.Lock()
+        self._counters = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _digest(message: str) -> str:
+        return hashlib.sha1(normalize_message(message).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def version() -> int:
+        """The Company data version to pass to :meth:`get` and :meth:`set`."""
+        return company_data_version()
+
+    @staticmethod
+    async def aversion() -> int:
+        """Async version of :meth:`version`."""
+        return await acompany_data_version()
+
+    def _key(self, message: str, version: int) -> str:
+        return f"chat:v{version}:{self._digest(message)}"
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, message: str, version: int = None):
+        """Return the cached answer for *message*, or ``None``."""
+        key = self._key(message, self.version() if version is None else version)
+        answer = self.local.get(key)
+        if answer is not None:
+            self._count("local_hits")
+            return answer
+        entry = cache.get(key)
+        if entry is not None:
+            self._count("shared_hits")
+            self.local.set(key, entry["answer"], self.ttls.get(entry["route"]))
+            return entry["answer"]
+        self._count("misses")
+        return None
+
+    def set(self, message: str, answer: str, route: str = None, version: int = None):
+        """Store *answer* under *version* (read before answering; default: current).
+
+        ``None`` TTL = until the data version changes; 0 = don't cache.
+        """
+        ttl = self.ttls.get(route)
+        if ttl == 0:
+            return
+        key = self._key(message, self.version() if version is None else version)
+        self.local.set(key, answer, ttl)
+        cache.set(key, {"answer": answer, "route": route}, timeout=ttl)
+
+    async def aget(self, message: str, version: int = None):
+        """Async version of :meth:`get`."""
+        key = self._key(message, await self.aversion() if version is None else version)
+        answer = self.local.get(key)
+        if answer is not None:
+            self._count("local_hits")
+            return answer
+        entry = await cache.aget(key)
+        if entry is not None:
+            self._count("shared_hits")
+            self.local.set(key, entry["answer"], self.ttls.get(entry["route"]))
+            return entry["answer"]
+        self._count("misses")
+        return None
+
+    async def aset(self, message: str, answer: str, route: str = None, version: int = None):
+        """Async version of :meth:`set`."""
+        ttl = self.ttls.get(route)
+        if ttl == 0:
+            return
+        key = self._key(message, await self.aversion() if version is None else version)
+        self.local.set(key, answer, ttl)
+        await cache.aset(key, {"answer": answer, "route": route}, timeout=ttl)
+
+    def stats(self) -> dict:
+        """Hit/miss counters since process start."""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = sum(counters.values())
+        hits = counters["local_hits"] + counters["shared_hits"]
+        counters["hit_ratio"] = hits / lookups if lookups else 0.0
+        return counters
+
+response_cache = ResponseCache(
+    local_size=settings.CHAT_CACHE_LOCAL_SIZE,
+    ttls=settings.CHAT_CACHE_TTLS,
+)
+
+def _cache_metrics() -> list:
+    stats = response_cache.stats()
+    lines = [
+        "# HELP chat_cache_lookups_total Answer cache lookups by result.",
+        "# TYPE chat_cache_lookups_total counter",
+    ]
+    lines += [
+        f'chat_cache_lookups_total{{result="{name}"}} {stats[name]}'
+        for name in ("local_hits", "shared_hits", "misses")
+    ]
+    return lines
+
+telemetry.register_collector(_cache_metrics)
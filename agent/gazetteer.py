@@ -0,0 +1,103 @@
+# agent/gazetteer.py
+# Built-ins
+import re
+from collections import defaultdict
+
+from .indexes import CompanyIndex
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+# Names made only of these words ("Data", "Global Energy") are too likely to
+# appear in ordinary questions to bypass the router on their own
+_COMMON_WORDS = frozenset("""
+    a about all also an and any are as at be best big by can company companies could
+    do does first for free from general give good great has have hello help hi high
+    how i in info information is it its just last list low me more most my new next
+    no not now of on one only open or other our over please real same show so some
+    such tell than thanks that the their them these they this those to top true two
+    under very was we were what when where which who why will with world would you your
+    bank business capital data digital energy finance financial global group growth
+    health holdings industries industry international labs market markets media national
+    network partners plan price product products profit revenue risk risks sales
+    service services software solutions strategy systems tech technologies technology
+    trade united value ventures works
+""".split())
+
+def _words(text: str) -> tuple:
+    """Lower-case word tokens, so 'Acme Corp.' and 'acme corp' line up."""
+    return tuple(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+# ---------------------------------------------------------------------------
+# Gazetteer
+# ---------------------------------------------------------------------------
+
+class Gazetteer(CompanyIndex):
+    """Word-level dictionary of company names used as a pre-router.
+
+    Names are keyed by their first word, so scanning a message costs one dict
+    lookup per word plus a tuple comparison per name sharing that first word,
+    independent of the number of companies. Names made only of common words
+    are left to the LLM router.
+    """
+
+    fields = ("name",)
+
+    def __init__(self, min_length: int = 3):
+        super().__init__()
+        self.min_length = min_length
+        self._by_first = defaultdict(dict)  # first word -> {pk: word tuple}
+        self._entries = {}                  # pk -> (word tuple, display name)
+
+    # --- maintenance -----------------------------------------------------
+    def _add(self, company):
+        words = _words(company.name)
+        if len(" ".join(words)) < self.min_length or all(w in _COMMON_WORDS for w in words):
+            return
+        self._entries[company.pk] = (words, company.name)
+        self._by_first[words[0]][company.pk] = words
+
+    def _remove(self, pk):
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return
+        first = entry[0][0]
+        bucket = self._by_first.get(first)
+        if bucket is not None:
+            bucket.pop(pk, None)
+            if not bucket:
+                del self._by_first[first]
+
+    def _clear(self):
+        self._by_first.clear()
+        self._entries.clear()
+
+    # --- lookup ----------------------------------------------------------
+    def match(self, text: str):
+        """Return the one company name *text* clearly mentions, else ``None``.
+
+        A mention is a full company name on word boundaries. Mentions nested
+        inside a longer one ('Acme' in 'Acme Corp') are ignored; if more than
+        one company remains the message is ambiguous and ``None`` is returned.
+        """
+        self.ensure_loaded()
+        words = _words(text)
+
+        with self._lock:
+            spans = []
+            for i, word in enumerate(words):
+                for pk, seq in self._by_first.get(word, {}).items():
+                    if words[i:i + len(seq)] == seq:
+                        spans.append((i, i + len(seq), pk))
+            names = {pk: self._entries[pk][1] for _, _, pk in spans}
+
+        outer = {
+            pk for start, end, pk in spans
+            if not any(s <= start and end <= e and (e - s) > (end - start) for s, e, _ in spans)
+        }
+        if len(outer) != 1:
+            return None
+        return names[outer.pop()]
+
+company_gazetteer = Gazetteer()
@@ -0,0 +1,137 @@
+# agent/indexes.py
+# Built-ins
+import threading
+import weakref
+
+# Third-party / Django
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from companies.models import Company
+from companies.signals import companies_bulk_upserted, company_data_version, company_write_committed
+
+# Every live CompanyIndex, patched by the receivers below
+_indexes = weakref.WeakSet()
+
+class CompanyIndex:
+    """Base for the agent's in-memory structures derived from the Company table.
+
+    The structure is loaded lazily on first use (or by the warmup) and
+    patched per row from this process's ``Company`` signals once the write
+    commits. It remembers the Company data version it was loaded at and
+    reloads when that changes, which is how writes made by other worker
+    processes reach it; the version bump of a write it was patched for
+    moves it forward instead. (Two processes bumping at the same instant
+    can both see the same previous version; the one whose bump lands last
+    then misses the other's write until the next one.) Subclasses implement :meth:`_add`, :meth:`_remove`
+    and :meth:`_clear`; all of them run under ``self._lock``. *fields*
+    limits the columns loaded (``None`` loads whole rows).
+    """
+
+    fields = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = None  # Company data version of the last load
+        _indexes.add(self)
+
+    # --- subclass hooks --------------------------------------------------
+    def _add(self, company: Company):
+        raise NotImplementedError
+
+    def _remove(self, pk):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _changed(self):
+        """Called after the load and after every patch."""
+
+    # --- maintenance -----------------------------------------------------
+    def _current(self, version) -> bool:
+        return self._loaded and self._version == version
+
+    def ensure_loaded(self):
+        """Load from the database, unless loaded at the current data version."""
+        # Read before the rows: a write committed during the load bumps it again
+        version = company_data_version()
+        if self._current(version):
+            return
+        with self._lock:
+            if self._current(version):
+                return
+            self._clear()
+            companies = Company.objects.all()
+            if self.fields is not None:
+                companies = companies.only(*self.fields)
+            for c in companies.iterator():
+                self._add(c)
+            self._version = version
+            self._loaded = True
+            self._changed()
+
+    def advance(self, previous, version):
+        """Move to *version* if current at *previous* (this process's own write)."""
+        with self._lock:
+            if self._loaded and previous is not None and self._version == previous:
+                self._version = version
+
+    def upsert(self, company: Company):
+        """Insert or re-index a single company. No-op until loaded."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(company.pk)
+            self._add(company)
+            self._changed()
+
+    def discard(self, pk):
+        """Drop a single company. No-op until loaded."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(pk)
+            self._changed()
+
+    def reset(self):
+        """Forget everything; the next use rebuilds from the database."""
+        with self._lock:
+            self._clear()
+            self._loaded = False
+            self._version = None
+
+# ---------------------------------------------------------------------------
+# Signals
+# ---------------------------------------------------------------------------
+
+# Applied after commit, so a rolled-back write never reaches an index
+def _upsert_all(instances):
+    for index in list(_indexes):
+        for c in instances:
+            index.upsert(c)
+
+def _discard_all(pk):
+    for index in list(_indexes):
+        index.discard(pk)
+
+@receiver(post_save, sender=Company, dispatch_uid="company_indexes_upsert")
+def _company_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: _upsert_all([instance]))
+
+@receiver(post_delete, sender=Company, dispatch_uid="company_indexes_discard")
+def _company_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: _discard_all(pk))
+
+@receiver(companies_bulk_upserted, sender=Company, dispatch_uid="company_indexes_bulk")
+def _companies_bulk_upserted(sender, instances, **kwargs):
+    transaction.on_commit(lambda: _upsert_all(list(instances)))
+
+# Runs in the same on-commit sequence as the patches for the write
+@receiver(company_write_committed, sender=Company, dispatch_uid="company_indexes_advance")
+def _company_write_committed(sender, previous, version, **kwargs):
+    for index in list(_indexes):
+        index.advance(previous, version)
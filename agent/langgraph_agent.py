@@ -1,28 +1,53 @@
 # ── agent/langgraph_agent.py ────────────────────────────────────────────
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
 from langgraph.graph import StateGraph, END
-from langchain.prompts import ChatPromptTemplate, PromptTemplate
-from langchain.schema import SystemMessage
-from typing import TypedDict
+from langgraph.graph.message import add_messages
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from typing import Annotated, TypedDict
 from .llm_factory import make_llm
-from .tools import get_company_tool
+from .tools import _aget_company_by_name, _get_company_by_name, get_company_tool
+from .retrieval import company_context, company_search_index
+from .name_index import company_name_index
+from .snapshot import company_snapshot
+from .gazetteer import company_gazetteer
+from .aggregates import answer_aggregate
+from .memory import session_memory
+from .cache import normalize_message, response_cache
+from companies import telemetry
 from pydantic import BaseModel, Field
 from langchain.output_parsers import PydanticOutputParser
+import asyncio
+import contextvars
+import logging
 import re
+import threading
+import time
 
-llm = make_llm()
+logger = logging.getLogger(__name__)
 
 # ── State ────────────────────────────────────────────────────────────────
 class ChatState(TypedDict):
     input: str
     output: str
     route: str
+    entity: str
+    company: str  # company profile looked up while the router ran (see route_message)
+    error: str  # set when the answer reports a failure; such answers are not cached
+    # Session memory (only kept by the checkpointed graph, see agent.memory)
+    messages: Annotated[list, add_messages]
+    summary: str
 
 # ── Router ───────────────────────────────────────────────────────────────
 class Router(BaseModel):
     """Route a user query to the appropriate tool or agent."""
     datasource: str = Field(
-        description="Given a user query, route it to 'company_query' for company-related questions or 'general_query' for all others.",
-        enum=["company_query", "general_query"],
+        description="Given a user query, route it to 'company_query' for a specific company, 'aggregate_query' for counts, lists or rankings over the database, or 'general_query' for all others.",
+        enum=["company_query", "aggregate_query", "general_query"],
     )
 
 router_prompt = PromptTemplate(
@@ -35,8 +60,14 @@ router_prompt = PromptTemplate(
     - "What does TechFlow Solutions do?"
     - "Show me information on Microsoft"
     
+    Route to 'aggregate_query' for counts, lists, rankings or groupings over the database:
+    - "How many companies are in Technology?"
+    - "List all companies" / "What companies are in the database?"
+    - "Which sectors do we cover?"
+    - "Top 5 companies by revenue" / "Largest employers in Manufacturing"
+    
     Route to 'general_query' for:
-    - General questions about companies ("what companies are in the database", "list all companies")
+    - Other general questions about companies ("which companies work on renewable energy")
     - Non-company questions ("hello", "how are you", "what can you do")
     - Requests for help or information about the system
     
@@ -45,95 +76,96 @@ router_prompt = PromptTemplate(
     input_variables=["input"],
 )
 
-# Try to use structured_output helper; fallback to parser if not supported
-try:
-    router_chain = router_prompt | llm.with_structured_output(Router)
-except NotImplementedError:
-    parser = PydanticOutputParser(pydantic_object=Router)
-    router_chain = router_prompt | llm | parser
-
-# ── Nodes ────────────────────────────────────────────────────────────────
-def route_message(state: ChatState) -> dict:
-    """Routes the user's message to the appropriate node."""
-    user_input = state["input"]
-    route = router_chain.invoke({"input": user_input})
-    print(f"DEBUG: Router decided: {route.datasource}")
-    return {"route": route.datasource}
+def _router_chain(llm):
+    # Try to use structured_output helper; fallback to parser if not supported
+    try:
+        return router_prompt | llm.with_structured_output(Router)
+    except NotImplementedError:
+        parser = PydanticOutputParser(pydantic_object=Router)
+        return router_prompt | llm | parser
 
-def chat_node(state: ChatState) -> ChatState:
-    """Intelligent chat node that uses LLM to answer questions based on stored company data.
-    
-    This node provides ALL company data to the LLM and lets it intelligently 
-    respond to any question using only the stored information.
-    """
-    user_input = state["input"]
-    
-    # Get all company data from database
-    from companies.models import Company
-    companies = Company.objects.all()
-    
-    if not companies.exists():
-        return {
-            "output": "No companies are currently in the database."
-        }
-    
-    # Format all company data for the LLM
-    company_data = "\n\n".join([
-        f"Company: {c.name}\n"
-        f"Description: {c.description}\n"
-        f"Sector: {c.sector}\n"
-        f"Financials: {c.financials}"
-        for c in companies
-    ])
-    
-    # Create intelligent prompt for LLM
-    prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=f"""
+# ── Chat prompt ──────────────────────────────────────────────────────────
+# Compiled once; each request only fills in the retrieved companies
+chat_prompt = ChatPromptTemplate.from_messages([
+    ("system", """
         You are an AI assistant that answers questions about companies using ONLY the provided company database.
         
-        COMPANY DATABASE:
-        {company_data}
+        DATABASE SUMMARY:
+        {summary}
+        
+        MOST RELEVANT COMPANIES:
+        {companies}
         
         INSTRUCTIONS:
         - Answer the user's question using ONLY the information from the company database above
         - Be helpful and conversational
         - If asked about companies not in the database, say they're not in our records
+        - Only the most relevant companies are listed; use the summary for counts and sectors
         - For general questions about "what companies" or "list companies", provide a nice summary
         - For questions about specific companies, provide detailed information
         - For questions asking for "more details" or "tell me more", provide comprehensive information
         - Do not use any external knowledge - only use the database provided above
         """),
-        ("human", "{input}")
-    ])
-    
-    # Use LLM to generate intelligent response
-    chain = prompt | llm
-    response = chain.invoke({"input": user_input})
-    
-    return {
-        "output": response.content
-    }
+    MessagesPlaceholder("history", optional=True),
+    ("human", "{input}")
+])
 
-def company_tool_node(state: ChatState) -> ChatState:
-    """Return a deterministic answer based solely on the company record."""
+# Folds messages that leave the session window into the rolling summary
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", """
+        Summarize a conversation between a user and an assistant answering questions
+        about a company database, in at most {max_words} words. Extend the existing
+        summary with the new messages; keep company names, figures and what the user
+        is trying to find out. Reply with the summary only.
+        """),
+    ("human", "EXISTING SUMMARY:\n{summary}\n\nNEW MESSAGES:\n{messages}")
+])
+
+# ── Helpers ──────────────────────────────────────────────────────────────
+def _history(state: ChatState) -> list:
+    """The session's rolling summary and recent messages, as prompt messages."""
+    history = list(state.get("messages") or [])
+    if state.get("summary"):
+        history.insert(0, SystemMessage(f"Summary of the earlier conversation: {state['summary']}"))
+    return history
+
+def _chat_inputs(state: ChatState):
+    """Prompt variables for the turn, or ``None`` if there are no companies."""
+    if not len(company_snapshot):
+        return None
     user_input = state["input"]
+    query = user_input
+    # Follow-ups ("tell me more") retrieve with the previous question as well
+    previous = [m.content for m in state.get("messages") or [] if m.type == "human"]
+    if previous:
+        query = f"{previous[-1]} {user_input}"
+    return {
+        "input": user_input,
+        "companies": company_context(query, k=settings.CHAT_CONTEXT_TOP_K),
+        "summary": company_snapshot.summary(),
+        "history": _history(state),
+    }
 
-    # The router decided this *is* a company query⇢ just strip common filler
-    company_name = re.sub(
+def _strip_filler(user_input: str) -> str:
+    return re.sub(
         r"\b(what is|about|tell me about|information on|the company)\b",
         "",
         user_input,
         flags=re.IGNORECASE,
     ).strip()
-    print(f"DEBUG: Extracted company name: '{company_name}'")
 
-    try:
-        tool_result = get_company_tool.invoke({"name": company_name})
-        print(f"DEBUG: Tool result: '{tool_result}'")
-    except Exception as exc:
-        print(f"DEBUG: Tool error: {exc}")
-        return {"output": f"Error looking up '{company_name}'."}
+def _company_name(state: ChatState) -> str:
+    """Company name to look up: the gazetteer match, else the stripped input."""
+    # The gazetteer already resolved the name⇢ use it as-is
+    company_name = state.get("entity")
+    if not company_name:
+        # The router decided this *is* a company query⇢ just strip common filler
+        company_name = _strip_filler(state["input"])
+    logger.debug("Extracted company name: %r", company_name)
+    return company_name
 
+def _company_answer(company_name: str, tool_result: str) -> ChatState:
+    logger.debug("Tool result: %r", tool_result)
     if tool_result == "Company not found.":
         return {"output": f"Sorry, I couldn't find any information for '{company_name}'."}
 
@@ -143,30 +175,573 @@ def company_tool_node(state: ChatState) -> ChatState:
     )
     return {"output": response_text}
 
+# ── Speculative company lookup ───────────────────────────────────────────
+# While the LLM router runs, the company lookup for the stripped message
+# runs alongside it, so a company question costs max(router, lookup) rather
+# than their sum. A `company_query` route uses the result; any other route
+# cancels the lookup, or throws its result away if it already finished.
+SPECULATION_MAX_WORDS = 6  # longer messages are unlikely to be just a company name
+
+_speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="company-lookup")
+
+def _speculative_name(user_input: str):
+    """Name to look up while routing, or ``None`` when speculation is off or pointless."""
+    if not settings.CHAT_SPECULATIVE_LOOKUP:
+        return None
+    name = _strip_filler(user_input)
+    if not name or len(name.split()) > SPECULATION_MAX_WORDS:
+        return None
+    return name
+
+def _lookup(name: str) -> str:
+    close_old_connections()
+    try:
+        with telemetry.TOOL_SECONDS.time(tool="speculative_lookup"):
+            return _get_company_by_name(name)
+    finally:
+        close_old_connections()
+
+async def _alookup(name: str) -> str:
+    with telemetry.TOOL_SECONDS.time(tool="speculative_lookup"):
+        return await _aget_company_by_name(name)
+
+def _settle(lookup, route: str) -> dict:
+    """State update from a speculative lookup (a Future) once the route is known."""
+    if route != "company_query":
+        outcome = "cancelled" if lookup.cancel() else "discarded"
+        telemetry.SPECULATIVE_LOOKUPS.inc(outcome=outcome)
+        return {}
+    try:
+        company = lookup.result()
+    except Exception:
+        # The company node runs the lookup again and reports the error
+        logger.warning("Speculative company lookup failed", exc_info=True)
+        telemetry.SPECULATIVE_LOOKUPS.inc(outcome="failed")
+        return {}
+    telemetry.SPECULATIVE_LOOKUPS.inc(outcome="used")
+    return {"company": company}
+
+async def _asettle(lookup: asyncio.Task, route: str) -> dict:
+    """Async version of :func:`_settle` for a speculative lookup task."""
+    if route != "company_query":
+        if lookup.done():
+            lookup.cancelled() or lookup.exception()  # retrieved, so never logged as unhandled
+            telemetry.SPECULATIVE_LOOKUPS.inc(outcome="discarded")
+        else:
+            lookup.cancel()
+            telemetry.SPECULATIVE_LOOKUPS.inc(outcome="cancelled")
+        return {}
+    try:
+        company = await lookup
+    except Exception:
+        logger.warning("Speculative company lookup failed", exc_info=True)
+        telemetry.SPECULATIVE_LOOKUPS.inc(outcome="failed")
+        return {}
+    telemetry.SPECULATIVE_LOOKUPS.inc(outcome="used")
+    return {"company": company}
+
+# ── Nodes ────────────────────────────────────────────────────────────────
+# Each node has a sync and an async implementation so the same graph serves
+# both `run_chat` (invoke) and `arun_chat` (ainvoke).
+def route_message(state: ChatState) -> dict:
+    """Routes the user's message to the appropriate node.
+
+    Messages naming exactly one known company skip the LLM router and go
+    straight to the company lookup with the matched name as ``entity``.
+    Count/list/group-by/top-N questions are answered from the database here
+    (see :mod:`agent.aggregates`) and go to the aggregate node with the
+    answer already in ``output``. Otherwise the LLM router decides, with the
+    company lookup running speculatively next to it.
+    """
+    user_input = state["input"]
+    entity = company_gazetteer.match(user_input)
+    if entity:
+        logger.debug("Gazetteer matched: %r", entity)
+        return {"route": "company_query", "entity": entity}
+    answer = answer_aggregate(user_input)
+    if answer is not None:
+        logger.debug("Answered from aggregates")
+        return {"route": "aggregate_query", "output": answer}
+    name = _speculative_name(user_input)
+    lookup = None
+    if name:
+        # Worker threads don't inherit context variables (the request's trace)
+        lookup = _speculation_pool.submit(contextvars.copy_context().run, _lookup, name)
+    try:
+        route = get_router_chain().invoke({"input": user_input})
+    except BaseException:
+        if lookup is not None:
+            _settle(lookup, None)
+        raise
+    logger.debug("Router decided: %s", route.datasource)
+    update = {"route": route.datasource}
+    if lookup is not None:
+        update.update(_settle(lookup, route.datasource))
+    return update
+
+async def aroute_message(state: ChatState) -> dict:
+    """Async version of :func:`route_message`."""
+    user_input = state["input"]
+    entity = await sync_to_async(company_gazetteer.match)(user_input)
+    if entity:
+        logger.debug("Gazetteer matched: %r", entity)
+        return {"route": "company_query", "entity": entity}
+    answer = await sync_to_async(answer_aggregate)(user_input)
+    if answer is not None:
+        logger.debug("Answered from aggregates")
+        return {"route": "aggregate_query", "output": answer}
+    name = _speculative_name(user_input)
+    lookup = asyncio.ensure_future(_alookup(name)) if name else None
+    try:
+        route = await get_router_chain().ainvoke({"input": user_input})
+    except BaseException:
+        # Includes the request being cancelled (client gone): stop the lookup too
+        if lookup is not None:
+            await _asettle(lookup, None)
+        raise
+    logger.debug("Router decided: %s", route.datasource)
+    update = {"route": route.datasource}
+    if lookup is not None:
+        update.update(await _asettle(lookup, route.datasource))
+    return update
+
+def chat_node(state: ChatState) -> ChatState:
+    """Intelligent chat node that uses LLM to answer questions based on stored company data.
+    
+    Rather than the whole table, the LLM gets the top-k companies retrieved
+    for the question plus a compact aggregate summary, so the prompt stays
+    bounded however many companies are stored. Both come pre-serialized
+    from :data:`agent.snapshot.company_snapshot`, so no ORM query or
+    per-company formatting happens per request.
+    """
+    inputs = _chat_inputs(state)
+    if inputs is None:
+        return {
+            "output": "No companies are currently in the database."
+        }
+    
+    # Use LLM to generate intelligent response
+    response = get_chat_chain().invoke(inputs)
+    
+    return {
+        "output": response.content
+    }
+
+async def achat_node(state: ChatState) -> ChatState:
+    """Async version of :func:`chat_node`."""
+    inputs = await sync_to_async(_chat_inputs)(state)
+    if inputs is None:
+        return {
+            "output": "No companies are currently in the database."
+        }
+
+    response = await get_chat_chain().ainvoke(inputs)
+
+    return {
+        "output": response.content
+    }
+
+def company_tool_node(state: ChatState) -> ChatState:
+    """Return a deterministic answer based solely on the company record."""
+    company_name = _company_name(state)
+    if state.get("company"):
+        # Already looked up while the router ran
+        return _company_answer(company_name, state["company"])
+    try:
+        with telemetry.TOOL_SECONDS.time(tool="get_company_info"):
+            tool_result = get_company_tool.invoke({"name": company_name})
+    except Exception:
+        logger.warning("Company lookup for %r failed", company_name, exc_info=True)
+        return {"output": f"Error looking up '{company_name}'.", "error": "lookup_failed"}
+    return _company_answer(company_name, tool_result)
+
+async def acompany_tool_node(state: ChatState) -> ChatState:
+    """Async version of :func:`company_tool_node`."""
+    company_name = _company_name(state)
+    if state.get("company"):
+        return _company_answer(company_name, state["company"])
+    try:
+        with telemetry.TOOL_SECONDS.time(tool="get_company_info"):
+            tool_result = await get_company_tool.ainvoke({"name": company_name})
+    except Exception:
+        logger.warning("Company lookup for %r failed", company_name, exc_info=True)
+        return {"output": f"Error looking up '{company_name}'.", "error": "lookup_failed"}
+    return _company_answer(company_name, tool_result)
+
+def aggregate_node(state: ChatState) -> ChatState:
+    """Templated answer computed from ORM aggregates, no LLM involved.
+
+    When the LLM router picked this route for a question the templates do
+    not cover, fall back to the chat node (and its cache TTL).
+    """
+    answer = state.get("output") or answer_aggregate(state["input"])
+    if answer is None:
+        return {**chat_node(state), "route": "general_query"}
+    return {"output": answer}
+
+async def aaggregate_node(state: ChatState) -> ChatState:
+    """Async version of :func:`aggregate_node`."""
+    answer = state.get("output") or await sync_to_async(answer_aggregate)(state["input"])
+    if answer is None:
+        return {**await achat_node(state), "route": "general_query"}
+    return {"output": answer}
+
+def _remember(state: ChatState):
+    """Return ``(update, overflow)``: the turn appended to the session, and the
+    oldest messages to fold into the summary once the window is exceeded."""
+    turn = [HumanMessage(state["input"]), AIMessage(state["output"])]
+    messages = list(state.get("messages") or []) + turn
+    window = max(settings.CHAT_MEMORY_WINDOW, 2)
+    # Fold in batches (down to `window` once `2 * window` is reached), not every turn
+    overflow = messages[:-window] if len(messages) > 2 * window else []
+    return {"messages": turn + [RemoveMessage(id=m.id) for m in overflow]}, overflow
+
+def _summary_inputs(state: ChatState, overflow: list) -> dict:
+    return {
+        "max_words": settings.CHAT_MEMORY_SUMMARY_WORDS,
+        "summary": state.get("summary") or "(none)",
+        "messages": "\n".join(
+            f"{'User' if m.type == 'human' else 'Assistant'}: {m.content}" for m in overflow
+        ),
+    }
+
+def remember_node(state: ChatState) -> ChatState:
+    """Add the turn to the session memory, keeping it to a bounded window plus a rolling summary."""
+    update, overflow = _remember(state)
+    if overflow:
+        update["summary"] = get_summary_chain().invoke(_summary_inputs(state, overflow)).content
+    return update
+
+async def aremember_node(state: ChatState) -> ChatState:
+    """Async version of :func:`remember_node`."""
+    update, overflow = _remember(state)
+    if overflow:
+        update["summary"] = (await get_summary_chain().ainvoke(_summary_inputs(state, overflow))).content
+    return update
+
 # ── Graph ────────────────────────────────────────────────────────────────
 def decide_route(state: ChatState):
     """Helper function to route from the router to the correct node."""
     if state["route"] == "company_query":
         return "get_company_info"
+    if state["route"] == "aggregate_query":
+        return "aggregate"
     return "chat"
 
-graph = StateGraph(ChatState)
-graph.add_node("router", route_message)
-graph.add_node("chat", chat_node)
-graph.add_node("get_company_info", company_tool_node)
-
-graph.set_entry_point("router")
-graph.add_conditional_edges(source="router", path=decide_route, path_map={
-    "get_company_info": "get_company_info",
-    "chat": "chat"
-})
-graph.add_edge("chat", END)
-graph.add_edge("get_company_info", END)
-
-app = graph.compile()
-
-def run_chat(message: str) -> str:
-    """Used by the Django /chat/ view."""
-    # The `app` is our compiled graph
-    result = app.invoke({"input": message})
-    return result["output"]
\ No newline at end of file
+def _node(name: str, func, afunc) -> RunnableLambda:
+    """Graph node from a sync/async pair, timed by :func:`companies.telemetry.node_span`."""
+    def run(state):
+        with telemetry.node_span(name):
+            return func(state)
+
+    async def arun(state):
+        with telemetry.node_span(name):
+            return await afunc(state)
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+def _build_graph(checkpointer=None):
+    """The chat graph; with a *checkpointer*, each turn also goes through
+    the ``remember`` node and the state is kept per session (thread)."""
+    graph = StateGraph(ChatState)
+    graph.add_node("router", _node("router", route_message, aroute_message))
+    graph.add_node("chat", _node("chat", chat_node, achat_node))
+    graph.add_node("get_company_info", _node("get_company_info", company_tool_node, acompany_tool_node))
+    graph.add_node("aggregate", _node("aggregate", aggregate_node, aaggregate_node))
+
+    graph.set_entry_point("router")
+    graph.add_conditional_edges(source="router", path=decide_route, path_map={
+        "get_company_info": "get_company_info",
+        "aggregate": "aggregate",
+        "chat": "chat"
+    })
+    last = END
+    if checkpointer is not None:
+        graph.add_node("remember", _node("remember", remember_node, aremember_node))
+        graph.add_edge("remember", END)
+        last = "remember"
+    graph.add_edge("chat", last)
+    graph.add_edge("get_company_info", last)
+    graph.add_edge("aggregate", last)
+
+    return graph.compile(checkpointer=checkpointer)
+
+# ── Lazy construction ────────────────────────────────────────────────────
+# The LLM, chains and compiled graph are built on first use (or by
+# `warmup_agent`), not at import, so management commands and migrations
+# never pay for them.
+_agent = None
+_agent_lock = threading.Lock()
+
+def _build(llm) -> dict:
+    return {
+        "llm": llm,
+        "router_chain": _router_chain(llm),
+        "chat_chain": chat_prompt | llm,
+        "summary_chain": summary_prompt | llm,
+        "app": _build_graph(),
+        "session_app": _build_graph(session_memory.saver) if session_memory.enabled else None,
+    }
+
+def _components() -> dict:
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = _build(make_llm())
+    return _agent
+
+def build_agent(llm=None) -> dict:
+    """Rebuild the agent around *llm* (default: :func:`make_llm`) and use it from now on.
+
+    Lets benchmarks and replays swap the model without restarting.
+    """
+    global _agent
+    components = _build(llm or make_llm())
+    with _agent_lock:
+        _agent = components
+    return components
+
+def get_llm():
+    return _components()["llm"]
+
+def get_router_chain():
+    return _components()["router_chain"]
+
+def get_chat_chain():
+    return _components()["chat_chain"]
+
+def get_summary_chain():
+    return _components()["summary_chain"]
+
+def get_app():
+    """The compiled LangGraph app."""
+    return _components()["app"]
+
+def get_session_app():
+    """The compiled app with session memory, or ``None`` when ``CHAT_MEMORY_PATH`` is empty."""
+    return _components()["session_app"]
+
+def warmup_agent() -> dict:
+    """Build the agent and load every in-memory index before taking traffic.
+
+    Returns the seconds spent on each step.
+    """
+    timings = {}
+    steps = [
+        ("agent", _components),
+        ("name_index", company_name_index.ensure_loaded),
+        ("search_index", company_search_index.ensure_loaded),
+        ("gazetteer", company_gazetteer.ensure_loaded),
+        ("snapshot", company_snapshot.ensure_loaded),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = round(time.perf_counter() - start, 4)
+    return timings
+
+def _turn(message: str) -> dict:
+    """Graph input for one turn (clears the previous turn's values in a session's state)."""
+    return {"input": message, "output": "", "route": "", "entity": "", "company": "", "error": ""}
+
+def _session_app(session_id: str = None):
+    """The session-memory app for *session_id*, or ``None`` (no session, or memory off)."""
+    return get_session_app() if session_id else None
+
+def _cached_turn(message: str, answer: str) -> dict:
+    """State update recording a cache-answered turn in the session, as if the graph ran."""
+    update, _ = _remember({"input": message, "output": answer})
+    return update
+
+def run_chat(message: str, session_id: str = None) -> str:
+    """Used by the Django /chat/ view.
+
+    With a *session_id* the turn sees that session's earlier messages (see
+    :mod:`agent.memory`) and is added to them. Only a session's first turn
+    uses the answer cache, since later answers depend on the conversation.
+    """
+    with telemetry.trace():
+        app = _session_app(session_id)
+        remembered = app is not None and session_memory.has_history(session_id)
+        if not remembered:
+            version = response_cache.version()
+            cached = response_cache.get(message, version)
+            if cached is not None:
+                telemetry.set_route("cache")
+                if app is not None:
+                    app.update_state(session_memory.config(session_id), _cached_turn(message, cached),
+                                     as_node="remember")
+                    session_memory.touch(session_id)
+                return cached
+
+        # The `app` is our compiled graph
+        if app is None:
+            result = get_app().invoke(_turn(message))
+        else:
+            # Checkpoint once per turn, not after every node
+            result = app.invoke(_turn(message), config=session_memory.config(session_id), durability="exit")
+            session_memory.touch(session_id)
+        telemetry.set_route(result.get("route"))
+        if not remembered and not result.get("error"):
+            response_cache.set(message, result["output"], result.get("route"), version)
+        return result["output"]
+
+async def arun_chat(message: str, session_id: str = None) -> str:
+    """Async version of :func:`run_chat`, used by the async /chat/ view."""
+    with telemetry.trace():
+        app = _session_app(session_id)
+        remembered = app is not None and await session_memory.ahas_history(session_id)
+        if not remembered:
+            version = await response_cache.aversion()
+            cached = await response_cache.aget(message, version)
+            if cached is not None:
+                telemetry.set_route("cache")
+                if app is not None:
+                    await app.aupdate_state(session_memory.config(session_id), _cached_turn(message, cached),
+                                            as_node="remember")
+                    await session_memory.atouch(session_id)
+                return cached
+
+        if app is None:
+            result = await get_app().ainvoke(_turn(message))
+        else:
+            result = await app.ainvoke(_turn(message), config=session_memory.config(session_id), durability="exit")
+            await session_memory.atouch(session_id)
+        telemetry.set_route(result.get("route"))
+        if not remembered and not result.get("error"):
+            await response_cache.aset(message, result["output"], result.get("route"), version)
+        return result["output"]
+
+def _dedupe(messages: list):
+    """Return ``(unique, keys)``: first message per normalized form, and each message's key."""
+    unique, keys = {}, []
+    for message in messages:
+        key = normalize_message(message)
+        unique.setdefault(key, message)
+        keys.append(key)
+    return unique, keys
+
+def _batch_config(max_concurrency: int = None) -> dict:
+    return {"max_concurrency": max_concurrency or settings.CHAT_BATCH_MAX_CONCURRENCY}
+
+def run_chat_batch(messages: list, max_concurrency: int = None) -> list:
+    """Answer many messages through the graph with bounded concurrency.
+
+    Identical messages (after normalization) are answered once and cached
+    answers are reused. Returns one ``{"answer", "error"}`` dict per input
+    message, in order; a failure only affects its own items.
+    """
+    telemetry.set_route("batch")
+    unique, keys = _dedupe(messages)
+    results, pending = {}, []
+    version = response_cache.version()
+    for key, message in unique.items():
+        cached = response_cache.get(message, version)
+        if cached is not None:
+            results[key] = {"answer": cached, "error": None}
+        else:
+            pending.append((key, message))
+
+    outputs = get_app().batch(
+        [_turn(message) for _, message in pending],
+        config=_batch_config(max_concurrency),
+        return_exceptions=True,
+    )
+    for (key, message), result in zip(pending, outputs):
+        if isinstance(result, Exception):
+            results[key] = {"answer": None, "error": str(result)}
+            continue
+        if not result.get("error"):
+            response_cache.set(message, result["output"], result.get("route"), version)
+        results[key] = {"answer": result["output"], "error": None}
+
+    return [results[key] for key in keys]
+
+async def arun_chat_batch(messages: list, max_concurrency: int = None) -> list:
+    """Async version of :func:`run_chat_batch`, used by the /chat/batch/ view."""
+    telemetry.set_route("batch")
+    unique, keys = _dedupe(messages)
+    results, pending = {}, []
+    version = await response_cache.aversion()
+    for key, message in unique.items():
+        cached = await response_cache.aget(message, version)
+        if cached is not None:
+            results[key] = {"answer": cached, "error": None}
+        else:
+            pending.append((key, message))
+
+    outputs = await get_app().abatch(
+        [_turn(message) for _, message in pending],
+        config=_batch_config(max_concurrency),
+        return_exceptions=True,
+    )
+    for (key, message), result in zip(pending, outputs):
+        if isinstance(result, Exception):
+            results[key] = {"answer": None, "error": str(result)}
+            continue
+        if not result.get("error"):
+            await response_cache.aset(message, result["output"], result.get("route"), version)
+        results[key] = {"answer": result["output"], "error": None}
+
+    return [results[key] for key in keys]
+
+async def astream_chat(message: str, session_id: str = None):
+    """Async generator of ``(event, data)`` pairs for the streaming /chat/ view.
+
+    Emits ``route`` once the router decides, ``node`` as nodes start and
+    finish, ``token`` for each chunk of the answer (LLM tokens from the chat
+    node, the whole text for the deterministic company and aggregate nodes) and a final
+    ``done`` carrying the complete answer. *session_id* works as in :func:`run_chat`.
+    """
+    app = _session_app(session_id)
+    remembered = app is not None and await session_memory.ahas_history(session_id)
+    if not remembered:
+        version = await response_cache.aversion()
+        cached = await response_cache.aget(message, version)
+        if cached is not None:
+            telemetry.set_route("cache")
+            if app is not None:
+                await app.aupdate_state(session_memory.config(session_id), _cached_turn(message, cached),
+                                        as_node="remember")
+                await session_memory.atouch(session_id)
+            yield "token", {"text": cached}
+            yield "done", {"answer": cached, "cached": True}
+            return
+
+    if app is None:
+        stream = get_app().astream(_turn(message), stream_mode=["updates", "messages"])
+    else:
+        stream = app.astream(_turn(message), config=session_memory.config(session_id),
+                             stream_mode=["updates", "messages"], durability="exit")
+    output, route, streamed, error = "", None, False, None
+    async for mode, chunk in stream:
+        if mode == "messages":
+            token, metadata = chunk
+            # Only answer tokens count (not the router's); the aggregate node
+            # produces LLM tokens only when it falls back to the chat prompt
+            if metadata.get("langgraph_node") in ("chat", "aggregate") and token.content:
+                streamed = True
+                yield "token", {"text": token.content}
+            continue
+
+        for node, update in chunk.items():
+            update = update or {}
+            route = update.get("route", route)
+            if node == "router":
+                yield "route", {"route": route, "entity": update.get("entity")}
+                yield "node", {"node": decide_route(update), "status": "started"}
+                continue
+            yield "node", {"node": node, "status": "finished"}
+            error = update.get("error") or error
+            if "output" in update:
+                output = update["output"]
+                if not streamed:
+                    yield "token", {"text": output}
+
+    telemetry.set_route(route)
+    if app is not None:
+        await session_memory.atouch(session_id)
+    if not remembered and not error:
+        await response_cache.aset(message, output, route, version)
+    yield "done", {"answer": output, "cached": False}
\ No newline at end of file
@@ -1,19 +1,437 @@
 # agent/llm_factory.py
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
 from django.conf import settings
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, message_chunk_to_message, message_to_dict, messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
 
-def make_llm():
+from .admission import llm_gate
+
+from companies import telemetry
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+class _PerLoopTransport(httpx.AsyncBaseTransport):
+    """Async transport with one connection pool per event loop.
+
+    Pooled connections belong to the loop that opened them, and under WSGI
+    Django runs every async view on a new loop, so one shared pool would
+    hand a request connections of a closed loop. Pools of closed loops are
+    dropped when a new loop's pool is created (their connections hold the
+    loop, so weak references would not let it go).
     """
-    Returns a Chat model:
-      • real OpenAI if OPENAI_API_KEY is set
-      • deterministic FakeListLLM when the key is missing (tests, CI)
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._transports = {}  # loop -> AsyncHTTPTransport
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                for closed in [l for l in self._transports if l.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._kwargs)
+            return transport
+
+    async def handle_async_request(self, request):
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self):
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+def _http_client(kind: str):
+    """Process-wide keep-alive httpx client (``"sync"`` or ``"async"``), created once.
+
+    Every model built by :func:`make_llm` shares it, so connections to the
+    API are pooled and reused instead of re-opened per client. The async
+    client keeps a pool per event loop (see :class:`_PerLoopTransport`).
+    """
+    client = _clients.get(kind)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(kind)
+            if client is None:
+                limits = httpx.Limits(
+                    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+                )
+                timeout = httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=10.0)
+                if kind == "async":
+                    client = httpx.AsyncClient(transport=_PerLoopTransport(limits=limits), timeout=timeout)
+                else:
+                    client = httpx.Client(limits=limits, timeout=timeout)
+                _clients[kind] = client
+    return client
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Reports the prompt/completion tokens of every LLM call to :mod:`companies.telemetry`."""
+
+    run_inline = True  # keep the caller's context (current trace and node)
+
+    def on_llm_end(self, response, **kwargs):
+        prompt = completion = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt += usage.get("input_tokens", 0)
+                    completion += usage.get("output_tokens", 0)
+        if not (prompt or completion):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt = usage.get("prompt_tokens", 0)
+            completion = usage.get("completion_tokens", 0)
+        telemetry.record_tokens(prompt, completion)
+
+# Text that identifies the router prompt (agent.langgraph_agent.router_prompt)
+ROUTER_MARKER = "routing a user's request"
+
+class SimulatedChatModel(BaseChatModel):
+    """Offline chat model with configurable timing, for benchmarks and load tests.
+
+    Each call waits *latency* seconds, then produces its answer at
+    *tokens_per_second* (0 = all at once), token by token when streamed.
+    Router prompts are answered with the next datasource from *routes*
+    (cycled), as the JSON the router's output parser expects.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    routes: list = ["general_query"]
+    response: str = (
+        "Based on the company database, here is a short summary of the companies "
+        "that best match your question, with their sectors and key financials."
+    )
+    _calls: itertools.count = PrivateAttr(default_factory=itertools.count)
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _reply(self, messages) -> str:
+        prompt = messages[-1].content if messages else ""
+        if ROUTER_MARKER in prompt:
+            return json.dumps({"datasource": self.routes[next(self._calls) % len(self.routes)]})
+        return self.response
+
+    def _chunks(self, text: str) -> list:
+        words = text.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _usage(self, messages, text: str) -> dict:
+        prompt = sum(len(str(m.content)) for m in messages) // 4
+        completion = len(self._chunks(text))
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _duration(self, text: str) -> float:
+        if not self.tokens_per_second:
+            return self.latency
+        return self.latency + len(self._chunks(text)) / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        time.sleep(self._duration(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        await asyncio.sleep(self._duration(text))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        time.sleep(self.latency)
+        for piece in self._chunks(text):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for piece in self._chunks(text):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+class CassetteMiss(KeyError):
+    """Replay found no recording for a prompt."""
+
+def prompt_key(messages) -> str:
+    """Cassette key: a hash of the prompt messages (type and content)."""
+    payload = json.dumps([[m.type, m.content] for m in messages], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _as_chunk(message: AIMessage) -> AIMessageChunk:
+    return AIMessageChunk(
+        content=message.content,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        usage_metadata=message.usage_metadata,
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+            for i, call in enumerate(message.tool_calls)
+        ],
+    )
+
+class CassetteChatModel(BaseChatModel):
+    """Record/replay wrapper: an append-only JSON-lines cassette of LLM answers.
+
+    ``record``: every call goes to *inner*; the answer (content, tool calls
+    such as the router's structured output, token usage), its latency and,
+    for streamed calls, the timing of every chunk are appended to *path*
+    under :func:`prompt_key`. ``replay``: no model is called; each prompt
+    gets its recordings in turn (cycling), after the recorded latency, with
+    streamed chunks at their recorded offsets. Unknown prompts raise
+    :class:`CassetteMiss`.
     """
+
+    path: str
+    mode: str = "replay"
+    inner: Optional[BaseChatModel] = None
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _entries: Optional[dict] = PrivateAttr(default=None)  # key -> [entry, ...]
+    _positions: dict = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.mode}"
+
+    # --- tools (structured output) ---------------------------------------
+    def bind_tools(self, tools, **kwargs):
+        if self.mode == "record":
+            # Same request as the wrapped model would send (raises if it has no tool support)
+            return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+        if not any(entry.get("tools") for entries in self._load().values() for entry in entries):
+            raise NotImplementedError("the cassette holds no tool-calling answers")
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools])
+
+    # --- recording -------------------------------------------------------
+    def _record(self, messages, message, latency: float, chunks, kwargs):
+        line = json.dumps({
+            "key": prompt_key(messages),
+            "prompt": str(messages[-1].content)[:200] if messages else "",
+            "message": message_to_dict(message),
+            "latency": round(latency, 4),
+            "chunks": chunks,
+            "tools": "tools" in kwargs,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+        })
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    # --- replay ----------------------------------------------------------
+    def _load(self) -> dict:
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    entries = {}
+                    if os.path.exists(self.path):
+                        with open(self.path, encoding="utf-8") as f:
+                            for line in f:
+                                if line.strip():
+                                    entry = json.loads(line)
+                                    entries.setdefault(entry["key"], []).append(entry)
+                    self._entries = entries
+        return self._entries
+
+    def _next(self, messages) -> dict:
+        key = prompt_key(messages)
+        recordings = self._load().get(key)
+        if not recordings:
+            raise CassetteMiss(f"no recording for prompt {key[:12]} in {self.path}")
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        return recordings[position % len(recordings)]
+
+    @staticmethod
+    def _message(entry) -> AIMessage:
+        message = messages_from_dict([entry["message"]])[0]
+        return message_chunk_to_message(message)
+
+    @staticmethod
+    def _chunks(entry) -> list:
+        if entry.get("chunks"):
+            return [(offset, messages_from_dict([chunk])[0]) for offset, chunk in entry["chunks"]]
+        # Recorded without streaming: one chunk once the recorded latency has passed
+        return [(entry["latency"], _as_chunk(CassetteChatModel._message(entry)))]
+
+    # --- BaseChatModel ---------------------------------------------------
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.mode == "record":
+            start = time.perf_counter()
+            result = self.inner._generate(messages, stop=stop, **kwargs)
+            self._record(messages, result.generations[0].message, time.perf_counter() - start, None, kwargs)
+            return result
+        entry = self._next(messages)
+        time.sleep(entry["latency"])
+        return ChatResult(generations=[ChatGeneration(message=self._message(entry))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.mode == "record":
+            start = time.perf_counter()
+            result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+            self._record(messages, result.generations[0].message, time.perf_counter() - start, None, kwargs)
+            return result
+        entry = self._next(messages)
+        await asyncio.sleep(entry["latency"])
+        return ChatResult(generations=[ChatGeneration(message=self._message(entry))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.mode == "record":
+            start, chunks, merged = time.perf_counter(), [], None
+            for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                chunks.append([round(time.perf_counter() - start, 4), message_to_dict(chunk.message)])
+                merged = chunk.message if merged is None else merged + chunk.message
+                yield chunk
+            if merged is not None:
+                self._record(messages, merged, time.perf_counter() - start, chunks, kwargs)
+            return
+        start = time.perf_counter()
+        for offset, message in self._chunks(self._next(messages)):
+            time.sleep(max(0.0, offset - (time.perf_counter() - start)))
+            yield ChatGenerationChunk(message=message)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.mode == "record":
+            start, chunks, merged = time.perf_counter(), [], None
+            async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                chunks.append([round(time.perf_counter() - start, 4), message_to_dict(chunk.message)])
+                merged = chunk.message if merged is None else merged + chunk.message
+                yield chunk
+            if merged is not None:
+                self._record(messages, merged, time.perf_counter() - start, chunks, kwargs)
+            return
+        start = time.perf_counter()
+        for offset, message in self._chunks(self._next(messages)):
+            await asyncio.sleep(max(0.0, offset - (time.perf_counter() - start)))
+            yield ChatGenerationChunk(message=message)
+
+def _flight_key(messages, stop, kwargs) -> str:
+    """Key under which identical concurrent calls are coalesced (whitespace-insensitive)."""
+    payload = json.dumps(
+        [[[m.type, " ".join(str(m.content).split())] for m in messages], stop, kwargs],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class GatedChatModel(BaseChatModel):
+    """Sends every call of *inner* through :data:`agent.admission.llm_gate`.
+
+    Concurrent calls with the same prompt share one provider call, and the
+    number of calls in flight is bounded (see :class:`agent.admission.LLMGate`).
+    Streamed calls take a slot for the whole stream but are not coalesced.
+    """
+
+    inner: BaseChatModel
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gated-{self.inner._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        # Same request as the wrapped model would send (raises if it has no tool support)
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    @staticmethod
+    def _shared(result: ChatResult) -> ChatResult:
+        """Another caller's result, minus the token usage already counted for it."""
+        return ChatResult(generations=[
+            ChatGeneration(
+                message=generation.message.model_copy(update={"usage_metadata": None}),
+                generation_info=generation.generation_info,
+            )
+            for generation in result.generations
+        ])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        result, shared = llm_gate.call(
+            _flight_key(messages, stop, kwargs), lambda: self.inner._generate(messages, stop=stop, **kwargs)
+        )
+        return self._shared(result) if shared else result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        result, shared = await llm_gate.acall(
+            _flight_key(messages, stop, kwargs), lambda: self.inner._agenerate(messages, stop=stop, **kwargs)
+        )
+        return self._shared(result) if shared else result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with llm_gate.slot():
+            yield from self.inner._stream(messages, stop=stop, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async with llm_gate.aslot():
+            async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                yield chunk
+
+def _provider_llm(**kwargs):
+    """Real OpenAI if OPENAI_API_KEY is set (over the shared pooled HTTP clients), else a canned fake."""
     if settings.OPENAI_API_KEY:
         from langchain_openai import ChatOpenAI
         return ChatOpenAI(
             model="gpt-4o-mini",
             temperature=0,
             api_key=settings.OPENAI_API_KEY,
+            http_client=_http_client("sync"),
+            http_async_client=_http_client("async"),
+            stream_usage=True,  # token usage is reported for streamed answers too
+            **kwargs,
         )
     else:
         from langchain_community.chat_models.fake import FakeListChatModel
-        return FakeListChatModel(responses=["I don't have access to real data."])
\ No newline at end of file
+        return FakeListChatModel(responses=["I don't have access to real data."], **kwargs)
+
+def make_llm():
+    """
+    Returns a Chat model, chosen by ``LLM_BACKEND``:
+      • "simulated": :class:`SimulatedChatModel` configured by the LLM_SIMULATED_* settings
+      • "record": the model below, with every answer appended to LLM_CASSETTE_PATH
+      • "replay": answers served from LLM_CASSETTE_PATH with their recorded latencies (no network)
+      • otherwise real OpenAI if OPENAI_API_KEY is set (over the shared pooled HTTP clients)
+      • deterministic FakeListLLM when the key is missing (tests, CI)
+
+    wrapped in a :class:`GatedChatModel` (coalescing and admission control).
+    """
+    backend = settings.LLM_BACKEND
+    if backend == "simulated":
+        llm = SimulatedChatModel(
+            latency=settings.LLM_SIMULATED_LATENCY,
+            tokens_per_second=settings.LLM_SIMULATED_TOKENS_PER_SECOND,
+            routes=settings.LLM_SIMULATED_ROUTES,
+        )
+    elif backend == "record":
+        llm = CassetteChatModel(path=str(settings.LLM_CASSETTE_PATH), mode="record", inner=_provider_llm())
+    elif backend == "replay":
+        llm = CassetteChatModel(path=str(settings.LLM_CASSETTE_PATH), mode="replay")
+    else:
+        llm = _provider_llm()
+    return GatedChatModel(inner=llm, callbacks=[TokenUsageHandler()])
@@ -0,0 +1,142 @@
+# agent/memory.py
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+logger = logging.getLogger(__name__)
+
+class SessionSaver(SqliteSaver):
+    """:class:`SqliteSaver` with its async methods run in a worker thread.
+
+    The stock saver is sync-only, and ``AsyncSqliteSaver`` ties its
+    connection to one event loop, which does not survive Django running
+    async views on a new loop per request under WSGI. The connection is
+    shared and guarded by the saver's lock.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+class SessionMemory:
+    """Conversation state per ``session_id``, in a LangGraph SQLite checkpoint file.
+
+    Each session is a checkpointer thread. Next to LangGraph's tables a
+    ``chat_sessions`` table records when each session was last used, so
+    :meth:`sweep` can delete idle sessions and drop superseded checkpoints
+    of live ones. A sweep runs in the background at most every
+    *sweep_interval* seconds.
+    """
+
+    def __init__(self):
+        self._saver = None
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._sweeping = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.CHAT_MEMORY_PATH)
+
+    @property
+    def saver(self) -> SessionSaver:
+        if self._saver is None:
+            with self._lock:
+                if self._saver is None:
+                    conn = sqlite3.connect(settings.CHAT_MEMORY_PATH, check_same_thread=False)
+                    saver = SessionSaver(conn)
+                    with saver.cursor() as cur:
+                        cur.execute(
+                            "CREATE TABLE IF NOT EXISTS chat_sessions "
+                            "(thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+                        )
+                    self._saver = saver
+        return self._saver
+
+    @staticmethod
+    def config(session_id: str) -> dict:
+        return {"configurable": {"thread_id": session_id}}
+
+    def has_history(self, session_id: str) -> bool:
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT 1 FROM chat_sessions WHERE thread_id = ?", (session_id,))
+            return cur.fetchone() is not None
+
+    def touch(self, session_id: str):
+        """Mark *session_id* as used now; starts a background sweep when one is due."""
+        with self.saver.cursor() as cur:
+            cur.execute(
+                "INSERT INTO chat_sessions (thread_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (session_id, time.time()),
+            )
+        if time.monotonic() - self._last_sweep >= settings.CHAT_MEMORY_SWEEP_INTERVAL and not self._sweeping:
+            self._sweeping = True
+            self._last_sweep = time.monotonic()
+            threading.Thread(target=self._background_sweep, name="chat-memory-sweeper", daemon=True).start()
+
+    async def ahas_history(self, session_id: str) -> bool:
+        return await asyncio.to_thread(self.has_history, session_id)
+
+    async def atouch(self, session_id: str):
+        await asyncio.to_thread(self.touch, session_id)
+
+    def _background_sweep(self):
+        try:
+            self.sweep()
+        except Exception:
+            logger.exception("Chat memory sweep failed")
+        finally:
+            self._sweeping = False
+
+    def sweep(self, max_age: float = None) -> dict:
+        """Delete sessions idle for more than *max_age* seconds (default ``CHAT_MEMORY_TTL``)
+        and every checkpoint but the latest of the others; returns what was removed."""
+        max_age = settings.CHAT_MEMORY_TTL if max_age is None else max_age
+        saver = self.saver
+        with saver.cursor() as cur:
+            cur.execute("SELECT thread_id FROM chat_sessions WHERE last_seen < ?", (time.time() - max_age,))
+            expired = [row[0] for row in cur.fetchall()]
+        for thread_id in expired:
+            saver.delete_thread(thread_id)
+            with saver.cursor() as cur:
+                cur.execute("DELETE FROM chat_sessions WHERE thread_id = ?", (thread_id,))
+        with saver.cursor() as cur:
+            # Only the latest checkpoint of a thread is ever read back (ids sort by time)
+            cur.execute(
+                "DELETE FROM checkpoints WHERE checkpoint_id NOT IN "
+                "(SELECT MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id, checkpoint_ns)"
+            )
+            checkpoints = cur.rowcount
+            cur.execute(
+                "DELETE FROM writes WHERE NOT EXISTS (SELECT 1 FROM checkpoints c WHERE "
+                "c.thread_id = writes.thread_id AND c.checkpoint_ns = writes.checkpoint_ns "
+                "AND c.checkpoint_id = writes.checkpoint_id)"
+            )
+        if expired or checkpoints:
+            logger.info("Chat memory sweep: %d sessions expired, %d old checkpoints dropped",
+                        len(expired), checkpoints)
+        return {"sessions": len(expired), "checkpoints": checkpoints}
+
+# Singleton used by the agent
+session_memory = SessionMemory()
@@ -0,0 +1,99 @@
+# agent/name_index.py
+# Built-ins
+import difflib
+import re
+from collections import Counter, defaultdict
+
+from .indexes import CompanyIndex
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def normalize(text: str) -> str:
+    """Lower-case and strip non-alphanumerics so that 'Acme Corp.' ≈ 'acme corp'."""
+    return re.sub(r"[^a-z0-9]", "", (text or "").lower())
+
+def _trigrams(cleaned: str) -> set:
+    """Return the padded trigrams of an already-normalized string."""
+    padded = f"^^{cleaned}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class TrigramIndex(CompanyIndex):
+    """In-process trigram index over normalized company names.
+
+    A typo'd lookup only touches the posting lists of its own trigrams
+    instead of scanning the whole table.
+    """
+
+    fields = ("name",)
+
+    def __init__(self, candidate_limit: int = 50):
+        super().__init__()
+        self.candidate_limit = candidate_limit
+        self._postings = defaultdict(set)   # trigram -> {pk}
+        self._names = {}                    # pk -> normalized name
+
+    # --- maintenance -----------------------------------------------------
+    def _add(self, company):
+        cleaned = normalize(company.name)
+        self._names[company.pk] = cleaned
+        for gram in _trigrams(cleaned):
+            self._postings[gram].add(company.pk)
+
+    def _remove(self, pk):
+        cleaned = self._names.pop(pk, None)
+        if cleaned is None:
+            return
+        for gram in _trigrams(cleaned):
+            bucket = self._postings.get(gram)
+            if bucket is None:
+                continue
+            bucket.discard(pk)
+            if not bucket:
+                del self._postings[gram]
+
+    def _clear(self):
+        self._postings.clear()
+        self._names.clear()
+
+    def upsert(self, company):
+        """Insert or rename a single company (unchanged names are skipped)."""
+        if self._names.get(company.pk) == normalize(company.name):
+            return
+        super().upsert(company)
+
+    # --- lookup ----------------------------------------------------------
+    def best_match(self, name: str, threshold: float = 0.75):
+        """Return ``(pk, ratio)`` of the closest name, or ``None`` below *threshold*.
+
+        Candidates are the names sharing the most trigrams with *name*; only
+        those are re-ranked with :pyclass:`difflib.SequenceMatcher`.
+        """
+        self.ensure_loaded()
+        target = normalize(name)
+        if not target:
+            return None
+
+        with self._lock:
+            overlap = Counter()
+            for gram in _trigrams(target):
+                overlap.update(self._postings.get(gram, ()))
+            candidates = [
+                (pk, self._names[pk]) for pk, _ in overlap.most_common(self.candidate_limit)
+            ]
+
+        best_pk, best_ratio = None, 0.0
+        for pk, cleaned in candidates:
+            ratio = difflib.SequenceMatcher(None, target, cleaned).ratio()
+            if ratio > best_ratio:
+                best_pk, best_ratio = pk, ratio
+        if best_pk is not None and best_ratio >= threshold:
+            return best_pk, best_ratio
+        return None
+
+company_name_index = TrigramIndex()
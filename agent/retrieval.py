@@ -0,0 +1,115 @@
+# agent/retrieval.py
+# Built-ins
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from companies.models import Company
+
+from .indexes import CompanyIndex
+from .snapshot import company_snapshot
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "about", "do", "does", "for", "in", "is", "me",
+    "of", "on", "or", "tell", "the", "to", "what", "which", "who", "with",
+}
+
+def tokenize(text: str) -> list:
+    """Split *text* into lower-case alphanumeric terms, minus stop-words."""
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if t not in _STOPWORDS]
+
+def _document(c: Company) -> list:
+    """Terms indexed for one company. The name is counted twice as a boost."""
+    financials = c.financials if isinstance(c.financials, dict) else {}
+    fin_text = " ".join(f"{k} {v}" for k, v in financials.items())
+    return tokenize(f"{c.name} {c.name} {c.description} {c.sector} {fin_text}")
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class BM25Index(CompanyIndex):
+    """In-process Okapi BM25 index over name/description/sector/financials."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        super().__init__()
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)  # term -> {pk: term frequency}
+        self._lengths = {}                  # pk -> document length
+        self._terms = {}                    # pk -> set of terms (for removal)
+        self._total_length = 0
+
+    # --- maintenance -----------------------------------------------------
+    def _add(self, company: Company):
+        terms = _document(company)
+        counts = Counter(terms)
+        for term, tf in counts.items():
+            self._postings[term][company.pk] = tf
+        self._terms[company.pk] = set(counts)
+        self._lengths[company.pk] = len(terms)
+        self._total_length += len(terms)
+
+    def _remove(self, pk):
+        terms = self._terms.pop(pk, None)
+        if terms is None:
+            return
+        for term in terms:
+            bucket = self._postings.get(term)
+            if bucket is None:
+                continue
+            bucket.pop(pk, None)
+            if not bucket:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(pk, 0)
+
+    def _clear(self):
+        self._postings.clear()
+        self._lengths.clear()
+        self._terms.clear()
+        self._total_length = 0
+
+    # --- search ----------------------------------------------------------
+    def search(self, query: str, k: int = 8) -> list:
+        """Return up to *k* ``(pk, score)`` pairs, best first."""
+        self.ensure_loaded()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return []
+            avgdl = self._total_length / n_docs
+            scores = defaultdict(float)
+            for term in terms:
+                bucket = self._postings.get(term)
+                if not bucket:
+                    continue
+                idf = math.log(1 + (n_docs - len(bucket) + 0.5) / (len(bucket) + 0.5))
+                for pk, tf in bucket.items():
+                    norm = 1 - self.b + self.b * self._lengths[pk] / avgdl
+                    scores[pk] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+company_search_index = BM25Index()
+
+# ---------------------------------------------------------------------------
+# Context building
+# ---------------------------------------------------------------------------
+
+def company_context(query: str, k: int = 8) -> str:
+    """Prompt blocks of the top-*k* companies for *query* (the first *k* by
+    name when nothing matches), served from the snapshot without touching
+    the database."""
+    hits = company_search_index.search(query, k=k)
+    if not hits:
+        return "\n\n".join(company_snapshot.first(k))
+    return "\n\n".join(company_snapshot.blocks([pk for pk, _ in hits]))
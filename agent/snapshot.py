@@ -0,0 +1,138 @@
+# agent/snapshot.py
+# Built-ins
+import heapq
+import logging
+import threading
+from collections import Counter
+
+# Third-party / Django
+from django.conf import settings
+
+from companies.models import Company
+
+from .indexes import CompanyIndex
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Token counting
+# ---------------------------------------------------------------------------
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def count_tokens(text: str) -> int:
+    """Tokens in *text* for the OpenAI models (tiktoken), else a ~4 chars/token estimate."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:  # not installed, or the BPE file can't be downloaded
+                    _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+# ---------------------------------------------------------------------------
+# Snapshot
+# ---------------------------------------------------------------------------
+
+def serialize_company(c: Company) -> str:
+    """The block a company contributes to the chat prompt."""
+    return (
+        f"Company: {c.name}\n"
+        f"Description: {c.description}\n"
+        f"Sector: {c.sector}\n"
+        f"Financials: {c.financials}"
+    )
+
+class CorpusSnapshot(CompanyIndex):
+    """Serialized company corpus, kept in memory for prompt construction.
+
+    Every company's prompt block is formatted (and its tokens counted) once,
+    so building a chat prompt only joins ready-made strings. ``version``
+    increases on each patch. All access goes through one lock, so the
+    snapshot can be shared by threads and ASGI tasks.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._blocks = {}          # pk -> (name, sector, block, tokens)
+        self._sectors = Counter()  # sector -> number of companies
+        self._tokens = 0
+        self._warned = False
+        self.version = 0
+
+    # --- maintenance -----------------------------------------------------
+    def _add(self, c: Company):
+        block = serialize_company(c)
+        tokens = count_tokens(block)
+        self._blocks[c.pk] = (c.name, c.sector, block, tokens)
+        self._sectors[c.sector] += 1
+        self._tokens += tokens
+
+    def _remove(self, pk):
+        entry = self._blocks.pop(pk, None)
+        if entry is None:
+            return
+        _, sector, _, tokens = entry
+        self._sectors[sector] -= 1
+        if not self._sectors[sector]:
+            del self._sectors[sector]
+        self._tokens -= tokens
+
+    def _clear(self):
+        self._blocks.clear()
+        self._sectors.clear()
+        self._tokens = 0
+        self._warned = False
+
+    def _changed(self):
+        self.version += 1
+        limit = settings.CHAT_SNAPSHOT_TOKEN_WARNING
+        if limit and self._tokens > limit and not self._warned:
+            logger.warning(
+                "Company corpus is %d tokens, above CHAT_SNAPSHOT_TOKEN_WARNING (%d)",
+                self._tokens, limit,
+            )
+        self._warned = bool(limit) and self._tokens > limit
+
+    # --- reads -----------------------------------------------------------
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self._blocks)
+
+    def blocks(self, pks) -> list:
+        """Prompt blocks for *pks*, in that order (unknown pks are skipped)."""
+        self.ensure_loaded()
+        with self._lock:
+            return [self._blocks[pk][2] for pk in pks if pk in self._blocks]
+
+    def first(self, k: int) -> list:
+        """Prompt blocks of the first *k* companies by name."""
+        self.ensure_loaded()
+        with self._lock:
+            entries = heapq.nsmallest(k, self._blocks.values(), key=lambda entry: entry[0])
+        return [entry[2] for entry in entries]
+
+    def summary(self, max_sectors: int = 10) -> str:
+        """Compact overview of the whole corpus (total and companies per sector)."""
+        self.ensure_loaded()
+        with self._lock:
+            total = len(self._blocks)
+            sectors = sorted(self._sectors.items(), key=lambda item: (-item[1], item[0] or ""))
+        shown = ", ".join(f"{sector or 'Unknown'} ({n})" for sector, n in sectors[:max_sectors])
+        if len(sectors) > max_sectors:
+            shown += f", and {len(sectors) - max_sectors} more sectors"
+        return f"Total companies: {total}\nCompanies per sector: {shown}"
+
+    def stats(self) -> dict:
+        """Version, number of companies and total token count of the snapshot."""
+        self.ensure_loaded()
+        with self._lock:
+            return {"version": self.version, "companies": len(self._blocks), "tokens": self._tokens}
+
+company_snapshot = CorpusSnapshot()
@@ -0,0 +1,738 @@
+# agent/tests.py
+# Built-ins
+import asyncio
+import copy
+import difflib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+# Third-party / Django
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase
+from langchain_core.runnables import RunnableLambda
+
+from companies.importer import import_companies
+from companies import telemetry
+from companies.models import Company
+from companies.signals import bump_company_data_version, company_data_version
+
+from . import langgraph_agent
+from .admission import LLMGate, LLMOverloaded, _Signal
+from .aggregates import answer_aggregate
+from .cache import ResponseCache
+from .gazetteer import company_gazetteer
+from .llm_factory import (
+    ROUTER_MARKER, CassetteChatModel, CassetteMiss, SimulatedChatModel, _http_client, _PerLoopTransport,
+)
+from .name_index import TrigramIndex, company_name_index, normalize
+from .snapshot import company_snapshot, serialize_company
+from .tools import _aget_company_by_name, _get_company_by_name
+
+# ---------------------------------------------------------------------------
+# Name index
+# ---------------------------------------------------------------------------
+
+class TrigramIndexTests(TestCase):
+    def setUp(self):
+        company_name_index.reset()
+        self.addCleanup(company_name_index.reset)
+        self.companies = {
+            name: Company.objects.create(name=name, description="", sector="Tech", financials={})
+            for name in ("Acme Corp.", "TechFlow Solutions", "Blue Fin Fisheries")
+        }
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Acme Corp."), "acmecorp")
+        self.assertEqual(normalize(None), "")
+
+    def test_typos_match_the_closest_name(self):
+        pk, ratio = company_name_index.best_match("Techflow Solutons")
+        self.assertEqual(pk, self.companies["TechFlow Solutions"].pk)
+        self.assertGreater(ratio, 0.9)
+        self.assertEqual(company_name_index.best_match("acme corp")[0], self.companies["Acme Corp."].pk)
+
+    def test_below_threshold_is_none(self):
+        self.assertIsNone(company_name_index.best_match("Zephyr Dynamics"))
+        self.assertIsNone(company_name_index.best_match("..."))
+        self.assertIsNotNone(company_name_index.best_match("Blue Fin", threshold=0.5))
+        self.assertIsNone(company_name_index.best_match("Blue Fin", threshold=0.9))
+
+    def test_follows_company_writes(self):
+        company = self.companies["Acme Corp."]
+        with self.captureOnCommitCallbacks(execute=True):
+            company.name = "Zenith Labs"
+            company.save()
+        self.assertIsNone(company_name_index.best_match("Acme Corp"))
+        self.assertEqual(company_name_index.best_match("Zenith Lab")[0], company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            company.delete()
+        self.assertIsNone(company_name_index.best_match("Zenith Labs"))
+
+    def test_candidate_limit_bounds_the_rescoring(self):
+        index = TrigramIndex(candidate_limit=1)
+        with mock.patch("agent.name_index.difflib.SequenceMatcher", wraps=difflib.SequenceMatcher) as matcher:
+            self.assertEqual(index.best_match("Blue Fin Fisherie")[0], self.companies["Blue Fin Fisheries"].pk)
+        self.assertEqual(matcher.call_count, 1)
+
+# ---------------------------------------------------------------------------
+# Company lookup tool
+# ---------------------------------------------------------------------------
+
+class CompanyLookupTests(TestCase):
+    cases = {
+        "acme corp.": "Acme Corp.",                   # exact, any case
+        "TechFlow": "TechFlow Solutions",             # substring
+        "Solutions TechFlow": "TechFlow Solutions",   # full-text, words reordered
+        "Blue Fin Fisherys": "Blue Fin Fisheries",    # fuzzy
+    }
+
+    def setUp(self):
+        company_name_index.reset()
+        self.addCleanup(company_name_index.reset)
+        for name in ("Acme Corp.", "TechFlow Solutions", "Blue Fin Fisheries"):
+            Company.objects.create(name=name, description="", sector="Tech", financials={})
+
+    def test_lookup_chain(self):
+        for query, name in self.cases.items():
+            with self.subTest(query=query):
+                self.assertTrue(_get_company_by_name(query).startswith(f"{name} — "))
+        self.assertEqual(_get_company_by_name("Zephyr Dynamics"), "Company not found.")
+
+    async def test_async_lookup_runs_the_same_chain(self):
+        for query in (*self.cases, "Zephyr Dynamics"):
+            with self.subTest(query=query):
+                expected = await sync_to_async(_get_company_by_name)(query)
+                self.assertEqual(await _aget_company_by_name(query), expected)
+
+# ---------------------------------------------------------------------------
+# Gazetteer
+# ---------------------------------------------------------------------------
+
+class GazetteerTests(TestCase):
+    def setUp(self):
+        company_gazetteer.reset()
+        self.addCleanup(company_gazetteer.reset)
+        for name in ("Acme", "Acme Corp.", "Blue Fin", "Zed Labs"):
+            Company.objects.create(name=name, description="", sector="Tech", financials={})
+
+    def test_matches_full_name_on_word_boundaries(self):
+        self.assertEqual(company_gazetteer.match("What does Blue Fin do?"), "Blue Fin")
+        self.assertIsNone(company_gazetteer.match("Tell me about bluefin tuna"))
+
+    def test_nested_mention_gives_way_to_longer_name(self):
+        self.assertEqual(company_gazetteer.match("revenue of acme corp"), "Acme Corp.")
+        self.assertEqual(company_gazetteer.match("revenue of acme"), "Acme")
+
+    def test_names_made_of_common_words_are_left_to_the_router(self):
+        for name in ("Data", "Global Energy", "Apex Capital"):
+            Company.objects.create(name=name, description="", sector="Tech", financials={})
+        self.assertIsNone(company_gazetteer.match("what is the best data strategy"))
+        self.assertIsNone(company_gazetteer.match("which companies work on global energy"))
+        self.assertEqual(company_gazetteer.match("tell me about apex capital"), "Apex Capital")
+
+    def test_two_companies_are_ambiguous(self):
+        self.assertIsNone(company_gazetteer.match("compare Blue Fin and Zed Labs"))
+
+    def test_follows_company_writes(self):
+        self.assertIsNone(company_gazetteer.match("what about Nova Ltd"))
+        with self.captureOnCommitCallbacks(execute=True):
+            company = Company.objects.create(name="Nova Ltd", description="", sector="Tech", financials={})
+        self.assertEqual(company_gazetteer.match("what about Nova Ltd"), "Nova Ltd")
+        with self.captureOnCommitCallbacks(execute=True):
+            company.name = "Nova Group"
+            company.save()
+        self.assertIsNone(company_gazetteer.match("what about Nova Ltd"))
+        self.assertEqual(company_gazetteer.match("what about Nova Group"), "Nova Group")
+        with self.captureOnCommitCallbacks(execute=True):
+            company.delete()
+        self.assertIsNone(company_gazetteer.match("what about Nova Group"))
+
+    def test_uncommitted_writes_are_not_indexed(self):
+        self.assertIsNone(company_gazetteer.match("what about Nova Ltd"))
+        with self.captureOnCommitCallbacks(execute=False):
+            Company.objects.create(name="Nova Ltd", description="", sector="Tech", financials={})
+        self.assertIsNone(company_gazetteer.match("what about Nova Ltd"))
+
+    def test_reloads_after_another_process_writes(self):
+        self.assertIsNone(company_gazetteer.match("what about Nova Ltd"))
+        # As another worker would: no patch reaches this process (bulk_create and update()
+        # send no signals, the delete's on-commit patch never runs here), only the version bump
+        Company.objects.bulk_create([Company(name="Nova Ltd", description="", sector="Tech", financials={})])
+        Company.objects.filter(name="Zed Labs").update(name="Zed Works")
+        Company.objects.filter(name="Blue Fin").delete()
+        bump_company_data_version()
+        self.assertEqual(company_gazetteer.match("what about Nova Ltd"), "Nova Ltd")
+        self.assertIsNone(company_gazetteer.match("what about Blue Fin"))
+        self.assertEqual(company_gazetteer.match("zed works"), "Zed Works")
+
+    def test_own_writes_are_patched_without_a_reload(self):
+        company_gazetteer.match("warm up")
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.create(name="Nova Ltd", description="", sector="Tech", financials={})
+        with self.assertNumQueries(1):  # the data version, no reload
+            self.assertEqual(company_gazetteer.match("what about Nova Ltd"), "Nova Ltd")
+
+        # Behind another worker's write, its own write doesn't make it current
+        Company.objects.filter(name="Zed Labs").update(name="Zed Works")
+        bump_company_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.create(name="Orbit", description="", sector="Tech", financials={})
+        self.assertEqual(company_gazetteer.match("zed works"), "Zed Works")
+
+# ---------------------------------------------------------------------------
+# Response cache
+# ---------------------------------------------------------------------------
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(local_size=16)
+
+    def test_hit_ignores_case_and_punctuation(self):
+        self.cache.set("What is Acme?", "A company.", route="company_query")
+        self.assertEqual(self.cache.get("what is acme"), "A company.")
+        self.assertEqual(self.cache.stats()["local_hits"], 1)
+
+    def test_company_write_invalidates_after_commit(self):
+        self.cache.set("What is Acme?", "A company.")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Company.objects.create(name="Acme", description="", sector="Tech", financials={})
+            # Not bumped before the write commits
+            self.assertEqual(self.cache.get("What is Acme?"), "A company.")
+        self.assertTrue(callbacks)
+        self.assertIsNone(self.cache.get("What is Acme?"))
+
+    def test_answer_is_filed_under_the_version_read_before_answering(self):
+        version = self.cache.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.create(name="Acme", description="", sector="Tech", financials={})
+        self.cache.set("What is Acme?", "Stale answer.", version=version)
+        self.assertIsNone(self.cache.get("What is Acme?"))
+        self.assertEqual(self.cache.get("What is Acme?", version=version), "Stale answer.")
+
+    def test_zero_ttl_route_is_not_cached(self):
+        cache = ResponseCache(local_size=16, ttls={"general_chat": 0})
+        cache.set("hello", "Hi!", route="general_chat")
+        self.assertIsNone(cache.get("hello"))
+
+# ---------------------------------------------------------------------------
+# Templated aggregate answers
+# ---------------------------------------------------------------------------
+
+class AnswerAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rows = (
+            ("Alpha", "Tech", "$2B", 120), ("Bravo", "Tech", "¥5B", 80), ("Charlie", "Energy", "€1.5B", 40),
+            ("Delta", "Energy", "3B$", 300), ("Echo", "Tech", "1500000000", 10),
+        )
+        for name, sector, revenue, employees in rows:
+            Company.objects.create(
+                name=name, description="", sector=sector, financials={"revenue": revenue, "employees": employees},
+            )
+
+    def test_count(self):
+        self.assertEqual(answer_aggregate("How many companies are there?"), "There are 5 companies in the database.")
+        self.assertEqual(answer_aggregate("how many companies in energy"), "There are 2 companies in Energy.")
+
+    def test_list_and_sectors(self):
+        self.assertEqual(answer_aggregate("List all companies in Energy"), "Companies in Energy:\n- Charlie\n- Delta")
+        self.assertEqual(answer_aggregate("Which sectors do you cover?"), "We cover 2 sectors:\n- Tech: 3\n- Energy: 2")
+
+    def test_top_n(self):
+        self.assertEqual(
+            answer_aggregate("top 2 companies by employees"),
+            "Top 2 companies by employees:\n1. Delta — 300\n2. Alpha — 120",
+        )
+        self.assertEqual(
+            answer_aggregate("smallest 1 companies by staff in Tech"),
+            "Lowest 1 companies in Tech by employees:\n1. Echo — 10",
+        )
+
+    def test_threshold_compares_within_the_asked_currency(self):
+        answer = answer_aggregate("Companies with revenue over $1B?")
+        self.assertTrue(answer.startswith("3 companies have revenue over $1B:\n- Alpha\n- Delta\n- Echo"))
+        self.assertIn("2 companies report it in EUR, JPY", answer)
+
+    def test_mixed_currencies_are_noted(self):
+        self.assertIn("without conversion", answer_aggregate("companies with revenue above 1B"))
+        ranked = answer_aggregate("top 3 companies by revenue")
+        self.assertTrue(ranked.startswith("Top 3 companies by revenue:\n1. Delta — $3B\n2. Alpha — $2B\n3. Echo"))
+        self.assertIn("(Only revenue in USD or without a unit is compared", ranked)
+
+    def test_other_metric_shapes(self):
+        self.assertTrue(answer_aggregate("Which company has the most employees?").startswith(
+            "Top 5 companies by employees:\n1. Delta — 300"
+        ))
+        self.assertTrue(answer_aggregate("Largest employers in Tech").startswith(
+            "Top 3 companies in Tech by employees:\n1. Alpha — 120"
+        ))
+        self.assertTrue(answer_aggregate("list energy companies with more than 100 employees").startswith(
+            "1 company in Energy has employees more than 100:\n- Delta"
+        ))
+
+    def test_open_questions_mentioning_a_metric_fall_through(self):
+        for question in (
+            "Has revenue grown over 5 years?",
+            "What is the most important driver of revenue?",
+            "what are the biggest risks for employees in energy",
+            "companies with revenue over 5 years",
+            "top 3 companies by revenue growth",
+            "which companies have the highest revenue and why",
+        ):
+            with self.subTest(question=question):
+                self.assertIsNone(answer_aggregate(question))
+
+    def test_other_questions_fall_through(self):
+        for question in ("What does Alpha do?", "list companies founded by engineers", ""):
+            with self.subTest(question=question):
+                self.assertIsNone(answer_aggregate(question))
+
+# ---------------------------------------------------------------------------
+# LLM admission
+# ---------------------------------------------------------------------------
+
+class LLMGateTests(SimpleTestCase):
+    def _coalesced(self, afunc):
+        """Four concurrent ``acall``s with one key; returns ``(outcomes, calls)``."""
+        gate = LLMGate(max_concurrency=4, max_waiting=4, queue_timeout=1)
+        calls = []
+
+        async def run():
+            release = asyncio.Event()
+
+            async def leader():
+                calls.append(1)
+                await release.wait()
+                return await afunc()
+
+            async def follower():
+                calls.append(1)
+                return "other"
+
+            tasks = [asyncio.ensure_future(gate.acall("prompt", leader))]
+            await asyncio.sleep(0)  # the leader is now in flight
+            tasks += [asyncio.ensure_future(gate.acall("prompt", follower)) for _ in range(3)]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        outcomes = asyncio.run(run())
+        self.assertEqual(gate.stats()["in_flight_keys"], 0)
+        self.assertEqual(gate.stats()["active"], 0)
+        return outcomes, calls
+
+    def test_identical_calls_share_one_flight(self):
+        async def answer():
+            return "answer"
+
+        outcomes, calls = self._coalesced(answer)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [("answer", False)] + [("answer", True)] * 3)
+
+    def test_failure_reaches_every_waiter(self):
+        async def boom():
+            raise RuntimeError("provider down")
+
+        outcomes, calls = self._coalesced(boom)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(o, RuntimeError) for o in outcomes))
+        # Each follower raises its own copy, chained to the leader's error
+        self.assertEqual(len({id(o) for o in outcomes}), 4)
+        self.assertTrue(all(o.__cause__ is outcomes[0] for o in outcomes[1:]))
+
+    def test_follower_gives_up_at_the_deadline(self):
+        gate = LLMGate(max_concurrency=4, max_waiting=4, queue_timeout=0.02, call_timeout=0.03)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return "answer"
+
+        leader = threading.Thread(target=gate.call, args=("prompt", slow))
+        leader.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(LLMOverloaded) as ctx:
+                gate.call("prompt", lambda: "other")
+        finally:
+            release.set()
+            leader.join(5)
+        self.assertEqual(ctx.exception.reason, "queue_timeout")
+
+    def test_overload_errors_survive_copying(self):
+        error = copy.copy(LLMOverloaded("queue_full", 3))
+        self.assertEqual((error.reason, error.retry_after), ("queue_full", 3))
+
+    def test_signal_skips_closed_loops(self):
+        signal = _Signal()
+        loop = asyncio.new_event_loop()
+        signal._futures.append((loop, loop.create_future()))
+        loop.close()
+        signal.set()
+        self.assertTrue(signal.wait(0))
+
+    def test_full_queue_is_refused(self):
+        gate = LLMGate(max_concurrency=1, max_waiting=0, queue_timeout=1)
+        with gate.slot():
+            with self.assertRaises(LLMOverloaded) as ctx:
+                gate.call("prompt", lambda: "answer")
+        self.assertEqual(ctx.exception.reason, "queue_full")
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+
+    def test_queue_deadline(self):
+        gate = LLMGate(max_concurrency=1, max_waiting=1, queue_timeout=0.05)
+        with gate.slot():
+            with self.assertRaises(LLMOverloaded) as ctx:
+                gate.call("prompt", lambda: "answer")
+            self.assertEqual(gate.stats()["waiting"], 0)
+        self.assertEqual(ctx.exception.reason, "queue_timeout")
+        self.assertEqual(gate.stats()["active"], 0)
+
+    def test_slot_passes_to_the_next_caller(self):
+        gate = LLMGate(max_concurrency=1, max_waiting=1, queue_timeout=5)
+        results = []
+        with gate.slot():
+            waiter = threading.Thread(target=lambda: results.append(gate.call(None, lambda: "answer")))
+            waiter.start()
+            while not gate.stats()["waiting"]:
+                time.sleep(0.001)
+        waiter.join(5)
+        self.assertEqual(results, [("answer", False)])
+        self.assertEqual(gate.stats()["active"], 0)
+
+# ---------------------------------------------------------------------------
+# Batch chat
+# ---------------------------------------------------------------------------
+
+class ChatBatchTests(TestCase):
+    def setUp(self):
+        self.turns, self.running, self.peak = [], 0, 0
+        self._lock = threading.Lock()
+        patches = (
+            mock.patch("agent.langgraph_agent.get_app", return_value=RunnableLambda(self._answer)),
+            mock.patch("agent.langgraph_agent.response_cache", ResponseCache(local_size=16)),
+        )
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _answer(self, state):
+        with self._lock:
+            self.turns.append(state["input"])
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.02)
+        with self._lock:
+            self.running -= 1
+        if state["input"] == "boom":
+            raise RuntimeError("LLM failed")
+        return {"output": f"Answer to {state['input']}", "route": "general_chat"}
+
+    def test_duplicates_are_answered_once_in_input_order(self):
+        results = langgraph_agent.run_chat_batch(["Hi there", "boom", "hi there!", "Bye"])
+        self.assertEqual(sorted(self.turns), ["Bye", "Hi there", "boom"])
+        self.assertEqual(results, [
+            {"answer": "Answer to Hi there", "error": None},
+            {"answer": None, "error": "LLM failed"},
+            {"answer": "Answer to Hi there", "error": None},
+            {"answer": "Answer to Bye", "error": None},
+        ])
+
+        # Answers are cached, failures are not
+        self.turns.clear()
+        langgraph_agent.run_chat_batch(["hi there", "boom"])
+        self.assertEqual(self.turns, ["boom"])
+
+    def test_concurrency_is_bounded(self):
+        langgraph_agent.run_chat_batch([f"q{i}" for i in range(8)], max_concurrency=2)
+        self.assertEqual(len(self.turns), 8)
+        self.assertEqual(self.peak, 2)
+
+    async def test_async_batch_is_bounded_too(self):
+        results = await langgraph_agent.arun_chat_batch([f"q{i % 6}" for i in range(12)], max_concurrency=3)
+        self.assertEqual(len(self.turns), 6)
+        self.assertLessEqual(self.peak, 3)
+        self.assertEqual(results[7], {"answer": "Answer to q1", "error": None})
+
+    def test_view_caps_the_request(self):
+        agent = mock.Mock()
+        agent.arun_chat_batch = mock.AsyncMock(return_value=[
+            {"answer": "A", "error": None}, {"answer": None, "error": "LLM failed"},
+        ])
+        with mock.patch("companies.views._agent", return_value=agent), \
+                mock.patch("companies.views.history_writer.arecord_many", new_callable=mock.AsyncMock) as record, \
+                self.settings(CHAT_BATCH_MAX_CONCURRENCY=4, CHAT_BATCH_MAX_MESSAGES=2):
+            response = self.client.post(
+                "/chat/batch/", {"messages": ["a", "b"], "max_concurrency": 50}, content_type="application/json",
+            )
+            too_many = self.client.post("/chat/batch/", {"messages": ["a"] * 3}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(agent.arun_chat_batch.call_args.kwargs["max_concurrency"], 4)
+        self.assertEqual([row.user_message for row in record.call_args.args[0]], ["a"])
+        self.assertEqual(too_many.status_code, 400)
+
+# ---------------------------------------------------------------------------
+# Corpus snapshot
+# ---------------------------------------------------------------------------
+
+class CorpusSnapshotTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("agent.snapshot.count_tokens", side_effect=len)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        company_snapshot.reset()
+        self.addCleanup(company_snapshot.reset)
+        self.snapshot = company_snapshot
+        self.acme = Company.objects.create(name="Acme", description="Widgets", sector="Tech", financials={})
+        Company.objects.create(name="Blue Fin", description="Fish", sector="Food", financials={})
+
+    def test_loads_once(self):
+        company_data_version()
+        with self.assertNumQueries(2):  # the data version and the rows
+            self.assertEqual(self.snapshot.stats()["companies"], 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.snapshot.first(1), [serialize_company(self.acme)])
+
+    def test_writes_patch_blocks_counts_and_tokens(self):
+        stats = self.snapshot.stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme.description = "Widgets and gadgets"
+            self.acme.sector = "Food"
+            self.acme.save()
+        self.assertEqual(self.snapshot.blocks([self.acme.pk]), [serialize_company(self.acme)])
+        self.assertIn("Companies per sector: Food (2)", self.snapshot.summary())
+        patched = self.snapshot.stats()
+        self.assertEqual(patched["version"], stats["version"] + 1)
+        self.assertEqual(patched["tokens"], stats["tokens"] + len(" and gadgets") + len("Food") - len("Tech"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_companies([{"name": "Zed", "description": "", "sector": "Tech", "financials": ""}])
+            self.acme.delete()
+        self.assertEqual(self.snapshot.blocks([self.acme.pk]), [])
+        self.assertEqual(self.snapshot.summary(max_sectors=1),
+                         "Total companies: 2\nCompanies per sector: Food (1), and 1 more sectors")
+
+    def test_unloaded_snapshot_ignores_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme.save()
+        self.assertFalse(self.snapshot._loaded)
+
+    def test_warns_once_above_the_token_budget(self):
+        with self.settings(CHAT_SNAPSHOT_TOKEN_WARNING=10), self.assertLogs("agent.snapshot", "WARNING") as logs:
+            self.snapshot.ensure_loaded()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.acme.save()
+        self.assertEqual(len(logs.output), 1)
+
+# ---------------------------------------------------------------------------
+# HTTP client pooling
+# ---------------------------------------------------------------------------
+
+class PerLoopTransportTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "agent.llm_factory.httpx.AsyncHTTPTransport",
+            side_effect=lambda **kwargs: mock.AsyncMock(name="pool"),
+        )
+        self.pool_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.transport = _PerLoopTransport(limits="limits")
+
+    async def _requests(self, n: int) -> set:
+        for _ in range(n):
+            await self.transport.handle_async_request("request")
+        return set(self.transport._transports.values())
+
+    def test_one_pool_per_loop(self):
+        first = asyncio.run(self._requests(3))
+        self.assertEqual(len(first), 1)
+        second = asyncio.run(self._requests(2))
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first, second)  # the closed loop's pool was dropped
+        self.pool_class.assert_called_with(limits="limits")
+        self.assertEqual(self.pool_class.call_count, 2)
+        self.assertEqual(second.pop().handle_async_request.await_count, 2)
+
+    def test_aclose_closes_the_current_loops_pool(self):
+        async def use_and_close():
+            pool = (await self._requests(1)).pop()
+            await self.transport.aclose()
+            return pool
+
+        pool = asyncio.run(use_and_close())
+        pool.aclose.assert_awaited_once()
+        self.assertEqual(self.transport._transports, {})
+
+    def test_clients_are_shared(self):
+        self.assertIs(_http_client("sync"), _http_client("sync"))
+        self.assertIs(_http_client("async"), _http_client("async"))
+        self.assertIsInstance(_http_client("async")._transport, _PerLoopTransport)
+
+# ---------------------------------------------------------------------------
+# Simulated LLM
+# ---------------------------------------------------------------------------
+
+class SimulatedChatModelTests(SimpleTestCase):
+    router_prompt = f"You are {ROUTER_MARKER} ..."
+
+    def test_router_answers_cycle_through_the_script(self):
+        llm = SimulatedChatModel(routes=["company_query", "general_query"])
+        answers = [json.loads(llm.invoke(self.router_prompt).content)["datasource"] for _ in range(3)]
+        self.assertEqual(answers, ["company_query", "general_query", "company_query"])
+        self.assertEqual(llm.invoke("Hello").content, llm.response)
+
+    def test_timing_and_usage(self):
+        llm = SimulatedChatModel(latency=0.05, tokens_per_second=200, response="one two three four")
+        start = time.perf_counter()
+        message = llm.invoke("x" * 40)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05 + 4 / 200)
+        self.assertEqual(message.usage_metadata["output_tokens"], 4)
+        self.assertEqual(message.usage_metadata["input_tokens"], 10)
+
+    def test_streams_word_by_word(self):
+        llm = SimulatedChatModel(response="one two three")
+
+        async def stream():
+            return [chunk async for chunk in llm.astream("Hello")]
+
+        for chunks in (list(llm.stream("Hello")), asyncio.run(stream())):
+            self.assertEqual([c.content for c in chunks], ["one", " two", " three", ""])
+            self.assertEqual(chunks[-1].usage_metadata["output_tokens"], 3)
+
+# ---------------------------------------------------------------------------
+# LLM cassette
+# ---------------------------------------------------------------------------
+
+class CassetteChatModelTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cassette.jsonl")
+
+    def _record(self, responses):
+        for response in responses:
+            inner = SimulatedChatModel(latency=0.02, response=response)
+            CassetteChatModel(path=self.path, mode="record", inner=inner).invoke("What is Acme?")
+
+    def test_replay_serves_recordings_in_turn(self):
+        self._record(["Acme makes widgets.", "Acme makes gadgets."])
+        replay = CassetteChatModel(path=self.path)
+        start = time.perf_counter()
+        answers = [replay.invoke("What is Acme?") for _ in range(3)]
+        self.assertGreaterEqual(time.perf_counter() - start, 3 * 0.02)  # the recorded latency
+        self.assertEqual([a.content for a in answers],
+                         ["Acme makes widgets.", "Acme makes gadgets.", "Acme makes widgets."])
+        self.assertEqual(answers[0].usage_metadata["output_tokens"], 3)
+        with self.assertRaises(CassetteMiss):
+            replay.invoke("What is Zed?")
+
+    def test_streams_replay_their_chunks(self):
+        inner = SimulatedChatModel(tokens_per_second=100, response="Acme makes widgets.")
+        recorded = [c.content for c in CassetteChatModel(path=self.path, mode="record", inner=inner).stream("Hi")]
+
+        async def replay():
+            return [c.content async for c in CassetteChatModel(path=self.path).astream("Hi")]
+
+        self.assertEqual(asyncio.run(replay()), recorded)
+        self.assertEqual(recorded, ["Acme", " makes", " widgets.", ""])
+
+    def test_unstreamed_recording_streams_as_one_chunk(self):
+        self._record(["Acme makes widgets."])
+        chunks = list(CassetteChatModel(path=self.path).stream("What is Acme?"))
+        self.assertEqual([c.content for c in chunks], ["Acme makes widgets."])
+
+    def test_tools_need_tool_recordings(self):
+        self._record(["Acme makes widgets."])
+        with self.assertRaises(NotImplementedError):
+            CassetteChatModel(path=self.path).bind_tools([])
+
+# ---------------------------------------------------------------------------
+# Speculative company lookup
+# ---------------------------------------------------------------------------
+
+class SpeculativeLookupTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(telemetry.SPECULATIVE_LOOKUPS, "inc")
+        self.outcomes = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _last_outcome(self):
+        return self.outcomes.call_args.kwargs["outcome"]
+
+    def test_only_short_messages_are_looked_up(self):
+        self.assertEqual(langgraph_agent._speculative_name("Tell me about Acme Corp"), "Acme Corp")
+        self.assertIsNone(langgraph_agent._speculative_name("what is the best way to compare all these companies"))
+        with self.settings(CHAT_SPECULATIVE_LOOKUP=False):
+            self.assertIsNone(langgraph_agent._speculative_name("Acme Corp"))
+
+    def test_settle(self):
+        done = Future()
+        done.set_result("Acme — Widgets")
+        self.assertEqual(langgraph_agent._settle(done, "company_query"), {"company": "Acme — Widgets"})
+        self.assertEqual(self._last_outcome(), "used")
+        self.assertEqual(langgraph_agent._settle(done, "general_query"), {})
+        self.assertEqual(self._last_outcome(), "discarded")
+
+        pending = Future()
+        self.assertEqual(langgraph_agent._settle(pending, "general_query"), {})
+        self.assertEqual(self._last_outcome(), "cancelled")
+        self.assertTrue(pending.cancelled())
+
+        failed = Future()
+        failed.set_exception(RuntimeError("database is locked"))
+        with self.assertLogs("agent.langgraph_agent", "WARNING"):
+            self.assertEqual(langgraph_agent._settle(failed, "company_query"), {})
+        self.assertEqual(self._last_outcome(), "failed")
+
+    def test_asettle(self):
+        async def settle(route, result=None, finish=True):
+            async def lookup():
+                if not finish:
+                    await asyncio.sleep(10)
+                if isinstance(result, Exception):
+                    raise result
+                return result
+
+            task = asyncio.ensure_future(lookup())
+            await asyncio.sleep(0)
+            update = await langgraph_agent._asettle(task, route)
+            return update, task
+
+        update, _ = asyncio.run(settle("company_query", "Acme — Widgets"))
+        self.assertEqual((update, self._last_outcome()), ({"company": "Acme — Widgets"}, "used"))
+        update, task = asyncio.run(settle("general_query", finish=False))
+        self.assertEqual((update, self._last_outcome()), ({}, "cancelled"))
+        self.assertTrue(task.cancelled())
+        update, _ = asyncio.run(settle("general_query", RuntimeError("boom")))
+        self.assertEqual((update, self._last_outcome()), ({}, "discarded"))
+        with self.assertLogs("agent.langgraph_agent", "WARNING"):
+            update, _ = asyncio.run(settle("company_query", RuntimeError("boom")))
+        self.assertEqual((update, self._last_outcome()), ({}, "failed"))
+
+    def test_lookup_runs_while_the_router_decides(self):
+        started = threading.Event()
+
+        def lookup(name):
+            started.set()
+            return f"{name} — Widgets"
+
+        def route(_):
+            # The lookup is already running while the router waits on the LLM
+            self.assertTrue(started.wait(5))
+            return mock.Mock(datasource="company_query")
+
+        router = mock.Mock()
+        router.invoke.side_effect = route
+        with mock.patch("agent.langgraph_agent.company_gazetteer.match", return_value=None), \
+                mock.patch("agent.langgraph_agent.answer_aggregate", return_value=None), \
+                mock.patch("agent.langgraph_agent.get_router_chain", return_value=router), \
+                mock.patch("agent.langgraph_agent._get_company_by_name", side_effect=lookup), \
+                mock.patch("agent.langgraph_agent.close_old_connections"):
+            update = langgraph_agent.route_message({"input": "Tell me about Acme Corp"})
+        self.assertEqual(update, {"route": "company_query", "company": "Acme Corp — Widgets"})
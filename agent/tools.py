@@ -1,20 +1,18 @@
 # agent/tools.py
-# Built-ins
-import difflib
-import re
-
 # Third-party / Django
+from asgiref.sync import sync_to_async
 from companies.models import Company
+from companies.telemetry import TOOL_SECONDS
+from companies.search import ranked_search
 from langchain.tools import StructuredTool
 
+# Local
+from .name_index import company_name_index
+
 # ---------------------------------------------------------------------------
 # Helper
 # ---------------------------------------------------------------------------
 
-def _clean(text: str) -> str:
-    """Lower-case and strip non-alphanumerics so that 'Acme Corp.' ≈ 'acme corp'."""
-    return re.sub(r"[^a-z0-9]", "", text.lower())
-
 def _format_company(c: Company) -> str:
     """Return a concise multi-line description for the chatbot."""
     return (
@@ -33,7 +31,10 @@ def _get_company_by_name(name: str) -> str:
     The search strategy is:
     1. Exact case-insensitive match (fast).
     2. `icontains` fallback (partial substring).
-    3. Fuzzy match using :pymod:`difflib` in case of typos like *Acme Crop*.
+    3. Full-text match on the name, so word order and partial words are
+       tolerated (*Solutions TechFlow*).
+    4. Fuzzy match in case of typos like *Acme Crop*: a trigram index narrows
+       the candidates, :pymod:`difflib` ranks them.
     """
 
     # --- 1. Exact (case-insensitive) --------------------------------------
@@ -48,23 +49,33 @@ def _get_company_by_name(name: str) -> str:
     if qs.exists():
         return _format_company(qs.first())
 
-    # --- 3. Fuzzy match ---------------------------------------------------
-    cleaned_target = _clean(name)
-    best_ratio = 0.0
-    best_company = None
-    for c in Company.objects.all():
-        ratio = difflib.SequenceMatcher(None, cleaned_target, _clean(c.name)).ratio()
-        if ratio > best_ratio:
-            best_ratio = ratio
-            best_company = c
-    if best_company and best_ratio >= 0.75:  # 0.75 is permissive but avoids randoms
-        return _format_company(best_company)
+    # --- 3. Full-text ----------------------------------------------------
+    with TOOL_SECONDS.time(tool="full_text"):
+        hits = ranked_search(name, limit=1, name_only=True)
+    if hits:
+        c = Company.objects.filter(pk=hits[0][0]).first()
+        if c:
+            return _format_company(c)
+
+    # --- 4. Fuzzy match ---------------------------------------------------
+    with TOOL_SECONDS.time(tool="fuzzy_match"):
+        match = company_name_index.best_match(name, threshold=0.75)  # 0.75 is permissive but avoids randoms
+    if match:
+        c = Company.objects.filter(pk=match[0]).first()
+        if c:
+            return _format_company(c)
 
     # --- None found -------------------------------------------------------
     return "Company not found."
 
+async def _aget_company_by_name(name: str) -> str:
+    """Async version of :func:`_get_company_by_name`: the same lookup chain,
+    run off the event loop (several queries, and the index's lazy load)."""
+    return await sync_to_async(_get_company_by_name)(name)
+
 get_company_tool = StructuredTool.from_function(
     name        = "get_company_info",
     description = "Look up a company profile by name in the internal database.",
     func        = _get_company_by_name,
+    coroutine   = _aget_company_by_name,
 )
\ No newline at end of file
@@ -1,20 +1,42 @@
 from django.contrib import admin
-from .models import Company, ChatHistory
+from .models import Company, CompanyMetric, ChatHistory, ImportJob
 
 # Register your models here.
 
+class CompanyMetricInline(admin.TabularInline):
+    """Read-only: metrics are derived from ``financials`` on save."""
+    model = CompanyMetric
+    fields = ['metric', 'value', 'unit', 'raw']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
     list_display = ['name', 'sector', 'description']
     search_fields = ['name', 'sector']
     list_filter = ['sector']
+    inlines = [CompanyMetricInline]
 
 @admin.register(ChatHistory)
 class ChatHistoryAdmin(admin.ModelAdmin):
     list_display = ['timestamp', 'user_message', 'bot_response', 'session_id']
     list_filter = ['timestamp']
-    search_fields = ['user_message', 'bot_response', 'session_id']
-    readonly_fields = ['timestamp']
+    search_fields = ['user_message', 'bot_response', 'session_id', 'trace_id']
+    readonly_fields = ['timestamp', 'trace_id']
     
     def get_queryset(self, request):
         return super().get_queryset(request).order_by('-timestamp')
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """Read-only view of background CSV imports."""
+    list_display = ['created_at', 'file_name', 'status', 'rows_processed', 'error_count']
+    list_filter = ['status']
+    readonly_fields = [f.name for f in ImportJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -5,5 +5,7 @@ class CompaniesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'companies'
 
-
-
+    def ready(self):
+        from . import checks  # noqa: F401  (registers the system checks)
+        from . import signals  # noqa: F401  (connects the receivers)
+        from . import telemetry  # noqa: F401  (counts DB queries per chat trace)
@@ -0,0 +1,24 @@
+# companies/checks.py
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+@register(Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+    """The Company data version lives in the default cache, so workers must share it."""
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in PER_PROCESS_CACHES:
+        return []
+    return [Warning(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint=(
+            "With more than one worker, a Company write handled by one worker leaves the others "
+            "serving stale cached answers and 304s. Use the database (the default), Redis or "
+            "Memcached cache."
+        ),
+        id="companies.W001",
+    )]
@@ -0,0 +1,176 @@
+# companies/export.py
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+from datetime import datetime, time as dt_time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .pagination import decode_cursor, encode_position
+
+COMPANY_FIELDS = ["id", "name", "description", "sector", "financials", "updated_at"]
+HISTORY_FIELDS = ["id", "timestamp", "session_id", "user_message", "bot_response", "trace_id"]
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+class _Encoder:
+    """Turns batches of ``values_list`` rows into CSV or NDJSON bytes, optionally gzipped.
+
+    CSV cells hold datetimes as ISO 8601 and ``financials`` as JSON, so a
+    companies export can be uploaded again as is.
+    """
+
+    def __init__(self, fields: list, fmt: str, compress: bool):
+        self.fields = fields
+        self.fmt = fmt
+        self._gzip = zlib.compressobj(wbits=31) if compress else None  # 31: gzip container
+
+    def _out(self, text: str) -> bytes:
+        data = text.encode()
+        return self._gzip.compress(data) if self._gzip else data
+
+    def header(self) -> bytes:
+        if self.fmt != "csv":
+            return b""
+        return self._out(",".join(self.fields) + "\r\n")
+
+    def rows(self, rows: list) -> bytes:
+        if self.fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow([_cell(value) for value in row])
+            return self._out(buffer.getvalue())
+        return self._out("".join(
+            json.dumps(dict(zip(self.fields, row)), cls=DjangoJSONEncoder) + "\n" for row in rows
+        ))
+
+    def end(self) -> bytes:
+        return self._gzip.flush() if self._gzip else b""
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+def _stream(queryset, encoder: _Encoder, chunk_size: int):
+    """Encoded chunks of *queryset*, read *chunk_size* rows at a time."""
+    yield encoder.header()
+    batch = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield encoder.rows(batch)
+            batch = []
+    if batch:
+        yield encoder.rows(batch)
+    yield encoder.end()
+
+def _take(rows, n: int) -> list:
+    return list(islice(rows, n))
+
+async def _astream(queryset, encoder: _Encoder, chunk_size: int):
+    """Async version of :func:`_stream` (ASGI serves async iterators without a thread).
+
+    Each chunk is fetched in a worker thread. ``aiterator()`` can't be used:
+    for ``values_list`` querysets it runs the query in the event loop.
+    """
+    yield encoder.header()
+    rows = queryset.iterator(chunk_size=chunk_size)  # lazy: the query runs on the first fetch
+    try:
+        while True:
+            batch = await sync_to_async(_take)(rows, chunk_size)
+            if batch:
+                yield encoder.rows(batch)
+            if len(batch) < chunk_size:
+                break
+    finally:
+        await sync_to_async(rows.close)()
+    yield encoder.end()
+
+# ---------------------------------------------------------------------------
+# Requests
+# ---------------------------------------------------------------------------
+
+def _parse_bound(name: str, value: str) -> datetime:
+    """An ISO date or datetime; dates mean midnight, naive values the current time zone."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, dt_time.min) if day else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{name} must be an ISO date or datetime")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+def export_response(request, queryset, fields: list, order_field: str, name: str) -> StreamingHttpResponse:
+    """Stream *queryset* as CSV or NDJSON in ``(order_field, id)`` order.
+
+    Query params: ``format`` (``csv`` or ``ndjson``), ``gzip=1``, ``start``
+    (inclusive) and ``end`` (exclusive) bounds on *order_field*, and
+    ``since``, the ``X-Next-Cursor`` of a previous export, to get only the
+    rows added or changed after it. The export stops at the newest row
+    that existed when it started (minus ``EXPORT_CURSOR_LAG`` seconds, so
+    rows stamped but not yet committed are left for the next run); that
+    position is the ``X-Next-Cursor`` of the response. Rows are read
+    ``EXPORT_CHUNK_SIZE`` at a time. Raises ``ValueError`` for bad params.
+    """
+    params = request.GET
+    fmt = params.get("format") or "csv"
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    compress = params.get("gzip", "").lower() in ("1", "true", "yes")
+
+    if params.get("start"):
+        queryset = queryset.filter(**{f"{order_field}__gte": _parse_bound("start", params["start"])})
+    if params.get("end"):
+        queryset = queryset.filter(**{f"{order_field}__lt": _parse_bound("end", params["end"])})
+    since = params.get("since")
+    if since:
+        value, pk = decode_cursor(since)
+        queryset = queryset.filter(Q(**{f"{order_field}__gt": value}) | Q(**{order_field: value, "id__gt": pk}))
+
+    # Pin the end of the export, so rows written while it streams go to the next one
+    queryset = queryset.filter(
+        **{f"{order_field}__lte": timezone.now() - timedelta(seconds=settings.EXPORT_CURSOR_LAG)}
+    )
+    last = queryset.order_by(f"-{order_field}", "-id").values_list(order_field, "id").first()
+    if last is not None:
+        value, pk = last
+        queryset = queryset.filter(Q(**{f"{order_field}__lt": value}) | Q(**{order_field: value, "id__lte": pk}))
+    rows = queryset.order_by(order_field, "id").values_list(*fields)
+
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    encoder = _Encoder(fields, fmt, compress)
+    stream = _astream if isinstance(request, ASGIRequest) else _stream
+    content_type, extension = FORMATS[fmt]
+    filename = f"{name}-{timezone.now():%Y%m%dT%H%M%S}.{extension}"
+    if compress:
+        content_type, filename = "application/gzip", f"{filename}.gz"
+
+    response = StreamingHttpResponse(stream(rows, encoder, chunk_size), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    next_cursor = encode_position(*last) if last is not None else since
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return response
@@ -0,0 +1,133 @@
+# companies/history.py
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import ChatHistory
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter:
+    """Write-behind buffer for ChatHistory rows.
+
+    Requests only enqueue the row; a background thread writes queued rows
+    with one ``bulk_create`` once *flush_size* rows are waiting or
+    *flush_interval* seconds have passed. The queue is drained on interpreter
+    shutdown. When write-behind is disabled, or the queue is full, rows are
+    written synchronously instead.
+    """
+
+    def __init__(self, enabled: bool = True, flush_size: int = 100,
+                 flush_interval: float = 1.0, max_queue: int = 10000):
+        self.enabled = enabled
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # --- lifecycle -------------------------------------------------------
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="chat-history-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background thread and write whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            while self._queue.qsize() < self.flush_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, 0.05))
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    # --- writing ---------------------------------------------------------
+    def _drain(self) -> list:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _write(self, rows: list):
+        try:
+            ChatHistory.objects.bulk_create(rows, batch_size=500)
+        except Exception:
+            logger.exception("Failed to write %d chat history rows", len(rows))
+
+    def flush(self) -> int:
+        """Write all queued rows now, on the calling thread's connection; returns how many were written."""
+        rows = self._drain()
+        if rows:
+            self._write(rows)
+        return len(rows)
+
+    def record_many(self, rows: list):
+        """Queue unsaved ChatHistory instances (or write them if disabled/full)."""
+        if not self.enabled:
+            ChatHistory.objects.bulk_create(rows)
+            return
+        self._ensure_started()
+        overflow = []
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                overflow.append(row)
+        if overflow:
+            ChatHistory.objects.bulk_create(overflow)
+
+    def record(self, user_message: str, bot_response: str, session_id: str = None,
+               trace_id: str = None):
+        """Queue one chat turn. The timestamp is taken now, not at flush time."""
+        self.record_many([ChatHistory(
+            user_message=user_message, bot_response=bot_response, session_id=session_id,
+            trace_id=trace_id,
+        )])
+
+    async def arecord_many(self, rows: list):
+        """Async version of :meth:`record_many`."""
+        if self.enabled and self._thread is not None and self._queue.qsize() + len(rows) <= self._queue.maxsize:
+            self.record_many(rows)  # only enqueues, never touches the database
+        else:
+            await sync_to_async(self.record_many)(rows)
+
+    async def arecord(self, user_message: str, bot_response: str, session_id: str = None,
+                      trace_id: str = None):
+        """Async version of :meth:`record`."""
+        await self.arecord_many([ChatHistory(
+            user_message=user_message, bot_response=bot_response, session_id=session_id,
+            trace_id=trace_id,
+        )])
+
+history_writer = HistoryWriter(
+    enabled=settings.CHAT_HISTORY_WRITE_BEHIND,
+    flush_size=settings.CHAT_HISTORY_FLUSH_SIZE,
+    flush_interval=settings.CHAT_HISTORY_FLUSH_INTERVAL,
+)
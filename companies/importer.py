@@ -0,0 +1,135 @@
+# companies/importer.py
+import ast
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Company
+from .signals import companies_bulk_upserted
+
+UPDATE_FIELDS = ["description", "sector", "financials"]
+NAME_MAX_LENGTH = Company._meta.get_field("name").max_length
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def parse_financials(raw: str) -> dict:
+    """Parse the ``financials`` column without evaluating code.
+
+    Accepts JSON (``{"revenue": "5B$"}``) and, for older exports, Python
+    literal syntax (``{'revenue': '5B$'}``).
+    """
+    if not raw or not raw.strip():
+        return {}
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        try:
+            value = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            raise ValueError(f"invalid financials: {raw!r}")
+    if not isinstance(value, dict):
+        raise ValueError("financials must be an object")
+    return value
+
+def iter_csv_rows(lines):
+    """Yield dict rows from an iterable of raw CSV byte lines.
+
+    Lines are decoded one at a time (a Django ``UploadedFile`` iterates its
+    chunks line by line), so the file is never held in memory as a whole.
+    """
+    def decoded():
+        for i, line in enumerate(lines):
+            yield line.decode("utf-8-sig" if i == 0 else "utf-8")
+
+    yield from csv.DictReader(decoded())
+
+def company_from_row(row: dict) -> Company:
+    """Build an unsaved Company from a CSV row; raises ``ValueError``."""
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f"name longer than {NAME_MAX_LENGTH} characters")
+    return Company(
+        name=name,
+        description=row.get("description") or "",
+        sector=row.get("sector") or "",
+        financials=parse_financials(row.get("financials")),
+    )
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+
+def _flush(batch: dict, only_changed: bool, result: dict):
+    """Upsert one batch: one SELECT for the existing rows, one INSERT … ON CONFLICT."""
+    existing = {
+        c.name: c for c in Company.objects.filter(name__in=list(batch)).only("name", *UPDATE_FIELDS)
+    }
+    to_write = []
+    for name, company in batch.items():
+        old = existing.get(name)
+        if old is None:
+            result["created"] += 1
+        elif all(getattr(old, f) == getattr(company, f) for f in UPDATE_FIELDS):
+            result["unchanged"] += 1
+            if only_changed:
+                continue
+        else:
+            result["updated"] += 1
+        to_write.append(company)
+
+    if not to_write:
+        return
+    with transaction.atomic():
+        Company.objects.bulk_create(
+            to_write,
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=UPDATE_FIELDS + ["updated_at"],
+        )
+    companies_bulk_upserted.send(sender=Company, instances=to_write)
+
+def import_companies(rows, batch_size: int = None, only_changed: bool = False,
+                     max_errors: int = 100, progress=None, result: dict = None,
+                     first_row: int = 1) -> dict:
+    """Upsert companies from an iterable of CSV dict rows in batches.
+
+    Existing companies (matched by name) are updated. With *only_changed*,
+    rows identical to what is stored are skipped instead of rewritten. At
+    most one batch is held in memory, and at most *max_errors* messages are
+    kept (``error_count`` has the total).
+
+    ``progress(rows, result)`` is called after every committed batch with
+    the number of the last row read. A resumed import passes the counts so
+    far as *result* and the number of its first row as *first_row*.
+    """
+    batch_size = batch_size or settings.CSV_IMPORT_BATCH_SIZE
+    result = result or {"created": 0, "updated": 0, "unchanged": 0, "errors": [], "error_count": 0}
+
+    batch = {}
+    index = first_row - 1
+    for index, row in enumerate(rows, start=first_row):
+        try:
+            company = company_from_row(row)
+        except ValueError as e:
+            result["error_count"] += 1
+            if len(result["errors"]) < max_errors:
+                result["errors"].append(f"Row {index}: {e}")
+            continue
+        batch[company.name] = company  # the last occurrence of a name wins
+        if len(batch) >= batch_size:
+            _flush(batch, only_changed, result)
+            batch = {}
+            if progress:
+                progress(index, result)
+    if batch:
+        _flush(batch, only_changed, result)
+    if progress:
+        progress(index, result)
+
+    return result
@@ -0,0 +1,285 @@
+# companies/jobs.py
+import atexit
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .importer import import_companies, iter_csv_rows
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+class _OffsetReader:
+    """Byte lines of a spooled CSV from *offset* on (after its header line).
+
+    ``offset`` always points just past the last line handed out. The csv
+    module pulls lines only as it needs them, so right after a row is
+    yielded it is the byte position where the next row starts.
+    """
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            header = f.readline()
+            yield header
+            self.offset = max(self.offset, len(header))
+            f.seek(self.offset)
+            for line in f:
+                self.offset += len(line)
+                yield line
+
+class _Interrupted(Exception):
+    """The running import must stop: the process is exiting, or another one took the job over."""
+
+class ImportJobRunner:
+    """Runs :class:`ImportJob` imports on ``CSV_IMPORT_WORKERS`` daemon threads.
+
+    After every committed batch the job's byte offset and counts are saved,
+    so an interrupted job continues from its last checkpoint. Each process
+    has an owner token (host, pid and a random part) that it stamps on the
+    jobs it runs, and a monitor thread that refreshes their ``updated_at``
+    every ``CSV_IMPORT_HEARTBEAT_SECONDS`` and re-queues jobs whose owner is
+    gone: dead on this host, or silent for ``CSV_IMPORT_STALE_SECONDS``.
+    A job is claimed with a compare-and-set on ``(status, updated_at)``, so
+    only one process runs it; a worker that loses its job stops at the
+    next checkpoint. Nothing starts until a job is submitted or
+    :meth:`ensure_resumed` is called (the upload views do), so importing the
+    app, running management commands or forking workers starts no thread.
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()  # (job id, status, updated_at), or None to stop a worker
+        self._workers = []
+        self._pending = set()  # ids submitted to the pool and not finished
+        self._stopping = threading.Event()
+        self._monitor = None
+
+    def _start_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers or self._stopping.is_set():
+                return
+            # Daemon threads: interpreter exit doesn't wait for them, shutdown() stops them
+            self._workers = [
+                threading.Thread(target=self._work, name=f"csv-import-{i}", daemon=True)
+                for i in range(max(settings.CSV_IMPORT_WORKERS, 1))
+            ]
+            for worker in self._workers:
+                worker.start()
+        atexit.register(self.shutdown)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None or self._stopping.is_set():
+                return
+            self._run(*item)
+
+    def shutdown(self, timeout: float = None):
+        """Stop running imports after their current batch and drop queued ones (both resume later).
+
+        Waits up to *timeout* (default ``CSV_IMPORT_SHUTDOWN_TIMEOUT``) seconds
+        for the running batches. Registered with :mod:`atexit`; a server hook
+        such as gunicorn's ``worker_exit`` can call it earlier.
+        """
+        self._stopping.set()
+        for _ in self._workers:
+            self._queue.put(None)
+        deadline = time.monotonic() + (settings.CSV_IMPORT_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+
+    # --- submitting ------------------------------------------------------
+    def spool(self, uploaded_file, batch_size: int, only_changed: bool) -> ImportJob:
+        """Write an upload to the spool directory and queue a job for it."""
+        os.makedirs(settings.CSV_IMPORT_SPOOL_DIR, exist_ok=True)
+        job = ImportJob(file_name=uploaded_file.name, batch_size=batch_size, only_changed=only_changed)
+        job.path = os.path.join(settings.CSV_IMPORT_SPOOL_DIR, f"{job.id}.csv")
+        with open(job.path, "wb") as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+        job.size = os.path.getsize(job.path)
+        job.save()
+        self.submit(job)
+        return job
+
+    def submit(self, job: ImportJob):
+        with self._lock:
+            if job.pk in self._pending or self._stopping.is_set():
+                return
+            self._pending.add(job.pk)
+        self._start_workers()
+        self._queue.put((job.pk, job.status, job.updated_at))
+
+    def _owner_alive(self, owner: str):
+        """Whether the process behind *owner* still runs; ``None`` when it is on another host."""
+        if owner == self.owner:
+            return True
+        try:
+            host, pid, _ = owner.rsplit(":", 2)
+            pid = int(pid)
+        except ValueError:
+            return False
+        if host != socket.gethostname():
+            return None
+        if pid == os.getpid():
+            return False  # an earlier run of this process (e.g. a restarted container)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass  # exists, owned by another user
+        return True
+
+    def resume(self) -> int:
+        """Queue jobs left queued, and running jobs whose owner is dead or has not
+        sent a heartbeat for ``CSV_IMPORT_STALE_SECONDS``; returns how many."""
+        stale = timezone.now() - timedelta(seconds=settings.CSV_IMPORT_STALE_SECONDS)
+        resumed = 0
+        for job in ImportJob.objects.filter(status__in=[ImportJob.QUEUED, ImportJob.RUNNING]):
+            if job.pk in self._pending:
+                continue
+            if job.status == ImportJob.RUNNING and job.updated_at >= stale and self._owner_alive(job.owner) is not False:
+                continue
+            logger.info("Resuming CSV import %s from byte %d", job.pk, job.offset)
+            self.submit(job)
+            resumed += 1
+        return resumed
+
+    def heartbeat(self) -> int:
+        """Refresh ``updated_at`` of the jobs this process is running."""
+        return ImportJob.objects.filter(status=ImportJob.RUNNING, owner=self.owner).update(
+            updated_at=timezone.now()
+        )
+
+    def ensure_resumed(self):
+        """Resume interrupted jobs and start the monitor thread, once per process."""
+        if self._monitor is not None:
+            return
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self._monitor = threading.Thread(target=self._watch, name="csv-import-monitor", daemon=True)
+        try:
+            self.resume()
+        except Exception:
+            logger.exception("Could not resume CSV import jobs")
+        self._monitor.start()
+
+    def _watch(self):
+        while not self._stopping.wait(settings.CSV_IMPORT_HEARTBEAT_SECONDS):
+            close_old_connections()
+            try:
+                self.heartbeat()
+                self.resume()
+            except Exception:
+                logger.exception("CSV import monitor failed")
+            finally:
+                close_old_connections()
+
+    # --- running ---------------------------------------------------------
+    def _run(self, job_id, status: str, updated_at):
+        close_old_connections()
+        try:
+            if self._stopping.is_set():
+                return
+            claimed = ImportJob.objects.filter(pk=job_id, status=status, updated_at=updated_at).update(
+                status=ImportJob.RUNNING, owner=self.owner, updated_at=timezone.now()
+            )
+            if not claimed:
+                return  # finished, or claimed by another worker or process
+            self._import(ImportJob.objects.get(pk=job_id))
+        except _Interrupted as e:
+            logger.info("CSV import %s stopped: %s", job_id, e)
+        except Exception:
+            logger.exception("CSV import %s failed", job_id)
+        finally:
+            with self._lock:
+                self._pending.discard(job_id)
+            close_old_connections()
+
+    def _import(self, job: ImportJob):
+        reader = _OffsetReader(job.path, job.offset)
+        start, first_row = time.perf_counter(), job.rows_processed + 1
+        last = {"rows": job.rows_processed}
+        result = {
+            "created": job.created, "updated": job.updated, "unchanged": job.unchanged,
+            "errors": list(job.errors), "error_count": job.error_count,
+        }
+        mine = ImportJob.objects.filter(pk=job.pk, owner=self.owner)
+
+        def checkpoint(rows: int, result: dict, **fields):
+            last["rows"] = rows
+            elapsed = time.perf_counter() - start
+            saved = mine.update(
+                offset=reader.offset,
+                rows_processed=rows,
+                rows_per_second=round((rows - first_row + 1) / elapsed, 1) if elapsed else 0,
+                created=result["created"],
+                updated=result["updated"],
+                unchanged=result["unchanged"],
+                error_count=result["error_count"],
+                errors=result["errors"],
+                updated_at=timezone.now(),
+                **fields,
+            )
+            if not saved:
+                raise _Interrupted("taken over by another process")
+            if self._stopping.is_set() and not fields:
+                raise _Interrupted("shutting down")
+
+        try:
+            result = import_companies(
+                iter_csv_rows(reader),
+                batch_size=job.batch_size,
+                only_changed=job.only_changed,
+                progress=checkpoint,
+                result=result,
+                first_row=first_row,
+            )
+        except _Interrupted:
+            raise  # the checkpoint stands; the job is resumed from it
+        except Exception as e:
+            mine.update(
+                status=ImportJob.FAILED, message=f"Error processing CSV: {e}",
+                updated_at=timezone.now(), finished_at=timezone.now(),
+            )
+            self._discard(job)
+            raise
+        checkpoint(
+            last["rows"], result,
+            status=ImportJob.SUCCEEDED,
+            finished_at=timezone.now(),
+            message=(
+                f"Successfully imported {result['created']} companies "
+                f"({result['updated']} updated, {result['unchanged']} unchanged)"
+            ),
+        )
+        self._discard(job)
+
+    @staticmethod
+    def _discard(job: ImportJob):
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+
+# Singleton used by the upload views
+import_jobs = ImportJobRunner()
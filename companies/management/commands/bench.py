@@ -0,0 +1,245 @@
+# companies/management/commands/bench.py
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from companies.history import history_writer
+from companies.importer import import_companies, iter_csv_rows
+from companies.models import ChatHistory, Company
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+_SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+_CORES = ["Dynamics", "Systems", "Labs", "Networks", "Analytics", "Robotics", "Energy", "Foods"]
+_SUFFIXES = ["Inc", "Group", "Holdings", "Partners", "Corp"]
+_SECTORS = [
+    "Technology", "Manufacturing", "Energy", "Healthcare", "Finance", "Retail",
+    "Logistics", "Agriculture", "Media", "Telecommunications", "Construction", "Education",
+]
+
+def _word(i: int) -> str:
+    """Unique pronounceable word for index *i* ("Bakodi")."""
+    parts, i = [], i + len(_SYLLABLES) ** 2  # at least three syllables
+    while i:
+        i, r = divmod(i, len(_SYLLABLES))
+        parts.append(_SYLLABLES[r])
+    return "".join(parts).capitalize()
+
+def company_name(i: int) -> str:
+    return f"{_word(i)} {_CORES[i % len(_CORES)]} {_SUFFIXES[i % len(_SUFFIXES)]}"
+
+def csv_lines(start: int, stop: int, rng: random.Random):
+    """CSV (as byte lines, like an upload) for synthetic companies *start*..*stop*-1."""
+    yield b"name,description,sector,financials\n"
+    for i in range(start, stop):
+        financials = json.dumps({
+            "revenue": f"{rng.randint(1, 900)}M$", "employees": rng.randint(10, 50000)
+        }).replace('"', '""')
+        sector = _SECTORS[i % len(_SECTORS)]
+        yield (
+            f'{company_name(i)},"{_word(i)} builds {_CORES[i % len(_CORES)].lower()} products '
+            f'for the {sector.lower()} market.",{sector},"{financials}"\n'
+        ).encode()
+
+def _typo(name: str, rng: random.Random) -> str:
+    """Swap two adjacent letters of the first word."""
+    word, rest = name.split(" ", 1)
+    i = rng.randrange(1, len(word) - 1)
+    return f"{word[:i]}{word[i + 1]}{word[i]}{word[i + 2:]} {rest}"
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def _percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+def measure(func, args_list: list) -> dict:
+    """Call *func* once per argument tuple; throughput and latency percentiles (ms)."""
+    durations = []
+    start = time.perf_counter()
+    for args in args_list:
+        t0 = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    ordered = sorted(durations)
+    return {
+        "count": len(durations),
+        "throughput_per_s": round(len(durations) / total, 2) if total else None,
+        "mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 3),
+    }
+
+# ---------------------------------------------------------------------------
+# Command
+# ---------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the chat agent, company lookups, CSV import and history endpoints "
+        "against synthetic companies in a throwaway test database, with a simulated "
+        "LLM. Prints throughput and p50/p95/p99 latencies as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Comma-separated corpus sizes, run in increasing order.")
+        parser.add_argument("--requests", type=int, default=200, help="Calls per scenario.")
+        parser.add_argument("--llm-latency", type=float, default=0.05,
+                            help="Simulated LLM latency per call, in seconds.")
+        parser.add_argument("--tokens-per-second", type=float, default=0,
+                            help="Simulated LLM output speed (0 = instant).")
+        parser.add_argument("--router-script", default="general_query",
+                            help="Comma-separated router answers, cycled (e.g. general_query,company_query).")
+        parser.add_argument("--history-rows", type=int, default=10000,
+                            help="ChatHistory rows to seed for the history scenarios.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(s) for s in options["sizes"].split(",") if s.strip()})
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        if not sizes or options["requests"] < 1:
+            raise CommandError("Need at least one size and one request per scenario")
+
+        # A throwaway database, like the test runner: real data is never touched
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Sessions go to a throwaway store too
+            with tempfile.TemporaryDirectory() as tmp, \
+                    override_settings(CHAT_MEMORY_PATH=os.path.join(tmp, "chat_memory.sqlite3")):
+                report = self._run(sizes, options)
+        finally:
+            history_writer.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+
+    def _run(self, sizes: list, options: dict) -> dict:
+        from agent import langgraph_agent
+        from agent.cache import response_cache
+        from agent.llm_factory import GatedChatModel, SimulatedChatModel, TokenUsageHandler
+        from agent.tools import _get_company_by_name
+
+        rng = random.Random(options["seed"])
+        n = options["requests"]
+        routes = [r.strip() for r in options["router_script"].split(",") if r.strip()]
+        langgraph_agent.build_agent(GatedChatModel(
+            inner=SimulatedChatModel(
+                latency=options["llm_latency"], tokens_per_second=options["tokens_per_second"], routes=routes,
+            ),
+            callbacks=[TokenUsageHandler()],
+        ))
+        ttls = dict(response_cache.ttls)
+        client = Client()
+
+        report = {
+            "config": {
+                "sizes": sizes, "requests": n, "llm_latency": options["llm_latency"],
+                "tokens_per_second": options["tokens_per_second"], "router_script": routes,
+                "history_rows": options["history_rows"], "seed": options["seed"],
+                "database": connection.vendor,
+            },
+            "results": [],
+        }
+        seeded = 0
+        for size in sizes:
+            # --- CSV import (grows the corpus to `size`) -------------------
+            start = time.perf_counter()
+            result = import_companies(iter_csv_rows(csv_lines(seeded, size, rng)))
+            seconds = time.perf_counter() - start
+            imported = size - seeded
+            seeded = size
+            scenarios = {"csv_import": {
+                "rows": imported, "seconds": round(seconds, 3),
+                "rows_per_second": round(imported / seconds, 1) if seconds else None,
+                "errors": result["error_count"],
+            }}
+
+            picks = [rng.randrange(size) for _ in range(n)]
+            names = [company_name(i) for i in picks]
+
+            # --- Company lookup paths ------------------------------------
+            scenarios["lookup_exact"] = measure(_get_company_by_name, [(name.upper(),) for name in names])
+            scenarios["lookup_substring"] = measure(
+                _get_company_by_name, [(name.rsplit(" ", 1)[0],) for name in names]
+            )
+            scenarios["lookup_fuzzy"] = measure(_get_company_by_name, [(_typo(name, rng),) for name in names])
+
+            # --- Agent (answer cache off, then a cache-hit pass) ---------
+            response_cache.ttls = {route: 0 for route in ttls}
+            scenarios["chat_company"] = measure(
+                langgraph_agent.run_chat, [(f"Tell me about {name}",) for name in names]
+            )
+            scenarios["chat_general"] = measure(
+                langgraph_agent.run_chat,
+                [(f"Which companies build {_CORES[i % len(_CORES)].lower()} products? ({i})",) for i in range(n)],
+            )
+            scenarios["chat_aggregate"] = measure(
+                langgraph_agent.run_chat,
+                [(f"How many companies are in {_SECTORS[i % len(_SECTORS)]}?",) for i in range(n)],
+            )
+            response_cache.ttls = ttls
+            langgraph_agent.run_chat("How many companies are there?")
+            scenarios["chat_cached"] = measure(
+                langgraph_agent.run_chat, [("How many companies are there?",) for _ in range(n)]
+            )
+            scenarios["chat_view"] = measure(
+                lambda message: client.post("/chat/", {"message": message}, content_type="application/json"),
+                [(f"Tell me about {name}",) for name in names],
+            )
+
+            # --- History endpoints ---------------------------------------
+            history_writer.flush()
+            missing = options["history_rows"] - ChatHistory.objects.count()
+            if missing > 0:
+                ChatHistory.objects.bulk_create(
+                    [ChatHistory(user_message=f"question {i}", bot_response="answer",
+                                 session_id=f"session-{i % 100}") for i in range(missing)],
+                    batch_size=1000,
+                )
+            scenarios["history_first_page"] = measure(
+                lambda: client.get("/chat-history/"), [() for _ in range(n)]
+            )
+            scenarios["history_session"] = measure(
+                lambda session: client.get("/chat-history/", {"session_id": session}),
+                [(f"session-{i % 100}",) for i in range(n)],
+            )
+            cursors, cursor = [], None
+            while len(cursors) < n:
+                cursor = client.get("/chat-history/", {"before": cursor} if cursor else {}).json()["next_cursor"]
+                if not cursor:
+                    break
+                cursors.append(cursor)
+            if cursors:
+                scenarios["history_deep_page"] = measure(
+                    lambda before: client.get("/chat-history/", {"before": before}), [(c,) for c in cursors]
+                )
+
+            report["results"].append({"companies": Company.objects.count(), "scenarios": scenarios})
+            self.stderr.write(f"Finished {size} companies")
+        return report
@@ -0,0 +1,24 @@
+# companies/management/commands/sweep_chat_memory.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = (
+        "Delete chat sessions idle for longer than CHAT_MEMORY_TTL from the session "
+        "memory store, and drop superseded checkpoints of the others."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age", type=float,
+                            help="Idle seconds before a session is deleted (default: CHAT_MEMORY_TTL).")
+
+    def handle(self, *args, **options):
+        from agent.memory import session_memory
+
+        if not session_memory.enabled:
+            raise CommandError("Session memory is off (CHAT_MEMORY_PATH is empty)")
+        removed = session_memory.sweep(options["max_age"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed['sessions']} idle sessions and {removed['checkpoints']} old checkpoints "
+            f"from {settings.CHAT_MEMORY_PATH}"
+        ))
@@ -0,0 +1,16 @@
+# companies/management/commands/warmup_agent.py
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = (
+        "Build the chat agent (LLM client, router, compiled graph) and load its "
+        "in-memory indexes, printing how long each step took."
+    )
+
+    def handle(self, *args, **options):
+        from agent.langgraph_agent import warmup_agent
+
+        timings = warmup_agent()
+        for step, seconds in timings.items():
+            self.stdout.write(f"{step:<14} {seconds * 1000:8.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Agent ready in {sum(timings.values()):.2f}s"))
@@ -0,0 +1,147 @@
+# companies/metrics.py
+import re
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+
+from .models import Company, CompanyMetric
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+_SCALES = {
+    "k": 1e3, "thousand": 1e3,
+    "m": 1e6, "mm": 1e6, "mn": 1e6, "million": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+    "t": 1e12, "tn": 1e12, "trillion": 1e12,
+}
+_CURRENCIES = {
+    "$": "USD", "usd": "USD", "€": "EUR", "eur": "EUR",
+    "£": "GBP", "gbp": "GBP", "¥": "JPY", "jpy": "JPY",
+}
+_VALUE = re.compile(
+    r"^\s*(?P<pre>[$€£¥]|usd|eur|gbp|jpy)?\s*"
+    r"(?P<num>[-+]?(?:\d[\d,]*(?:\.\d+)?|\.\d+))\s*"
+    r"(?P<scale>thousand|million|billion|trillion|mm|mn|bn|tn|k|m|b|t)?\s*"
+    r"(?P<post>[$€£¥%]|usd|eur|gbp|jpy)?\s*$",
+    re.IGNORECASE,
+)
+
+def normalize_metric_name(key: str) -> str:
+    """'Annual Revenue' → 'annual_revenue'."""
+    return re.sub(r"[^a-z0-9]+", "_", str(key).lower()).strip("_")
+
+def parse_metric_value(raw):
+    """Parse a financials value into ``(value, unit)``, or ``None`` if not numeric.
+
+    Handles plain numbers, K/M/B/T suffixes (and words like "million"),
+    currency symbols or codes on either side, and percentages:
+    ``"5B$"`` → ``(5e9, "USD")``, ``"€1.2m"`` → ``(1.2e6, "EUR")``,
+    ``"12%"`` → ``(12.0, "%")``.
+    """
+    if isinstance(raw, bool):
+        return None
+    if isinstance(raw, (int, float)):
+        return float(raw), ""
+    if not isinstance(raw, str):
+        return None
+    match = _VALUE.match(raw)
+    if not match:
+        return None
+    pre, post = match.group("pre"), match.group("post")
+    if pre and post:
+        return None
+    value = float(match.group("num").replace(",", ""))
+    scale = match.group("scale")
+    if scale:
+        value *= _SCALES[scale.lower()]
+    symbol = (pre or post or "").lower()
+    unit = "%" if symbol == "%" else _CURRENCIES.get(symbol, "")
+    return value, unit
+
+def metrics_for(company: Company) -> list:
+    """Unsaved CompanyMetric rows for every numeric value in *company.financials*."""
+    financials = company.financials if isinstance(company.financials, dict) else {}
+    rows = {}
+    for key, raw in financials.items():
+        name = normalize_metric_name(key)
+        parsed = parse_metric_value(raw)
+        if not name or parsed is None:
+            continue
+        rows[name] = CompanyMetric(
+            company_id=company.pk, metric=name, value=parsed[0], unit=parsed[1], raw=str(raw)[:120]
+        )
+    return list(rows.values())
+
+def sync_metrics(companies):
+    """Replace the stored metrics of *companies* (saved instances) in two queries."""
+    companies = [c for c in companies if c.pk is not None]
+    if not companies:
+        return
+    with transaction.atomic():
+        CompanyMetric.objects.filter(company_id__in=[c.pk for c in companies]).delete()
+        CompanyMetric.objects.bulk_create(
+            [m for c in companies for m in metrics_for(c)], batch_size=1000
+        )
+
+# ---------------------------------------------------------------------------
+# Query API (all served by the (metric, value) index)
+#
+# Values are compared as stored: a currency is never converted. Pass *units*
+# to keep to one currency ("" is a value reported without one).
+# ---------------------------------------------------------------------------
+
+def filter_by_metric(queryset, metric: str, min_value: float = None, max_value: float = None,
+                     units=None):
+    """Restrict a Company *queryset* to rows whose *metric* lies in [min_value, max_value],
+    optionally reported in one of *units*."""
+    conditions = {"metrics__metric": normalize_metric_name(metric)}
+    if min_value is not None:
+        conditions["metrics__value__gte"] = min_value
+    if max_value is not None:
+        conditions["metrics__value__lte"] = max_value
+    if units is not None:
+        conditions["metrics__unit__in"] = list(units)
+    return queryset.filter(**conditions)
+
+def top_companies(metric: str, n: int = 10, sector: str = None, ascending: bool = False,
+                  units=None) -> list:
+    """The *n* companies with the largest (or smallest) *metric*, optionally
+    among values reported in one of *units*.
+
+    Returns ``(company, value, unit)`` tuples.
+    """
+    rows = CompanyMetric.objects.filter(metric=normalize_metric_name(metric)).select_related("company")
+    if sector:
+        rows = rows.filter(company__sector=sector)
+    if units is not None:
+        rows = rows.filter(unit__in=list(units))
+    rows = rows.order_by("value" if ascending else "-value")[:n]
+    return [(row.company, row.value, row.unit) for row in rows]
+
+def metric_units(metric: str, sector: str = None) -> dict:
+    """How many companies report *metric* in each unit, most common first."""
+    rows = CompanyMetric.objects.filter(metric=normalize_metric_name(metric))
+    if sector:
+        rows = rows.filter(company__sector=sector)
+    counts = rows.values("unit").annotate(count=Count("id")).order_by("-count", "unit")
+    return {row["unit"]: row["count"] for row in counts}
+
+def sector_aggregates(metric: str) -> list:
+    """Per-sector and unit count/sum/average/min/max of *metric*, largest total first."""
+    return list(
+        CompanyMetric.objects.filter(metric=normalize_metric_name(metric))
+        .values("unit", sector=F("company__sector"))
+        .annotate(
+            count=Count("id"), total=Sum("value"), average=Avg("value"),
+            minimum=Min("value"), maximum=Max("value"),
+        )
+        .order_by("-total")
+    )
+
+def available_metrics() -> list:
+    """Metric names present in the database with how many companies report them."""
+    return list(
+        CompanyMetric.objects.values("metric").annotate(count=Count("id")).order_by("-count", "metric")
+    )
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+FTS_TABLE = "companies_company_fts"
+PG_INDEX = "companies_company_fts_idx"
+PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '') "
+    "|| ' ' || coalesce(sector, ''))"
+)
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, description, sector,
+        content='companies_company', content_rowid='id', tokenize='unicode61'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON companies_company BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description, sector)
+        VALUES (new.id, new.name, new.description, new.sector);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON companies_company BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, sector)
+        VALUES ('delete', old.id, old.name, old.description, old.sector);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON companies_company BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, sector)
+        VALUES ('delete', old.id, old.name, old.description, old.sector);
+        INSERT INTO {FTS_TABLE}(rowid, name, description, sector)
+        VALUES (new.id, new.name, new.description, new.sector);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+def create_fulltext(apps, schema_editor):
+    """SQLite: external-content FTS5 table kept in sync by triggers.
+    PostgreSQL: GIN index on the tsvector expression used by the search.
+    Other backends: nothing (search falls back to icontains)."""
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            options = {row[0] for row in cursor.fetchall()}
+        if "ENABLE_FTS5" not in options:
+            return
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON companies_company USING GIN ({PG_DOCUMENT})"
+        )
+
+def drop_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+    elif vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_chathistory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext, drop_fulltext),
+    ]
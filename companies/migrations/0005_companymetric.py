@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_company_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=80)),
+                ('value', models.FloatField()),
+                ('unit', models.CharField(blank=True, max_length=8)),
+                ('raw', models.CharField(blank=True, max_length=120)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='companies.company')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metric', 'value'], name='metric_value_idx')],
+                'constraints': [models.UniqueConstraint(fields=('company', 'metric'), name='unique_company_metric')],
+            },
+        ),
+    ]
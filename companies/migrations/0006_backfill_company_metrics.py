@@ -0,0 +1,81 @@
+import re
+
+from django.db import migrations
+
+# Frozen copy of companies.metrics parsing as of this migration, so later
+# changes to the live parser don't change what this backfill does
+
+_SCALES = {
+    "k": 1e3, "thousand": 1e3,
+    "m": 1e6, "mm": 1e6, "mn": 1e6, "million": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+    "t": 1e12, "tn": 1e12, "trillion": 1e12,
+}
+_CURRENCIES = {
+    "$": "USD", "usd": "USD", "€": "EUR", "eur": "EUR",
+    "£": "GBP", "gbp": "GBP", "¥": "JPY", "jpy": "JPY",
+}
+_VALUE = re.compile(
+    r"^\s*(?P<pre>[$€£¥]|usd|eur|gbp|jpy)?\s*"
+    r"(?P<num>[-+]?(?:\d[\d,]*(?:\.\d+)?|\.\d+))\s*"
+    r"(?P<scale>thousand|million|billion|trillion|mm|mn|bn|tn|k|m|b|t)?\s*"
+    r"(?P<post>[$€£¥%]|usd|eur|gbp|jpy)?\s*$",
+    re.IGNORECASE,
+)
+
+def normalize_metric_name(key):
+    return re.sub(r"[^a-z0-9]+", "_", str(key).lower()).strip("_")
+
+def parse_metric_value(raw):
+    if isinstance(raw, bool):
+        return None
+    if isinstance(raw, (int, float)):
+        return float(raw), ""
+    if not isinstance(raw, str):
+        return None
+    match = _VALUE.match(raw)
+    if not match:
+        return None
+    pre, post = match.group("pre"), match.group("post")
+    if pre and post:
+        return None
+    value = float(match.group("num").replace(",", ""))
+    scale = match.group("scale")
+    if scale:
+        value *= _SCALES[scale.lower()]
+    symbol = (pre or post or "").lower()
+    unit = "%" if symbol == "%" else _CURRENCIES.get(symbol, "")
+    return value, unit
+
+
+def backfill_metrics(apps, schema_editor):
+    Company = apps.get_model('companies', 'Company')
+    CompanyMetric = apps.get_model('companies', 'CompanyMetric')
+    batch = []
+    for company_id, financials in Company.objects.values_list('id', 'financials').iterator():
+        seen = set()
+        for key, raw in (financials if isinstance(financials, dict) else {}).items():
+            name = normalize_metric_name(key)
+            parsed = parse_metric_value(raw)
+            if not name or parsed is None or name in seen:
+                continue
+            seen.add(name)
+            batch.append(CompanyMetric(
+                company_id=company_id, metric=name, value=parsed[0], unit=parsed[1], raw=str(raw)[:120]
+            ))
+        if len(batch) >= 1000:
+            CompanyMetric.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        CompanyMetric.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_companymetric'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_metrics, migrations.RunPython.noop),
+    ]
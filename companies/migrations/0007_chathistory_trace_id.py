@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0006_backfill_company_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chathistory',
+            name='trace_id',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:09
+
+import importlib
+
+from django.db import migrations, models
+
+fulltext = importlib.import_module("companies.migrations.0004_company_fulltext")
+
+def restore_fulltext_triggers(apps, schema_editor):
+    """SQLite adds the column by rebuilding companies_company, which drops the
+    FTS5 sync triggers from 0004; recreate them and reindex."""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fulltext.FTS_TABLE]
+        )
+        if cursor.fetchone() is None:
+            return  # FTS5 unavailable, search falls back to icontains
+    for sql in fulltext.SQLITE_BACKWARD[:3] + fulltext.SQLITE_FORWARD[1:]:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0008_importjob'),
+    ]
+
+    operations = [
+        # Reversed last: removing the column rebuilds the table again
+        migrations.RunPython(migrations.RunPython.noop, restore_fulltext_triggers),
+        migrations.AddField(
+            model_name='company',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['updated_at', 'id'], name='company_updated_idx'),
+        ),
+        migrations.RunPython(restore_fulltext_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0009_company_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='owner',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
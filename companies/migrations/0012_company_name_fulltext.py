@@ -0,0 +1,28 @@
+from django.db import migrations
+
+PG_NAME_INDEX = "companies_company_name_fts_idx"
+PG_NAME_DOCUMENT = "to_tsvector('english', name)"
+
+
+def create_name_index(apps, schema_editor):
+    """PostgreSQL: GIN index on the name-only tsvector used by ``ranked_search(name_only=True)``.
+    SQLite's FTS5 table (0004) already supports column filters; other backends: nothing."""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {PG_NAME_INDEX} ON companies_company USING GIN ({PG_NAME_DOCUMENT})"
+        )
+
+def drop_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PG_NAME_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0011_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_index, drop_name_index),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
@@ -8,19 +10,87 @@ class Company(models.Model):
     description = models.TextField()
     sector      = models.CharField(max_length=80)
     financials  = models.JSONField(blank=True, default=dict)
+    updated_at  = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Incremental exports page through (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='company_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class CompanyMetric(models.Model):
+    """One numeric value parsed out of ``Company.financials`` (e.g. revenue "5B$" → 5e9 USD)."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='metrics')
+    metric  = models.CharField(max_length=80)
+    value   = models.FloatField()
+    unit    = models.CharField(max_length=8, blank=True)
+    raw     = models.CharField(max_length=120, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'metric'], name='unique_company_metric'),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'value'], name='metric_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id} {self.metric}={self.value}{self.unit}"
+
 class ChatHistory(models.Model):
     user_message = models.TextField()
     bot_response = models.TextField()
     timestamp = models.DateTimeField(default=timezone.now)
     session_id = models.CharField(max_length=100, blank=True, null=True)
+    trace_id = models.CharField(max_length=32, blank=True, null=True, db_index=True)
     
     class Meta:
         ordering = ['-timestamp']
         verbose_name_plural = "Chat Histories"
+        indexes = [
+            models.Index(fields=['session_id', '-timestamp'], name='chat_session_timestamp_idx'),
+            models.Index(fields=['-timestamp'], name='chat_timestamp_idx'),
+        ]
     
     def __str__(self):
         return f"Chat at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class ImportJob(models.Model):
+    """A CSV upload imported in the background (see ``companies.jobs``).
+
+    The upload is spooled to ``path``; ``offset`` is the byte position up to
+    which rows are committed, so an interrupted job resumes from there.
+    While running, ``updated_at`` doubles as the owner's heartbeat.
+    """
+    QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, SUCCEEDED, FAILED)]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    path = models.CharField(max_length=500)
+    size = models.BigIntegerField(default=0)
+    batch_size = models.PositiveIntegerField(default=1000)
+    only_changed = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    owner = models.CharField(max_length=255, blank=True)  # runner that claimed it (host:pid:token)
+    offset = models.BigIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_per_second = models.FloatField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(blank=True, default=list)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
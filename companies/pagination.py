@@ -0,0 +1,61 @@
+# companies/pagination.py
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+
+# ---------------------------------------------------------------------------
+# Keyset (cursor) pagination on (timestamp, id), newest first
+# ---------------------------------------------------------------------------
+
+def encode_position(value: datetime, pk) -> str:
+    """Opaque cursor for a ``(datetime, id)`` position."""
+    raw = f"{value.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def encode_cursor(obj) -> str:
+    """Opaque cursor for a row: its ``(timestamp, id)`` position."""
+    return encode_position(obj.timestamp, obj.pk)
+
+def decode_cursor(cursor: str):
+    """Return ``(datetime, id)``; raises ``ValueError`` for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid cursor: {e}")
+
+def keyset_page(queryset, before: str = None, after: str = None, page_size: int = 20):
+    """Return ``(rows, has_more)`` for one page of *queryset*, newest first.
+
+    ``before`` pages towards older rows, ``after`` towards newer ones;
+    ``has_more`` tells whether another page exists in that direction. Each
+    page is a range scan on ``(timestamp, id)``, so its cost does not grow
+    with how far back it is.
+    """
+    if before:
+        ts, pk = decode_cursor(before)
+        queryset = queryset.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+    if after:
+        ts, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=pk))
+        # Take the oldest rows just newer than the cursor, then flip back
+        rows = list(queryset.order_by("timestamp", "id")[:page_size + 1])
+        return list(reversed(rows[:page_size])), len(rows) > page_size
+
+    rows = list(queryset.order_by("-timestamp", "-id")[:page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+# ---------------------------------------------------------------------------
+# REST API
+# ---------------------------------------------------------------------------
+
+class CompanyCursorPagination(CursorPagination):
+    """Cursor pagination for /api/companies/, keyed on the unique ``name``."""
+    ordering = "name"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = settings.COMPANY_API_MAX_PAGE_SIZE
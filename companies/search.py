@@ -0,0 +1,115 @@
+# companies/search.py
+import hashlib
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Company
+from .signals import company_data_version
+
+FACET_CACHE_TIMEOUT = 60 * 60  # the data version in the key handles invalidation
+
+# Created by migration 0004_company_fulltext; the PostgreSQL expressions must match
+# the indexed ones exactly (0004 and 0012_company_name_fulltext) or the planner
+# falls back to a sequential scan
+FTS_TABLE = "companies_company_fts"
+PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '') "
+    "|| ' ' || coalesce(sector, ''))"
+)
+PG_NAME_DOCUMENT = "to_tsvector('english', name)"
+_fts_tables = {}  # connection alias -> whether the FTS5 table exists
+
+def search_filter(queryset, q: str):
+    """Restrict *queryset* to companies whose name or description contains *q*."""
+    if not q:
+        return queryset
+    return queryset.filter(Q(name__icontains=q) | Q(description__icontains=q))
+
+def sector_facets(q: str = None) -> list:
+    """Per-sector counts (optionally within search *q*), largest first.
+
+    One GROUP BY query, cached until the Company data version changes.
+    """
+    digest = hashlib.md5((q or "").encode("utf-8")).hexdigest()
+    key = f"companies:facets:v{company_data_version()}:{digest}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = list(
+            search_filter(Company.objects.all(), q)
+            .values("sector")
+            .annotate(count=Count("id"))
+            .order_by("-count", "sector")
+        )
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+# ---------------------------------------------------------------------------
+# Full-text search
+# ---------------------------------------------------------------------------
+
+def _terms(q: str) -> list:
+    return re.findall(r"\w+", (q or "").lower())
+
+def _has_fts_table() -> bool:
+    if connection.alias not in _fts_tables:
+        _fts_tables[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[connection.alias]
+
+def ranked_search(q: str, limit: int = 20, name_only: bool = False) -> list:
+    """Return ``(pk, score)`` pairs for *q*, best first (higher score is better).
+
+    Every term must match, as a prefix, in the name, description or sector
+    (only the name with *name_only*). Uses the FTS5 table on SQLite (name
+    weighted highest) and a tsvector match on PostgreSQL; other backends
+    fall back to ``icontains``.
+    """
+    terms = _terms(q)
+    if not terms:
+        return []
+
+    if connection.vendor == "sqlite" and _has_fts_table():
+        match = " ".join(f'"{t}"*' for t in terms)
+        if name_only:
+            match = f"name : ({match})"
+        sql = (
+            f"SELECT rowid, bm25({FTS_TABLE}, 10.0, 1.0, 2.0) AS rank FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, limit])
+            return [(pk, -rank) for pk, rank in cursor.fetchall()]  # bm25(): lower is better
+
+    if connection.vendor == "postgresql":
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        document = PG_NAME_DOCUMENT if name_only else PG_DOCUMENT
+        sql = (
+            f"SELECT id, ts_rank({document}, to_tsquery('english', %s)) AS rank "
+            f"FROM companies_company WHERE {document} @@ to_tsquery('english', %s) "
+            f"ORDER BY rank DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, tsquery, limit])
+            return cursor.fetchall()
+
+    queryset = Company.objects.all()
+    for term in terms:
+        condition = Q(name__icontains=term)
+        if not name_only:
+            condition |= Q(description__icontains=term) | Q(sector__icontains=term)
+        queryset = queryset.filter(condition)
+    return [(pk, 0.0) for pk in queryset.order_by("name").values_list("pk", flat=True)[:limit]]
+
+def search_companies(q: str, limit: int = 20) -> list:
+    """Companies matching *q*, best first, each with a ``rank`` attribute."""
+    hits = ranked_search(q, limit)
+    by_pk = Company.objects.in_bulk([pk for pk, _ in hits])
+    results = []
+    for pk, score in hits:
+        company = by_pk.get(pk)
+        if company is not None:
+            company.rank = score
+            results.append(company)
+    return results
@@ -3,6 +3,24 @@ from .models import Company
 
 # companies/serializers.py
 class CompanySerializer(serializers.ModelSerializer):
+    """Company serializer; ``?fields=name,sector`` on a GET returns only those fields."""
+
     class Meta:
         model  = Company
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get("request"))
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+def requested_fields(request):
+    """Set of field names from a GET ``fields=`` parameter, or ``None``."""
+    if request is None or request.method != "GET":
+        return None
+    raw = request.query_params.get("fields")
+    if not raw:
+        return None
+    return {f.strip() for f in raw.split(",") if f.strip()}
\ No newline at end of file
@@ -0,0 +1,84 @@
+# companies/signals.py
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .metrics import sync_metrics
+from .models import Company
+
+DATA_VERSION_KEY = "companies:data_version"
+LAST_MODIFIED_KEY = "companies:last_modified"
+
+# Sent after a bulk write (e.g. CSV import) that bypassed post_save.
+# Receivers get ``instances``: the written Company objects, with primary keys.
+companies_bulk_upserted = Signal()
+
+# Sent when a committed save, delete or bulk upsert of this process bumps the
+# version. Receivers get ``previous`` and ``version``: in-process structures
+# that were current at ``previous`` and are patched from the same signals can
+# move to ``version`` instead of reloading.
+company_write_committed = Signal()
+
+def _new_version() -> int:
+    # A fresh value rather than an increment: incr is not atomic on the
+    # database and file caches, and a counter restarting at 1 after an
+    # eviction would bring back entries cached under old versions
+    return time.time_ns()
+
+def company_data_version() -> int:
+    """Current version of the Company table; changes on every write."""
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+async def acompany_data_version() -> int:
+    """Async version of :func:`company_data_version`."""
+    version = await cache.aget(DATA_VERSION_KEY)
+    if version is None:
+        await cache.aadd(DATA_VERSION_KEY, _new_version(), timeout=None)
+        version = await cache.aget(DATA_VERSION_KEY)
+    return version
+
+def company_data_last_modified() -> float:
+    """Unix time of the last Company write seen (process start if unknown)."""
+    last_modified = cache.get(LAST_MODIFIED_KEY)
+    if last_modified is None:
+        cache.add(LAST_MODIFIED_KEY, time.time(), timeout=None)
+        last_modified = cache.get(LAST_MODIFIED_KEY, time.time())
+    return last_modified
+
+def _bump() -> tuple:
+    cache.set(LAST_MODIFIED_KEY, time.time(), timeout=None)
+    previous = cache.get(DATA_VERSION_KEY)
+    version = _new_version()
+    cache.set(DATA_VERSION_KEY, version, timeout=None)
+    return previous, version
+
+def bump_company_data_version() -> int:
+    """Invalidate everything derived from the Company table."""
+    return _bump()[1]
+
+def _write_committed():
+    previous, version = _bump()
+    company_write_committed.send(sender=Company, previous=previous, version=version)
+
+@receiver(companies_bulk_upserted, sender=Company, dispatch_uid="company_data_version_bulk")
+@receiver(post_save, sender=Company, dispatch_uid="company_data_version_save")
+@receiver(post_delete, sender=Company, dispatch_uid="company_data_version_delete")
+def _company_changed(sender, **kwargs):
+    # After commit: bumped earlier, a concurrent request could cache data the
+    # write is about to replace under the new version
+    transaction.on_commit(_write_committed)
+
+@receiver(post_save, sender=Company, dispatch_uid="company_metrics_save")
+def _company_metrics_saved(sender, instance, **kwargs):
+    sync_metrics([instance])
+
+@receiver(companies_bulk_upserted, sender=Company, dispatch_uid="company_metrics_bulk")
+def _company_metrics_bulk_upserted(sender, instances, **kwargs):
+    sync_metrics(instances)
@@ -0,0 +1,247 @@
+# companies/telemetry.py
+import bisect
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Metric types (process-local, rendered in the Prometheus text format)
+# ---------------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registry = []
+_collectors = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, key)} {value}" for key, value in values]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock seconds spent in the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {values[-1]}")
+        return lines
+
+def register_collector(collect):
+    """Add a callable returning extra exposition lines, evaluated at scrape time."""
+    _collectors.append(collect)
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for collect in _collectors:
+        lines += collect()
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------------------------------------------------
+# Chat metrics
+# ---------------------------------------------------------------------------
+
+NODE_SECONDS = Histogram(
+    "chat_node_duration_seconds", "Time spent in each LangGraph node.", ("node",)
+)
+TOOL_SECONDS = Histogram(
+    "chat_tool_duration_seconds", "Time spent in tool calls and company lookup steps.", ("tool",)
+)
+REQUEST_SECONDS = Histogram(
+    "chat_request_duration_seconds", "End-to-end chat request time by route.", ("route",)
+)
+REQUEST_TOKENS = Histogram(
+    "chat_request_tokens", "LLM tokens used per chat request.", ("kind",), buckets=TOKEN_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "chat_request_db_queries", "Database queries run per chat request.", buckets=QUERY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "chat_llm_tokens_total", "LLM tokens used, by graph node and kind.", ("node", "kind")
+)
+SPECULATIVE_LOOKUPS = Counter(
+    "chat_speculative_lookups_total",
+    "Company lookups started alongside the LLM router, by outcome (used, discarded, cancelled, failed).",
+    ("outcome",),
+)
+
+# ---------------------------------------------------------------------------
+# Per-request traces
+# ---------------------------------------------------------------------------
+
+_current_trace = ContextVar("chat_trace", default=None)
+_current_node = ContextVar("chat_node", default=None)
+
+class Trace:
+    """Counters for one chat request; its ``id`` is stored on ChatHistory."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.route = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.db_queries = 0
+        self.nodes = []  # (node, seconds) in completion order
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def finish(self):
+        seconds = time.perf_counter() - self._start
+        route = self.route or "unknown"
+        REQUEST_SECONDS.observe(seconds, route=route)
+        REQUEST_TOKENS.observe(self.prompt_tokens, kind="prompt")
+        REQUEST_TOKENS.observe(self.completion_tokens, kind="completion")
+        REQUEST_QUERIES.observe(self.db_queries)
+        logger.info(
+            "chat trace=%s route=%s duration_ms=%.1f nodes=%s prompt_tokens=%d completion_tokens=%d db_queries=%d",
+            self.id, route, seconds * 1000,
+            ",".join(f"{node}:{s * 1000:.1f}" for node, s in self.nodes) or "-",
+            self.prompt_tokens, self.completion_tokens, self.db_queries,
+        )
+
+@contextmanager
+def trace():
+    """Make a :class:`Trace` current for the block and record it on exit.
+
+    Nested calls reuse the current trace, so a view and the agent entry
+    point it calls share one trace.
+    """
+    current = _current_trace.get()
+    if current is not None:
+        yield current
+        return
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:  # exited from another context (e.g. a closed stream)
+            pass
+        current.finish()
+
+def current_trace():
+    return _current_trace.get()
+
+def set_route(route: str):
+    current = _current_trace.get()
+    if current is not None and current.route is None:
+        current.route = route
+
+@contextmanager
+def node_span(node: str):
+    """Time a graph node; LLM tokens used inside are attributed to it."""
+    token = _current_node.set(node)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _current_node.reset(token)
+        NODE_SECONDS.observe(seconds, node=node)
+        current = _current_trace.get()
+        if current is not None:
+            with current._lock:
+                current.nodes.append((node, seconds))
+
+def record_tokens(prompt: int, completion: int):
+    """Count LLM token usage against the current node and trace."""
+    node = _current_node.get() or "unknown"
+    LLM_TOKENS.inc(prompt, node=node, kind="prompt")
+    LLM_TOKENS.inc(completion, node=node, kind="completion")
+    current = _current_trace.get()
+    if current is not None:
+        current.add(prompt_tokens=prompt, completion_tokens=completion)
+
+# ---------------------------------------------------------------------------
+# Database query counting
+# ---------------------------------------------------------------------------
+
+def _count_query(execute, sql, params, many, context):
+    current = _current_trace.get()
+    if current is not None:
+        current.add(db_queries=1)
+    return execute(sql, params, many, context)
+
+@receiver(connection_created, dispatch_uid="telemetry_count_queries")
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
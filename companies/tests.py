@@ -1,3 +1,685 @@
-from django.test import TestCase
+# companies/tests.py
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from agent.admission import LLMOverloaded
+
+from . import search, telemetry
+from .history import history_writer
+from .management.commands import bench
+from .importer import import_companies, iter_csv_rows
+from .jobs import ImportJobRunner, _Interrupted
+from .metrics import filter_by_metric, metric_units, parse_metric_value, top_companies
+from .models import ChatHistory, Company, ImportJob
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .search import ranked_search, sector_facets
+
+# ---------------------------------------------------------------------------
+# Keyset pagination
+# ---------------------------------------------------------------------------
+
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() - timedelta(days=1)
+        # Pairs of rows share a timestamp, so the id tie-break matters
+        cls.rows = [
+            ChatHistory.objects.create(
+                user_message=f"q{i}", bot_response=f"a{i}", timestamp=start + timedelta(minutes=i // 2),
+            )
+            for i in range(7)
+        ]
+        cls.newest_first = sorted(cls.rows, key=lambda r: (r.timestamp, r.pk), reverse=True)
+
+    def test_cursor_round_trip(self):
+        row = self.rows[3]
+        self.assertEqual(decode_cursor(encode_cursor(row)), (row.timestamp, row.pk))
+
+    def test_malformed_cursor_raises_value_error(self):
+        for cursor in ("not-a-cursor", "", "Zm9v"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_before_walks_every_row_once(self):
+        seen, before = [], None
+        while True:
+            rows, has_more = keyset_page(ChatHistory.objects.all(), before=before, page_size=3)
+            seen += rows
+            if not has_more:
+                break
+            before = encode_cursor(rows[-1])
+        self.assertEqual(seen, self.newest_first)
+
+    def test_after_returns_the_newer_page_newest_first(self):
+        cursor = encode_cursor(self.newest_first[5])
+        rows, has_more = keyset_page(ChatHistory.objects.all(), after=cursor, page_size=3)
+        self.assertEqual(rows, self.newest_first[2:5])
+        self.assertTrue(has_more)
+        rows, has_more = keyset_page(ChatHistory.objects.all(), after=encode_cursor(rows[0]), page_size=3)
+        self.assertEqual(rows, self.newest_first[:2])
+        self.assertFalse(has_more)
+
+class ChatHistoryPollingTests(TestCase):
+    def test_after_poll_sees_rows_still_in_the_write_behind_buffer(self):
+        ChatHistory.objects.create(user_message="q0", bot_response="a0", session_id="s")
+        cursor = self.client.get("/chat-history/", {"session_id": "s"}).json()["prev_cursor"]
+
+        # Queued, not written: the background thread is kept from starting
+        with mock.patch.object(history_writer, "_ensure_started"):
+            history_writer.record("q1", "a1", session_id="s")
+        self.assertEqual(ChatHistory.objects.filter(session_id="s").count(), 1)
+
+        response = self.client.get("/chat-history/", {"session_id": "s", "after": cursor}).json()
+        self.assertEqual([c["user_message"] for c in response["chats"]], ["q1"])
+        self.assertEqual(history_writer.flush(), 0)
+
+# ---------------------------------------------------------------------------
+# Financial metrics
+# ---------------------------------------------------------------------------
+
+class ParseMetricValueTests(SimpleTestCase):
+    def test_suffixes_and_currencies(self):
+        cases = {
+            "5B$": (5e9, "USD"),
+            "$2.5 billion": (2.5e9, "USD"),
+            "€1.2m": (1.2e6, "EUR"),
+            "GBP 300k": (3e5, "GBP"),
+            "¥4 trillion": (4e12, "JPY"),
+            "1,250 usd": (1250.0, "USD"),
+            "12%": (12.0, "%"),
+            "15000": (15000.0, ""),
+            ".5M": (5e5, ""),
+            "-3.5": (-3.5, ""),
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                value, unit = parse_metric_value(raw)
+                self.assertAlmostEqual(value, expected[0])
+                self.assertEqual(unit, expected[1])
+
+    def test_numbers_pass_through(self):
+        self.assertEqual(parse_metric_value(42), (42.0, ""))
+        self.assertEqual(parse_metric_value(1.5), (1.5, ""))
+
+    def test_non_numeric_values(self):
+        for raw in ("N/A", "", "$5€", "about 5B", True, None, ["5B"]):
+            with self.subTest(raw=raw):
+                self.assertIsNone(parse_metric_value(raw))
+
+class MetricQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, revenue in (("A", "$2B"), ("B", "¥5B"), ("C", "€1.5B"), ("D", "3B$"), ("E", "900000000")):
+            Company.objects.create(name=name, description="", sector="Tech", financials={"revenue": revenue})
+
+    def test_metrics_follow_company_writes(self):
+        company = Company.objects.get(name="E")
+        company.financials = {"Revenue": "$4B", "Employees": "n/a"}
+        company.save()
+        self.assertEqual([c.name for c, _, _ in top_companies("revenue", n=1)], ["B"])
+        self.assertEqual([c.name for c, _, _ in top_companies("revenue", n=1, units=["USD"])], ["E"])
+        self.assertFalse(filter_by_metric(Company.objects.all(), "employees").exists())
+
+    def test_units_keep_currencies_apart(self):
+        self.assertEqual(metric_units("revenue"), {"USD": 2, "": 1, "EUR": 1, "JPY": 1})
+        over = filter_by_metric(Company.objects.all(), "revenue", min_value=1e9, units=["USD", ""])
+        self.assertEqual(sorted(over.values_list("name", flat=True)), ["A", "D"])
+        everything = filter_by_metric(Company.objects.all(), "revenue", min_value=1e9)
+        self.assertEqual(everything.count(), 4)
+
+# ---------------------------------------------------------------------------
+# Full-text search
+# ---------------------------------------------------------------------------
+
+class RankedSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.widget = Company.objects.create(name="Widget Works", description="Industrial parts", sector="Manufacturing")
+        cls.parts = Company.objects.create(name="Parts Depot", description="Sells widgets online", sector="Retail")
+        cls.solar = Company.objects.create(name="Solar Grid", description="Renewable power", sector="Energy")
+
+    def _names(self, q, **kwargs):
+        by_pk = Company.objects.in_bulk()
+        return [by_pk[pk].name for pk, _ in ranked_search(q, **kwargs)]
+
+    def test_prefix_terms_ranked_name_first(self):
+        self.assertTrue(search._has_fts_table())
+        # The name match outranks the description match
+        self.assertEqual(self._names("widget"), ["Widget Works", "Parts Depot"])
+        self.assertEqual(self._names("renew"), ["Solar Grid"])
+        self.assertEqual(self._names("energy"), ["Solar Grid"])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self._names("widget online"), ["Parts Depot"])
+        self.assertEqual(self._names("widget solar"), [])
+        self.assertEqual(self._names("  !? "), [])
+
+    def test_name_only(self):
+        self.assertEqual(self._names("widget", name_only=True), ["Widget Works"])
+        self.assertEqual(self._names("power", name_only=True), [])
+
+    def test_follows_writes(self):
+        self.solar.name = "Sun Grid"
+        self.solar.save()
+        self.parts.delete()
+        self.assertEqual(self._names("sun"), ["Sun Grid"])
+        self.assertEqual(self._names("solar"), [])
+        self.assertEqual(self._names("widget"), ["Widget Works"])
+
+    def test_icontains_fallback_without_fts(self):
+        with mock.patch("companies.search._has_fts_table", return_value=False):
+            self.assertEqual(self._names("widget"), ["Parts Depot", "Widget Works"])
+            self.assertEqual(self._names("widget", name_only=True), ["Widget Works"])
+
+    def test_postgres_expressions_match_the_indexes(self):
+        # A different expression would not use the GIN index
+        for migration, constant, document in (
+            ("0004_company_fulltext", "PG_DOCUMENT", search.PG_DOCUMENT),
+            ("0012_company_name_fulltext", "PG_NAME_DOCUMENT", search.PG_NAME_DOCUMENT),
+        ):
+            module = importlib.import_module(f"companies.migrations.{migration}")
+            self.assertEqual(getattr(module, constant), document)
+
+    def test_search_endpoint(self):
+        response = self.client.get("/api/companies/search/", {"q": "widget", "limit": 1, "fields": "name"})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["name"] for r in results], ["Widget Works"])
+        self.assertEqual(set(results[0]), {"name", "rank"})
+        for params in ({}, {"q": "widget", "limit": "x"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/api/companies/search/", params).status_code, 400)
+
+# ---------------------------------------------------------------------------
+# Company REST API
+# ---------------------------------------------------------------------------
+
+class CompanyApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, sector, revenue in (
+            ("Alpha", "Tech", "5B$"), ("Bravo", "Tech", "$800M"), ("Charlie", "Energy", "2.5 billion"),
+            ("Delta", "Energy", "N/A"),
+        ):
+            Company.objects.create(name=name, description="", sector=sector, financials={"Revenue": revenue})
+
+    def _names(self, **params):
+        response = self.client.get("/api/companies/", params)
+        self.assertEqual(response.status_code, 200)
+        return [c["name"] for c in response.json()["results"]]
+
+    def test_sparse_fields(self):
+        response = self.client.get("/api/companies/", {"fields": "name,sector", "page_size": 1})
+        body = response.json()
+        self.assertEqual(body["results"], [{"name": "Alpha", "sector": "Tech"}])
+        self.assertEqual(self.client.get(body["next"]).json()["results"], [{"name": "Bravo", "sector": "Tech"}])
+
+    def test_financial_ranges_compare_parsed_values(self):
+        self.assertEqual(self._names(financials__revenue__gte="1e9"), ["Alpha", "Charlie"])
+        self.assertEqual(self._names(financials__Revenue__gt="1e9", financials__Revenue__lt="3e9"), ["Charlie"])
+        self.assertEqual(self._names(financials__revenue__lte="1e9", sector="Tech"), ["Bravo"])
+        self.assertEqual(self._names(name_prefix="d", q="delta"), ["Delta"])
+        response = self.client.get("/api/companies/", {"financials__revenue__gte": "lots"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_data_is_304(self):
+        url = "/api/companies/?sector=Tech"
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another query has its own tag
+        self.assertNotEqual(self.client.get("/api/companies/?sector=Energy")["ETag"], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.create(name="Echo", description="", sector="Tech", financials={})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Echo", [c["name"] for c in response.json()["results"]])
+
+    def test_retrieve_is_conditional(self):
+        url = f"/api/companies/{Company.objects.get(name='Alpha').pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, sector, description in (
+            ("Alpha", "Tech", "Cloud software"), ("Bravo", "Tech", "Chips"), ("Charlie", "Energy", "Solar software"),
+        ):
+            Company.objects.create(name=name, description=description, sector=sector, financials={})
+
+    def test_counts_largest_first(self):
+        self.assertEqual(sector_facets(), [{"sector": "Tech", "count": 2}, {"sector": "Energy", "count": 1}])
+        self.assertEqual(sector_facets("software"), [{"sector": "Energy", "count": 1}, {"sector": "Tech", "count": 1}])
+
+    def test_cached_until_the_data_changes(self):
+        sector_facets()
+        with self.assertNumQueries(2):  # the data version and the cached counts, no GROUP BY
+            sector_facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.create(name="Delta", description="", sector="Energy", financials={})
+        self.assertEqual(sector_facets(), [{"sector": "Energy", "count": 2}, {"sector": "Tech", "count": 2}])
+
+    def test_endpoint_and_page(self):
+        response = self.client.get("/api/companies/facets/", {"q": "chips"})
+        self.assertEqual(response.json(), {"sectors": [{"sector": "Tech", "count": 1}]})
+        self.assertEqual(self.client.get("/api/companies/facets/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        self.assertEqual(
+            self.client.get("/api/companies/facets/?q=chips", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304,
+        )
+        page = self.client.get("/companies/")
+        self.assertEqual(page.context["total"], 3)
+        self.assertEqual(page.context["facets"][0], {"sector": "Tech", "count": 2})
+
+# ---------------------------------------------------------------------------
+# Chat API
+# ---------------------------------------------------------------------------
+
+class ChatPayloadTests(TestCase):
+    def test_malformed_bodies_are_400(self):
+        bodies = (
+            [1], "hello", {"message": 5}, {"message": "   "}, {},
+            {"message": "hi", "session_id": 7}, {"message": "hi", "session_id": "x" * 101},
+        )
+        for url in ("/chat/", "/chat/stream/"):
+            for body in bodies:
+                with self.subTest(url=url, body=body):
+                    response = self.client.post(url, body, content_type="application/json")
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("error", response.json())
+
+    def test_batch_body_must_be_an_object(self):
+        response = self.client.post("/chat/batch/", [["hi"]], content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+class ChatSessionTests(TestCase):
+    def _post(self, body):
+        agent = mock.Mock()
+        agent.arun_chat = mock.AsyncMock(return_value="Hello!")
+        with mock.patch("companies.views._agent", return_value=agent), \
+                mock.patch("companies.views.history_writer.arecord", new_callable=mock.AsyncMock) as record:
+            response = self.client.post("/chat/", body, content_type="application/json")
+        return response, agent.arun_chat, record
+
+    def test_stateless_turn_skips_session_memory(self):
+        response, arun_chat, record = self._post({"message": "hi"})
+        self.assertEqual(arun_chat.call_args.kwargs["session_id"], None)
+        session_id = response.json()["session_id"]
+        self.assertTrue(session_id)
+        self.assertEqual(record.call_args.kwargs["session_id"], session_id)
+
+    def test_client_session_is_passed_through(self):
+        response, arun_chat, record = self._post({"message": "hi", "session_id": "abc"})
+        self.assertEqual(arun_chat.call_args.kwargs["session_id"], "abc")
+        self.assertEqual(response.json()["session_id"], "abc")
+        self.assertEqual(record.call_args.kwargs["session_id"], "abc")
+
+class ChatOverloadTests(TestCase):
+    def _post(self, reason):
+        agent = mock.Mock()
+        agent.arun_chat = mock.AsyncMock(side_effect=LLMOverloaded(reason, 7))
+        with mock.patch("companies.views._agent", return_value=agent):
+            return self.client.post("/chat/", {"message": "hi"}, content_type="application/json")
+
+    def test_full_queue_is_429(self):
+        response = self._post("queue_full")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(response.json()["retry_after"], 7)
+        self.assertFalse(ChatHistory.objects.exists())
+
+    def test_queue_deadline_is_503(self):
+        response = self._post("queue_timeout")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+
+class ChatStreamErrorTests(TestCase):
+    async def _events(self, error):
+        async def fail(*args, **kwargs):
+            raise error
+            yield  # makes this an async generator
+
+        agent = mock.Mock()
+        agent.astream_chat = fail
+        with mock.patch("companies.views._agent", return_value=agent):
+            response = await self.async_client.post("/chat/stream/", {"message": "hi"}, content_type="application/json")
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        event, data = body.strip().split("\n")
+        return event, json.loads(data.removeprefix("data: "))
+
+    async def test_failure_details_are_logged_not_sent(self):
+        with self.assertLogs("companies.views", "ERROR") as logs:
+            event, data = await self._events(RuntimeError("password=hunter2"))
+        self.assertEqual(event, "event: error")
+        self.assertEqual(data["error"], "Internal server error")
+        self.assertNotIn("hunter2", json.dumps(data))
+        self.assertIn("hunter2", "\n".join(logs.output))
+        self.assertIn(data["trace_id"], logs.output[0])
+
+    async def test_overload_keeps_its_reason(self):
+        event, data = await self._events(LLMOverloaded("queue_full", 7))
+        self.assertEqual(data["retry_after"], 7)
+        self.assertNotEqual(data["error"], "Internal server error")
+
+# ---------------------------------------------------------------------------
+# Telemetry
+# ---------------------------------------------------------------------------
+
+class TelemetryTests(TestCase):
+    def test_metrics_endpoint_allowlist(self):
+        response = self.client.get("/metrics")  # the test client comes from 127.0.0.1
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE chat_request_duration_seconds histogram", response.content.decode())
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9").status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9").status_code, 200)
+
+    def test_trace_collects_route_nodes_tokens_and_queries(self):
+        with telemetry.trace() as trace:
+            with telemetry.trace() as nested:
+                self.assertIs(nested, trace)
+            telemetry.set_route("company_query")
+            telemetry.set_route("general_chat")  # the first route sticks
+            with telemetry.node_span("telemetry_test_node"):
+                telemetry.record_tokens(120, 30)
+                Company.objects.count()
+        self.assertEqual(trace.route, "company_query")
+        self.assertEqual((trace.prompt_tokens, trace.completion_tokens, trace.db_queries), (120, 30, 1))
+        self.assertEqual([node for node, _ in trace.nodes], ["telemetry_test_node"])
+        self.assertIsNone(telemetry.current_trace())
+
+        exposition = telemetry.render_metrics()
+        self.assertIn('chat_llm_tokens_total{node="telemetry_test_node",kind="prompt"} 120', exposition)
+        self.assertIn('chat_node_duration_seconds_count{node="telemetry_test_node"} 1', exposition)
+
+# ---------------------------------------------------------------------------
+# CSV import
+# ---------------------------------------------------------------------------
+
+def _csv_rows(*rows) -> list:
+    return [{"name": name, "description": "", "sector": sector, "financials": financials}
+            for name, sector, financials in rows]
+
+class ImportCompaniesTests(TestCase):
+    def test_upsert_counts(self):
+        Company.objects.create(name="Alpha", description="", sector="Tech", financials={"revenue": "$1B"})
+        Company.objects.create(name="Bravo", description="", sector="Tech", financials={})
+        result = import_companies(_csv_rows(
+            ("Alpha", "Tech", '{"revenue": "$2B"}'),
+            ("Bravo", "Tech", ""),
+            ("Charlie", "Energy", "{'revenue': '3B$'}"),  # Python literal, from older exports
+            ("", "Tech", ""),
+            ("Delta", "Tech", "not a dict"),
+        ), batch_size=2)
+        self.assertEqual(
+            {k: result[k] for k in ("created", "updated", "unchanged", "error_count")},
+            {"created": 1, "updated": 1, "unchanged": 1, "error_count": 2},
+        )
+        self.assertEqual(result["errors"][0], "Row 4: name is required")
+        self.assertEqual(Company.objects.get(name="Alpha").financials, {"revenue": "$2B"})
+        self.assertEqual(Company.objects.get(name="Charlie").financials, {"revenue": "3B$"})
+        self.assertFalse(Company.objects.filter(name="Delta").exists())
+
+    def test_last_occurrence_of_a_name_wins(self):
+        import_companies(_csv_rows(("Alpha", "Tech", ""), ("Alpha", "Energy", "")))
+        self.assertEqual(Company.objects.get(name="Alpha").sector, "Energy")
+
+    def test_only_changed_skips_identical_rows(self):
+        company = Company.objects.create(name="Alpha", description="", sector="Tech", financials={})
+        result = import_companies(_csv_rows(("Alpha", "Tech", "")), only_changed=True)
+        self.assertEqual(result["unchanged"], 1)
+        self.assertEqual(Company.objects.get(name="Alpha").updated_at, company.updated_at)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        rows = _csv_rows(
+            ("x" * 121, "Tech", ""),
+            ("Alpha", "Tech", "[1, 2]"),
+            ("Bravo", "Tech", "__import__('os').getcwd()"),  # never evaluated
+            ("Charlie", "Tech", "{'revenue': "),
+            ("Delta", "Tech", ""),
+        )
+        result = import_companies(rows, max_errors=2)
+        self.assertEqual(result["error_count"], 4)
+        self.assertEqual(result["errors"], [
+            "Row 1: name longer than 120 characters",
+            "Row 2: financials must be an object",
+        ])
+        self.assertEqual(list(Company.objects.values_list("name", flat=True)), ["Delta"])
+
+    def test_progress_after_every_batch(self):
+        progress = mock.Mock()
+        rows = _csv_rows(*((name, "Tech", "") for name in "ABCDE"))
+        import_companies(rows, batch_size=2, progress=progress)
+        self.assertEqual([c.args[0] for c in progress.call_args_list], [2, 4, 5])
+
+    def test_rows_are_decoded_line_by_line(self):
+        lines = ["\ufeffname,description,sector,financials\n", "Zürich Re,Insurer,Finance,\n"]
+        rows = list(iter_csv_rows(line.encode("utf-8") for line in lines))
+        self.assertEqual(rows, [{"name": "Zürich Re", "description": "Insurer", "sector": "Finance", "financials": ""}])
+
+    def test_upload_rejects_bad_requests(self):
+        upload = lambda name: SimpleUploadedFile(name, b"name\nAlpha\n", content_type="text/csv")
+        for data in ({}, {"file": upload("companies.txt")}, {"file": upload("companies.csv"), "batch_size": "ten"}):
+            with self.subTest(data=data):
+                response = self.client.post("/upload-csv/", data)
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImportJob.objects.exists())
+
+class ImportJobRunnerTests(TestCase):
+    """Jobs run in the test thread (``_run``), so they see the test transaction."""
+
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(lambda: os.path.isdir(self.spool) and os.rmdir(self.spool))
+        patcher = mock.patch("companies.jobs.close_old_connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.runner = ImportJobRunner()
+
+    def _job(self, names, **fields) -> ImportJob:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["name", "description", "sector", "financials"])
+        for name in names:
+            writer.writerow([name, "", "Tech", json.dumps({"revenue": "$1B"})])
+        path = os.path.join(self.spool, f"{len(os.listdir(self.spool))}.csv")
+        with open(path, "w", newline="") as f:
+            f.write(buffer.getvalue())
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return ImportJob.objects.create(file_name="companies.csv", path=path, batch_size=2, **fields)
+
+    def _offset_after(self, job, rows: int) -> int:
+        with open(job.path, "rb") as f:
+            return sum(len(f.readline()) for _ in range(rows + 1))
+
+    def _run(self, job):
+        job.refresh_from_db()
+        self.runner._run(job.pk, job.status, job.updated_at)
+        job.refresh_from_db()
+        return job
+
+    def test_runs_to_completion(self):
+        job = self._run(self._job(["A", "B", "C", "D", "E"]))
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual((job.rows_processed, job.created, job.owner), (5, 5, self.runner.owner))
+        self.assertEqual(Company.objects.count(), 5)
+        self.assertFalse(os.path.exists(job.path))
+
+    def test_resumes_a_dead_owners_job_from_its_checkpoint(self):
+        job = self._job(
+            ["A", "B", "C", "D", "E"], status=ImportJob.RUNNING, rows_processed=2, created=2,
+            owner=f"{socket.gethostname()}:999999999:dead0000",
+        )
+        job.offset = self._offset_after(job, 2)
+        job.save()
+        with mock.patch.object(self.runner, "submit") as submit:
+            self.assertEqual(self.runner.resume(), 1)
+        submit.assert_called_once()
+
+        job = self._run(job)
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual((job.rows_processed, job.created), (5, 5))
+        # Rows before the checkpoint are not read again
+        self.assertEqual(sorted(Company.objects.values_list("name", flat=True)), ["C", "D", "E"])
+
+    def test_live_owner_keeps_its_job_until_it_goes_stale(self):
+        job = self._job(["A"], status=ImportJob.RUNNING, owner="elsewhere:1:cafe0000")
+        with mock.patch.object(self.runner, "submit") as submit:
+            self.assertEqual(self.runner.resume(), 0)
+            ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(self.runner.resume(), 1)
+        submit.assert_called_once()
+
+    def test_shutdown_stops_at_the_next_checkpoint(self):
+        job = self._job(["A", "B", "C", "D", "E"], status=ImportJob.RUNNING, owner=self.runner.owner)
+        self.runner._stopping.set()
+        with self.assertRaises(_Interrupted):
+            self.runner._import(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed), (ImportJob.RUNNING, 2))
+        self.assertEqual(job.offset, self._offset_after(job, 2))
+
+        # Another process picks it up from there
+        self.runner = ImportJobRunner()
+        job = self._run(job)
+        self.assertEqual((job.status, job.rows_processed, job.created), (ImportJob.SUCCEEDED, 5, 5))
+
+    def test_failed_import_is_marked_and_its_file_removed(self):
+        job = self._job(["A", "B", "C"])
+        with mock.patch("companies.jobs.import_companies", side_effect=DatabaseError("disk full")), \
+                self.assertLogs("companies.jobs", "ERROR"):
+            job = self._run(job)
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.message, "Error processing CSV: disk full")
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(os.path.exists(job.path))
+
+    def test_workers_start_on_first_submit_and_stop_on_shutdown(self):
+        job = self._job(["A"])
+        self.assertEqual(self.runner._workers, [])
+        started, release = threading.Event(), threading.Event()
+
+        def run(*args):
+            started.set()
+            release.wait(5)
+
+        with mock.patch.object(self.runner, "_run", side_effect=run) as run_job, \
+                mock.patch("companies.jobs.atexit") as exit_hooks:
+            self.runner.submit(job)
+            self.runner.submit(job)
+            self.assertTrue(started.wait(5))
+            exit_hooks.register.assert_called_once_with(self.runner.shutdown)
+            self.assertTrue(all(w.daemon for w in self.runner._workers))
+
+            # A batch still running when the timeout expires doesn't hold up shutdown
+            self.runner.shutdown(timeout=0.1)
+            self.assertTrue(any(w.is_alive() for w in self.runner._workers))
+            release.set()
+            self.runner.shutdown(timeout=5)
+        self.assertFalse(any(w.is_alive() for w in self.runner._workers))
+        run_job.assert_called_once_with(job.pk, job.status, job.updated_at)
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+class BenchHelperTests(TestCase):
+    def test_synthetic_corpus_imports_cleanly(self):
+        names = {bench.company_name(i) for i in range(500)}
+        self.assertEqual(len(names), 500)
+        result = import_companies(iter_csv_rows(bench.csv_lines(0, 50, random.Random(0))))
+        self.assertEqual((result["created"], result["error_count"]), (50, 0))
+        company = Company.objects.get(name=bench.company_name(7))
+        self.assertEqual(set(company.financials), {"revenue", "employees"})
+
+    def test_typo_keeps_the_name_recognizable(self):
+        rng = random.Random(0)
+        name = bench.company_name(3)
+        typo = bench._typo(name, rng)
+        self.assertNotEqual(typo, name)
+        self.assertEqual(sorted(typo), sorted(name))
+        self.assertEqual(typo.split(" ", 1)[1], name.split(" ", 1)[1])
+
+    def test_percentiles_and_measure(self):
+        ordered = list(range(1, 101))
+        self.assertEqual([bench._percentile(ordered, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(bench._percentile([7], 99), 7)
+        calls = []
+        stats = bench.measure(calls.append, [(i,) for i in range(5)])
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+        self.assertEqual(stats["count"], 5)
+        self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now() - timedelta(hours=1)
+        for i, name in enumerate(("Alpha", "Bravo", "Charlie")):
+            company = Company.objects.create(name=name, description="", sector="Tech", financials={"revenue": "$1B"})
+            self._touch(company, minutes=i)
+
+    def _touch(self, company, minutes: int):
+        # updated_at is auto_now; update() sets it without that
+        Company.objects.filter(pk=company.pk).update(updated_at=self.start + timedelta(minutes=minutes))
+
+    def _export(self, **params):
+        response = self.client.get("/export/companies/", {"format": "ndjson", **params})
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content)
+        if params.get("gzip"):
+            body = gzip.decompress(body)
+        names = [json.loads(line)["name"] for line in body.decode().splitlines()]
+        return names, response.get("X-Next-Cursor")
+
+    def test_csv_has_header_and_reimportable_cells(self):
+        response = self.client.get("/export/companies/")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([row["name"] for row in rows], ["Alpha", "Bravo", "Charlie"])
+        self.assertEqual(json.loads(rows[0]["financials"]), {"revenue": "$1B"})
+
+    def test_since_returns_only_later_changes(self):
+        names, cursor = self._export()
+        self.assertEqual(names, ["Alpha", "Bravo", "Charlie"])
+        self.assertEqual(self._export(since=cursor), ([], cursor))
+
+        self._touch(Company.objects.get(name="Alpha"), minutes=10)
+        names, next_cursor = self._export(since=cursor)
+        self.assertEqual(names, ["Alpha"])
+        self.assertNotEqual(next_cursor, cursor)
+
+    def test_rows_inside_the_cursor_lag_wait_for_the_next_export(self):
+        names, cursor = self._export()
+        Company.objects.create(name="Delta", description="", sector="Tech", financials={})
+        self.assertEqual(self._export(since=cursor), ([], cursor))
+        with self.settings(EXPORT_CURSOR_LAG=0):
+            self.assertEqual(self._export(since=cursor)[0], ["Delta"])
+
+    def test_gzip_and_filters(self):
+        self._touch(Company.objects.get(name="Bravo"), minutes=30)
+        names, _ = self._export(gzip="1", start=(self.start + timedelta(minutes=1)).isoformat())
+        self.assertEqual(names, ["Charlie", "Bravo"])
+
+    def test_bad_params_are_400(self):
+        for params in ({"format": "xml"}, {"since": "nonsense"}, {"start": "yesterday"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/export/companies/", params).status_code, 400)
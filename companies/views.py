@@ -1,22 +1,135 @@
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import viewsets
-from .models import Company, ChatHistory
-from .serializers import CompanySerializer
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from agent.admission import LLMOverloaded
+from .models import Company, ChatHistory, ImportJob
+from . import telemetry
+from .export import COMPANY_FIELDS, HISTORY_FIELDS, export_response
+from .history import history_writer
+from .jobs import import_jobs
+from .metrics import normalize_metric_name
+from .pagination import CompanyCursorPagination, encode_cursor, keyset_page
+from .search import search_companies, search_filter, sector_facets
+from .serializers import CompanySerializer, requested_fields
+from .signals import company_data_last_modified, company_data_version
+import hashlib
+import json
+import logging
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 # companies/views.py
 class CompanyViewSet(viewsets.ModelViewSet):
+    """Companies REST API.
+
+    GET filters: ``q`` (name/description search), ``sector``, ``name_prefix``, and numeric ranges on
+    parsed financials as ``financials__<key>__<gte|gt|lte|lt>=<number>``. Lists are
+    cursor-paginated, ``fields=`` selects a sparse fieldset, and GETs carry
+    an ETag / Last-Modified derived from the Company data version so
+    unchanged data is answered with 304.
+    """
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
+    pagination_class = CompanyCursorPagination
     authentication_classes = []
     permission_classes = []
 
+    FINANCIAL_FILTER = re.compile(r"^financials__(\w+)__(gte|gt|lte|lt)$")
 
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from agent.langgraph_agent import run_chat
-import uuid
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != "GET":
+            return queryset
+        params = self.request.query_params
+
+        queryset = search_filter(queryset, params.get("q"))
+        if params.get("sector"):
+            queryset = queryset.filter(sector=params["sector"])
+        if params.get("name_prefix"):
+            queryset = queryset.filter(name__istartswith=params["name_prefix"])
+        # Ranges are answered from the normalized CompanyMetric table, so
+        # values like "5B$" compare as 5e9; one join per metric
+        ranges = {}
+        for param, value in params.items():
+            match = self.FINANCIAL_FILTER.match(param)
+            if not match:
+                continue
+            try:
+                number = float(value)
+            except ValueError:
+                raise ValidationError({param: "Must be a number."})
+            key, op = match.groups()
+            ranges.setdefault(normalize_metric_name(key), {})[f"metrics__value__{op}"] = number
+        for metric, bounds in ranges.items():
+            queryset = queryset.filter(metrics__metric=metric, **bounds)
+
+        wanted = requested_fields(self.request)
+        if wanted:
+            # Only load requested columns (plus what pagination and lookups need)
+            model_fields = {f.name for f in Company._meta.concrete_fields}
+            queryset = queryset.only(*((wanted & model_fields) | {"id", "name"}))
+        return queryset
+
+    def _conditional(self, request, handler, *args, **kwargs):
+        version = company_data_version()
+        etag = quote_etag(hashlib.md5(f"{version}:{request.get_full_path()}".encode()).hexdigest())
+        last_modified = int(company_data_last_modified())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Ranked full-text search: ``?q=...&limit=20`` (max 100), supports ``fields=``."""
+        q = request.query_params.get("q", "").strip()
+        if not q:
+            raise ValidationError({"q": "This parameter is required."})
+        try:
+            limit = min(max(int(request.query_params.get("limit") or 20), 1), 100)
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+
+        companies = search_companies(q, limit)
+        serializer = self.get_serializer(companies, many=True)
+        results = [
+            {**data, "rank": company.rank} for data, company in zip(serializer.data, companies)
+        ]
+        return Response({"query": q, "results": results})
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """Per-sector counts, optionally within the ``q`` search."""
+        return self._conditional(request, lambda r: Response({"sectors": sector_facets(r.query_params.get("q"))}))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, super().retrieve, *args, **kwargs)
+
+
+def _agent():
+    # Imported on first use: loading LangChain/LangGraph is slow, and
+    # management commands and migrations never need it
+    from agent import langgraph_agent
+    return langgraph_agent
 
 # Web Interface Views
 def chat_interface(request):
@@ -24,12 +137,12 @@ def chat_interface(request):
     return render(request, 'chat.html')
 
 def companies_interface(request):
-    """Companies list interface"""
-    companies = Company.objects.all()
-    sectors = Company.objects.values_list('sector', flat=True).distinct()
+    """Companies list interface (companies are fetched page by page from the API)"""
+    facets = sector_facets()
     return render(request, 'companies.html', {
-        'companies': companies,
-        'sectors': sectors
+        'facets': facets,
+        'total': sum(f['count'] for f in facets),
+        'page_size': 30
     })
 
 def upload_interface(request):
@@ -37,41 +150,190 @@ def upload_interface(request):
     return render(request, 'upload.html')
 
 def history_interface(request):
-    """Chat history interface"""
-    recent_chats = ChatHistory.objects.all()[:50]
+    """Chat history interface (pages are fetched from /chat-history/ as you scroll)"""
     return render(request, 'history.html', {
-        'chats': recent_chats
+        'page_size': 50
     })
 
 # API Endpoints
+SESSION_ID_MAX_LENGTH = ChatHistory._meta.get_field("session_id").max_length
+
+def _chat_payload(request):
+    """Return ``(message, session_id)`` from a JSON or form-encoded body.
+
+    *session_id* is ``None`` when the client sent none: the turn is then
+    answered without session memory. Raises ``ValueError`` when the body is
+    not an object, ``message`` is not a non-empty string or ``session_id``
+    is not a string.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        data = request.POST
+    if not isinstance(data, dict):
+        raise ValueError("Body must be a JSON object")
+    message = data.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError("message must be a non-empty string")
+    session_id = data.get("session_id")
+    if session_id is not None and not isinstance(session_id, str):
+        raise ValueError("session_id must be a string")
+    if session_id and len(session_id) > SESSION_ID_MAX_LENGTH:
+        raise ValueError(f"session_id longer than {SESSION_ID_MAX_LENGTH} characters")
+    return message, session_id or None
+
+def _overloaded(exc: LLMOverloaded):
+    """429 when the LLM call queue is full, 503 when its deadline passed; both with Retry-After."""
+    response = JsonResponse(
+        {"error": str(exc), "retry_after": exc.retry_after},
+        status=429 if exc.reason == "queue_full" else 503,
+    )
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
 @csrf_exempt
-@api_view(["POST"])
-def chat(request):
-    user_msg = request.data.get("message", "")
-    session_id = request.data.get("session_id", str(uuid.uuid4()))
-    
-    # Get bot response
-    answer = run_chat(user_msg)
+@require_POST
+async def chat(request):
+    """Async chat endpoint: the graph runs with ``ainvoke`` so no worker
+    thread is held while waiting on the LLM (serve with ASGI to benefit).
+
+    When the LLM calls can't be admitted (see :mod:`agent.admission`) the
+    request fails fast with 429/503 and a Retry-After header.
+    """
+    try:
+        user_msg, session_id = _chat_payload(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    # Stateless turns still get an id, to group their history row
+    history_session = session_id or str(uuid.uuid4())
     
-    # Save to chat history
-    ChatHistory.objects.create(
-        user_message=user_msg,
-        bot_response=answer,
-        session_id=session_id
-    )
+    with telemetry.trace() as trace:
+        # Get bot response
+        try:
+            answer = await _agent().arun_chat(user_msg, session_id=session_id)
+        except LLMOverloaded as e:
+            telemetry.set_route("overloaded")
+            return _overloaded(e)
+        
+        # Save to chat history (write-behind)
+        await history_writer.arecord(
+            user_message=user_msg,
+            bot_response=answer,
+            session_id=history_session,
+            trace_id=trace.id
+        )
     
-    return Response({
+    response = JsonResponse({
         "answer": answer,
-        "session_id": session_id
+        "session_id": history_session,
+        "trace_id": trace.id
+    })
+    response["X-Trace-Id"] = trace.id
+    return response
+
+@csrf_exempt
+@require_POST
+async def chat_batch(request):
+    """Answer a list of messages in one call.
+
+    Body: ``{"messages": [...], "session_id": ..., "max_concurrency": n}``.
+    Results come back in input order, each with its own ``error``; all
+    successful answers are queued for the history writer at once.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Body must be JSON"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Body must be a JSON object"}, status=400)
+    messages = data.get("messages")
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return JsonResponse({"error": "messages must be a list of strings"}, status=400)
+    if len(messages) > settings.CHAT_BATCH_MAX_MESSAGES:
+        return JsonResponse(
+            {"error": f"At most {settings.CHAT_BATCH_MAX_MESSAGES} messages per batch"}, status=400
+        )
+    try:
+        max_concurrency = min(
+            int(data.get("max_concurrency") or settings.CHAT_BATCH_MAX_CONCURRENCY),
+            settings.CHAT_BATCH_MAX_CONCURRENCY,
+        )
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "max_concurrency must be an integer"}, status=400)
+    session_id = data.get("session_id") or str(uuid.uuid4())
+
+    with telemetry.trace() as trace:
+        results = await _agent().arun_chat_batch(messages, max_concurrency=max(max_concurrency, 1))
+
+        await history_writer.arecord_many([
+            ChatHistory(
+                user_message=message, bot_response=result["answer"],
+                session_id=session_id, trace_id=trace.id,
+            )
+            for message, result in zip(messages, results)
+            if result["error"] is None
+        ])
+
+    response = JsonResponse({
+        "results": [
+            {"message": message, **result} for message, result in zip(messages, results)
+        ],
+        "session_id": session_id,
+        "trace_id": trace.id
     })
+    response["X-Trace-Id"] = trace.id
+    return response
+
+@csrf_exempt
+@require_POST
+async def chat_stream(request):
+    """Streaming chat endpoint (Server-Sent Events).
+
+    Sends the router decision, node progress and answer tokens as they are
+    produced; the history row is written once the answer is complete.
+    """
+    try:
+        user_msg, session_id = _chat_payload(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    history_session = session_id or str(uuid.uuid4())
+
+    async def events():
+        with telemetry.trace() as trace:
+            try:
+                async for event, data in _agent().astream_chat(user_msg, session_id=session_id):
+                    if event == "done":
+                        await history_writer.arecord(
+                            user_message=user_msg,
+                            bot_response=data["answer"],
+                            session_id=history_session,
+                            trace_id=trace.id
+                        )
+                        data = {**data, "session_id": history_session, "trace_id": trace.id}
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            except LLMOverloaded as e:
+                telemetry.set_route("overloaded")
+                yield f"event: error\ndata: {json.dumps({'error': str(e), 'retry_after': e.retry_after})}\n\n"
+            except Exception:
+                # The details go to the log, like an unhandled error in /chat/ (a 500)
+                logger.exception("Chat stream failed (trace %s)", trace.id)
+                yield f"event: error\ndata: {json.dumps({'error': 'Internal server error', 'trace_id': trace.id})}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
 
 @csrf_exempt
 @api_view(["POST"])
 def upload_companies_csv(request):
-    """Upload companies from CSV file"""
-    import csv
-    import io
-    
+    """Upload companies from CSV file
+
+    The file is spooled to disk and imported by a background worker (see
+    :mod:`companies.jobs`); the response (202) carries the job id and the
+    URL to poll for progress. Optional form fields: ``batch_size`` and
+    ``only_changed`` (skip rows that are unchanged).
+    """
     if 'file' not in request.FILES:
         return Response({"error": "No file provided"}, status=400)
     
@@ -81,55 +343,146 @@ def upload_companies_csv(request):
         return Response({"error": "File must be CSV format"}, status=400)
     
     try:
-        # Read CSV file
-        decoded_file = csv_file.read().decode('utf-8')
-        csv_data = csv.DictReader(io.StringIO(decoded_file))
-        
-        created_count = 0
-        errors = []
-        
-        for row in csv_data:
-            try:
-                # Expected CSV columns: name, description, sector, financials
-                company, created = Company.objects.get_or_create(
-                    name=row.get('name', '').strip(),
-                    defaults={
-                        'description': row.get('description', ''),
-                        'sector': row.get('sector', ''),
-                        'financials': eval(row.get('financials', '{}')) if row.get('financials') else {}
-                    }
-                )
-                if created:
-                    created_count += 1
-            except Exception as e:
-                errors.append(f"Row {row}: {str(e)}")
-        
-        return Response({
-            "message": f"Successfully imported {created_count} companies",
-            "errors": errors if errors else None
-        })
-        
-    except Exception as e:
-        return Response({"error": f"Error processing CSV: {str(e)}"}, status=400)
+        batch_size = int(request.data.get('batch_size') or settings.CSV_IMPORT_BATCH_SIZE)
+    except ValueError:
+        return Response({"error": "batch_size must be an integer"}, status=400)
+    only_changed = str(request.data.get('only_changed', '')).lower() in ('1', 'true', 'yes', 'on')
+    
+    import_jobs.ensure_resumed()
+    # Expected CSV columns: name, description, sector, financials
+    job = import_jobs.spool(csv_file, batch_size=max(batch_size, 1), only_changed=only_changed)
+    return Response({
+        "message": f"Import of {job.file_name} queued",
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": reverse("upload-csv-job", args=[job.id]),
+    }, status=202)
+
+@api_view(["GET"])
+def import_job_status(request, job_id):
+    """Progress of a CSV import job: rows processed, rows per second, counts and errors."""
+    import_jobs.ensure_resumed()
+    job = ImportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return Response({"error": "Unknown import job"}, status=404)
+    done = job.status in (ImportJob.SUCCEEDED, ImportJob.FAILED)
+    return Response({
+        "job_id": str(job.id),
+        "file_name": job.file_name,
+        "status": job.status,
+        "done": done,
+        "bytes_total": job.size,
+        "bytes_processed": job.size if job.status == ImportJob.SUCCEEDED else job.offset,
+        "percent": 100.0 if job.status == ImportJob.SUCCEEDED else (
+            round(100 * job.offset / job.size, 1) if job.size else 0.0
+        ),
+        "rows_processed": job.rows_processed,
+        "rows_per_second": job.rows_per_second,
+        "created": job.created,
+        "updated": job.updated,
+        "unchanged": job.unchanged,
+        "error_count": job.error_count,
+        "errors": job.errors or None,
+        "message": job.message,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    })
 
 @api_view(["GET"])
 def chat_history(request):
-    """Get recent chat history"""
+    """Get chat history, newest first, one keyset page at a time
+
+    Query params: ``session_id``, ``page_size`` (capped), and an opaque
+    cursor from a previous response: ``before`` for older rows or ``after``
+    for newer ones.
+
+    Rows are stamped when queued but get their id when the write-behind
+    buffer flushes, so an ``after`` poll could move its cursor past a row
+    that is still buffered and never see it. This process's buffer is
+    flushed before answering ``after``; rows buffered by other workers are
+    written within ``CHAT_HISTORY_FLUSH_INTERVAL`` and can still be missed
+    by a poll in that window (set ``CHAT_HISTORY_WRITE_BEHIND=false`` when
+    polling must see every row).
+    """
     session_id = request.GET.get('session_id')
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if before and after:
+        return Response({"error": "Use either 'before' or 'after', not both"}, status=400)
+    try:
+        page_size = int(request.GET.get('page_size') or 20)
+    except ValueError:
+        return Response({"error": "page_size must be an integer"}, status=400)
+    page_size = min(max(page_size, 1), settings.CHAT_HISTORY_MAX_PAGE_SIZE)
+    if after:
+        history_writer.flush()
     
+    chats = ChatHistory.objects.all()
     if session_id:
-        chats = ChatHistory.objects.filter(session_id=session_id)[:20]
-    else:
-        chats = ChatHistory.objects.all()[:20]
+        chats = chats.filter(session_id=session_id)
+    try:
+        rows, has_more = keyset_page(chats, before=before, after=after, page_size=page_size)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     
     chat_data = [
         {
+            "id": chat.id,
             "user_message": chat.user_message,
             "bot_response": chat.bot_response,
             "timestamp": chat.timestamp,
-            "session_id": chat.session_id
+            "session_id": chat.session_id,
+            "trace_id": chat.trace_id
         }
-        for chat in chats
+        for chat in rows
     ]
     
-    return Response({"chats": chat_data})
\ No newline at end of file
+    # next_cursor pages to older rows (pass as `before`), prev_cursor to newer ones (`after`)
+    older_exist = has_more if not after else bool(rows)
+    return Response({
+        "chats": chat_data,
+        "next_cursor": encode_cursor(rows[-1]) if rows and older_exist else None,
+        "prev_cursor": encode_cursor(rows[0]) if rows else after,
+    })
+
+
+@require_GET
+def export_companies(request):
+    """Stream all companies as CSV or NDJSON in ``updated_at`` order
+
+    Accepts ``sector`` plus the export params of
+    :func:`companies.export.export_response`; ``since`` makes it an
+    incremental export of the companies created or changed after a
+    previous one.
+    """
+    companies = Company.objects.all()
+    if request.GET.get('sector'):
+        companies = companies.filter(sector=request.GET['sector'])
+    try:
+        return export_response(request, companies, COMPANY_FIELDS, order_field="updated_at", name="companies")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+@require_GET
+def export_chat_history(request):
+    """Stream chat history as CSV or NDJSON, oldest first
+
+    Accepts ``session_id`` plus the export params of
+    :func:`companies.export.export_response` (``start``/``end`` bound the
+    timestamp, ``since`` continues after a previous export).
+    """
+    chats = ChatHistory.objects.all()
+    if request.GET.get('session_id'):
+        chats = chats.filter(session_id=request.GET['session_id'])
+    try:
+        return export_response(request, chats, HISTORY_FIELDS, order_field="timestamp", name="chat-history")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+def metrics(request):
+    """Prometheus text exposition of this process's chat metrics."""
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed and request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(telemetry.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
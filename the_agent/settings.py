@@ -21,6 +21,105 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+# LLM used by the agent: "" (OpenAI if OPENAI_API_KEY is set, else a canned fake), "simulated",
+# "record" (that model, answers saved to LLM_CASSETTE_PATH) or "replay" (answers served from it)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "")
+# "simulated" backend: seconds before the answer, answer tokens/sec (0 = instant), router answers (cycled)
+LLM_SIMULATED_LATENCY = float(os.getenv("LLM_SIMULATED_LATENCY", "0.05"))
+LLM_SIMULATED_TOKENS_PER_SECOND = float(os.getenv("LLM_SIMULATED_TOKENS_PER_SECOND", "0"))
+LLM_SIMULATED_ROUTES = os.getenv("LLM_SIMULATED_ROUTES", "general_query").split(",")
+# "record"/"replay" backends: append-only JSON-lines cassette of prompts and answers
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", str(BASE_DIR / "llm_cassette.jsonl"))
+
+# Shared keep-alive HTTP pool for LLM calls (agent.llm_factory)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))
+
+# Outbound LLM calls (agent.admission): calls in flight at once (0 = unlimited), calls allowed to
+# queue for a slot, seconds a call may queue before the request is refused (429/503), and whether
+# identical concurrent prompts share one call
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() in ("1", "true", "yes")
+
+# Client IPs allowed to scrape /metrics (empty = anyone)
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip]
+
+# Build the agent (LLM, graph, in-memory indexes) when a WSGI/ASGI worker starts
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Number of retrieved companies passed to the LLM by the chat node
+CHAT_CONTEXT_TOP_K = int(os.getenv("CHAT_CONTEXT_TOP_K", "8"))
+
+# Start the company lookup alongside the LLM router instead of after it
+CHAT_SPECULATIVE_LOOKUP = os.getenv("CHAT_SPECULATIVE_LOOKUP", "true").lower() in ("1", "true", "yes")
+
+# Log a warning once the serialized company corpus (agent.snapshot) grows past this many tokens (0 = off)
+CHAT_SNAPSHOT_TOKEN_WARNING = int(os.getenv("CHAT_SNAPSHOT_TOKEN_WARNING", "100000"))
+
+# Per-session conversation memory (agent.memory): LangGraph SQLite checkpoint file ("" = off),
+# recent messages kept verbatim (older ones are folded into a rolling summary of at most
+# SUMMARY_WORDS words), idle seconds before a session is deleted, and seconds between sweeps
+CHAT_MEMORY_PATH = os.getenv("CHAT_MEMORY_PATH", str(BASE_DIR / "chat_memory.sqlite3"))
+CHAT_MEMORY_WINDOW = int(os.getenv("CHAT_MEMORY_WINDOW", "6"))
+CHAT_MEMORY_SUMMARY_WORDS = int(os.getenv("CHAT_MEMORY_SUMMARY_WORDS", "150"))
+CHAT_MEMORY_TTL = int(os.getenv("CHAT_MEMORY_TTL", str(7 * 24 * 3600)))
+CHAT_MEMORY_SWEEP_INTERVAL = int(os.getenv("CHAT_MEMORY_SWEEP_INTERVAL", "3600"))
+
+# Django cache behind the answer cache, the sector facets and the Company data version (ETags).
+# Every worker must share it, or a write seen by one worker leaves stale answers and false 304s
+# in the others: the default is a table in the database (see the companies.W001 check)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache")
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.getenv("CACHE_LOCATION", "django_cache"),
+    }
+}
+if CACHE_BACKEND.endswith("DatabaseCache"):
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "10000"))}
+
+# Answer cache for run_chat: per-route TTL in seconds (None = until Company data changes, 0 = off)
+CHAT_CACHE_TTLS = {
+    "company_query": None,
+    "aggregate_query": None,
+    "general_query": int(os.getenv("CHAT_CACHE_GENERAL_TTL", "3600")),
+}
+CHAT_CACHE_LOCAL_SIZE = int(os.getenv("CHAT_CACHE_LOCAL_SIZE", "1024"))
+
+# /chat/batch/: graph runs in flight at once, and messages accepted per request
+CHAT_BATCH_MAX_CONCURRENCY = int(os.getenv("CHAT_BATCH_MAX_CONCURRENCY", "8"))
+CHAT_BATCH_MAX_MESSAGES = int(os.getenv("CHAT_BATCH_MAX_MESSAGES", "500"))
+
+# ChatHistory write-behind: rows are buffered and bulk-inserted by a background
+# thread every FLUSH_INTERVAL seconds or FLUSH_SIZE rows (False = write inline)
+CHAT_HISTORY_WRITE_BEHIND = os.getenv("CHAT_HISTORY_WRITE_BEHIND", "true").lower() == "true"
+CHAT_HISTORY_FLUSH_SIZE = int(os.getenv("CHAT_HISTORY_FLUSH_SIZE", "100"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "1.0"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "100"))
+
+# /api/companies/ cursor pagination cap
+COMPANY_API_MAX_PAGE_SIZE = int(os.getenv("COMPANY_API_MAX_PAGE_SIZE", "500"))
+
+# Rows per bulk upsert when importing companies from CSV
+CSV_IMPORT_BATCH_SIZE = int(os.getenv("CSV_IMPORT_BATCH_SIZE", "1000"))
+# Background CSV imports (companies.jobs): where uploads are spooled, worker threads per process,
+# seconds between heartbeats of running jobs (and re-scans for interrupted ones), seconds
+# without a heartbeat after which a running job owned by another host is resumed, and seconds
+# shutdown waits for running imports to finish their current batch
+CSV_IMPORT_SPOOL_DIR = os.getenv("CSV_IMPORT_SPOOL_DIR", str(BASE_DIR / "csv_imports"))
+CSV_IMPORT_WORKERS = int(os.getenv("CSV_IMPORT_WORKERS", "2"))
+CSV_IMPORT_HEARTBEAT_SECONDS = int(os.getenv("CSV_IMPORT_HEARTBEAT_SECONDS", "15"))
+CSV_IMPORT_STALE_SECONDS = int(os.getenv("CSV_IMPORT_STALE_SECONDS", "60"))
+CSV_IMPORT_SHUTDOWN_TIMEOUT = float(os.getenv("CSV_IMPORT_SHUTDOWN_TIMEOUT", "10"))
+
+# /export/ endpoints: rows fetched from the database per chunk, and seconds the end of an export
+# stays behind now, so rows stamped but not committed yet (write-behind history) go to the next one
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+EXPORT_CURSOR_LAG = int(os.getenv("EXPORT_CURSOR_LAG", "5"))
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
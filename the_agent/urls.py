@@ -19,7 +19,8 @@ from django.urls import path
 from django.urls import include
 from rest_framework.routers import DefaultRouter
 from companies.views import (
-    CompanyViewSet, chat, upload_companies_csv, chat_history,
+    CompanyViewSet, chat, chat_batch, chat_stream, upload_companies_csv, import_job_status,
+    chat_history, export_companies, export_chat_history, metrics,
     chat_interface, companies_interface, upload_interface, history_interface
 )
 
@@ -37,8 +38,14 @@ urlpatterns = [
     
     # API Endpoints
     path('chat/', chat, name='chat-api'),
+    path('chat/stream/', chat_stream, name='chat-stream'),
+    path('chat/batch/', chat_batch, name='chat-batch'),
     path('upload-csv/', upload_companies_csv, name='upload-csv'),
+    path('upload-csv/<uuid:job_id>/', import_job_status, name='upload-csv-job'),
     path('chat-history/', chat_history, name='chat-history'),
+    path('export/companies/', export_companies, name='export-companies'),
+    path('export/chat-history/', export_chat_history, name='export-chat-history'),
+    path('metrics', metrics, name='metrics'),
     
     # REST API
     path("api/", include(router.urls)),
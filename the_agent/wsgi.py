@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'the_agent.settings')
 
 application = get_wsgi_application()
+
+# Pre-build the agent so the first request doesn't pay for it (AGENT_WARMUP=true)
+from django.conf import settings  # noqa: E402
+
+if settings.AGENT_WARMUP:
+    from agent.langgraph_agent import warmup_agent  # noqa: E402
+    warmup_agent()